@@ -0,0 +1,141 @@
+"""
+Controle de admissão das consultas de histórico (GET .../read) ao InfluxDB.
+
+Cada leitura rodava na hora, sem limite de concorrência: uma rajada de
+consultas brutas de 30 dias saturava o InfluxDB e atrasava as escritas do
+ingestor e as consultas baratas dos dashboards. Aqui cada consulta ganha um
+custo estimado e entra numa classe com vagas próprias:
+
+- custo = horas lidas (start até agora) x fator da agregação. Sem ?every= o
+  fator é 1. Com ?every= a média por janela roda no storage (pushdown), então
+  o fator é o intervalo típico entre amostras / every, com piso de 10% para a
+  leitura dos blocos. Um start que não dá para interpretar ('-1h30m',
+  'now()' etc.) vira 'heavy'.
+- 'light' até limite_leve, 'medium' até limite_medio, 'heavy' acima. Cada
+  classe tem o seu semáforo: consultas pesadas só disputam as vagas pesadas
+  e nunca ocupam as leves.
+- Sem vaga em 'espera' segundos, a consulta é recusada (SemVaga -> 429 com
+  Retry-After pela duração média das consultas da classe) em vez de
+  empilhar threads.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from timerange import parse_duracao, parse_instante
+
+LEVE = 'light'
+MEDIA = 'medium'
+PESADA = 'heavy'
+CLASSES = (LEVE, MEDIA, PESADA)
+
+INTERVALO_AMOSTRA = 10.0  # s entre amostras de um sensor (ordem de grandeza do firmware)
+FATOR_MINIMO_AGREGADO = 0.1
+
+
+class SemVaga(Exception):
+    """Nenhuma vaga da classe liberou dentro do tempo de espera."""
+
+    def __init__(self, classe, retry_after):
+        super().__init__(f"sem vaga para consultas '{classe}'")
+        self.classe = classe
+        self.retry_after = retry_after
+
+
+def parse_vagas(texto, padrao):
+    """'light=8,medium=3,heavy=1' -> {'light': 8, ...} (classes omitidas ficam com o padrão)."""
+    vagas = dict(padrao)
+    for item in (texto or '').split(','):
+        if not item.strip():
+            continue
+        classe, _, n = item.partition('=')
+        classe = classe.strip()
+        if classe not in CLASSES:
+            raise ValueError(f"Classe de consulta inválida: {classe!r} (use {', '.join(CLASSES)})")
+        vagas[classe] = int(n)
+        if vagas[classe] < 1:
+            raise ValueError(f"A classe {classe!r} precisa de pelo menos 1 vaga")
+    return vagas
+
+
+def estimar_custo(start, every=None, agora=None):
+    """Horas equivalentes de leitura bruta, ou None se 'start' não puder ser interpretado."""
+    agora = agora or datetime.now(timezone.utc)
+    try:
+        horas = max(0.0, (agora - parse_instante(start, agora)).total_seconds() / 3600)
+    except ValueError:
+        return None
+    if every:
+        try:
+            janela = parse_duracao(every).total_seconds()
+        except ValueError:
+            return horas  # janela desconhecida ('1mo'): conta como leitura bruta
+        horas *= min(1.0, max(FATOR_MINIMO_AGREGADO, INTERVALO_AMOSTRA / janela))
+    return horas
+
+
+class _Classe:
+    __slots__ = ('vagas', 'semaforo', 'ocupadas', 'admitidas', 'recusadas', 'duracao_media')
+
+    def __init__(self, vagas):
+        self.vagas = vagas
+        self.semaforo = threading.BoundedSemaphore(vagas)
+        self.ocupadas = 0
+        self.admitidas = 0
+        self.recusadas = 0
+        self.duracao_media = None
+
+
+class Admissao:
+    def __init__(self, vagas, espera=5.0, limite_leve=6.0, limite_medio=72.0):
+        self.espera = espera
+        self.limite_leve = limite_leve
+        self.limite_medio = limite_medio
+        self._classes = {classe: _Classe(vagas[classe]) for classe in CLASSES}
+        self._lock = threading.Lock()
+
+    def classificar(self, custo):
+        if custo is None or custo > self.limite_medio:
+            return PESADA
+        return LEVE if custo <= self.limite_leve else MEDIA
+
+    def _retry_after(self, c):
+        """Segundos até uma vaga provavelmente liberar: a duração média das consultas da classe."""
+        return max(1, math.ceil(c.duracao_media or self.espera))
+
+    @contextmanager
+    def admitir(self, classe):
+        """Ocupa uma vaga da classe enquanto a consulta roda; levanta SemVaga se a espera estourar."""
+        c = self._classes[classe]
+        if not c.semaforo.acquire(timeout=self.espera):
+            with self._lock:
+                c.recusadas += 1
+            raise SemVaga(classe, self._retry_after(c))
+        with self._lock:
+            c.ocupadas += 1
+            c.admitidas += 1
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            duracao = time.monotonic() - inicio
+            with self._lock:
+                c.ocupadas -= 1
+                c.duracao_media = duracao if c.duracao_media is None else 0.8 * c.duracao_media + 0.2 * duracao
+            c.semaforo.release()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                classe: {
+                    "slots": c.vagas,
+                    "in_use": c.ocupadas,
+                    "admitted": c.admitidas,
+                    "rejected": c.recusadas,
+                    "avg_seconds": round(c.duracao_media, 3) if c.duracao_media is not None else None,
+                }
+                for classe, c in self._classes.items()
+            }
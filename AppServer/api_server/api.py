@@ -1,6 +1,7 @@
 import os
+import logging
 from threading import Lock
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 import paho.mqtt.client as mqtt
 from influxdb_client import InfluxDBClient
@@ -8,7 +9,25 @@ from influxdb_client.client.write_api import SYNCHRONOUS
 import json
 import threading
 import time
+import uuid
+import zlib
+from collections import deque
+from datetime import timedelta
 import requests
+import urllib3
+
+from iotlog import setup_logging, lazy_trunc
+import influx_schema
+import admission
+import devicestate
+import downsample
+import export
+import jobs
+import presence
+
+log = setup_logging('api')
+# Categoria do callback MQTT (caminho quente, amostrável via LOG_SAMPLE / LOG_LEVELS)
+log_mqtt = logging.getLogger('api.mqtt')
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -20,19 +39,60 @@ INFLUXDB_ORG = os.getenv('INFLUXDB_ORG')
 INFLUXDB_BUCKET = os.getenv('INFLUXDB_BUCKET', 'sensores') # Valor padrão 'sensores'
 INFLUXDB_HEADER = {'Authorization':f'Token {INFLUXDB_TOKEN}'}
 ENDPOINT_NAME = os.getenv('ENDPOINT_NAME')
+# Layout dos dados no InfluxDB (deve ser o mesmo do ingestor): 'sensor' (legado) ou 'tipo'
+INFLUX_SCHEMA = influx_schema.schema_configurado()
 MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST')
 MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT'))
 MQTT_TOPIC = "callback/#" 
 
+# --- Admissão das leituras de histórico (ver admission.py) ---
+# Vagas por classe de custo ('light=8,medium=3,heavy=1'), espera máxima por uma vaga antes do 429,
+# limites de custo (horas equivalentes de leitura bruta) entre as classes e timeout de cada consulta.
+QUERY_SLOTS = admission.parse_vagas(os.getenv('QUERY_SLOTS'), {'light': 8, 'medium': 3, 'heavy': 1})
+QUERY_QUEUE_TIMEOUT = float(os.getenv('QUERY_QUEUE_TIMEOUT', '5'))
+QUERY_LIGHT_MAX_COST = float(os.getenv('QUERY_LIGHT_MAX_COST', '6'))
+QUERY_MEDIUM_MAX_COST = float(os.getenv('QUERY_MEDIUM_MAX_COST', '72'))
+QUERY_TIMEOUT = float(os.getenv('QUERY_TIMEOUT', '30'))
+admissao = admission.Admissao(QUERY_SLOTS, QUERY_QUEUE_TIMEOUT, QUERY_LIGHT_MAX_COST, QUERY_MEDIUM_MAX_COST)
+
 # --- Cache for storing ESP32 responses ---
 # Structure: { "device_id": { "sensors": {...}, "wifi": {...}, "timestamp": ... } }
-config_cache = {}
+# Limitado (ver devicestate.py): no máximo CONFIG_CACHE_MAX_DEVICES dispositivos (LRU) e sem
+# respostas de dispositivos que não respondem há CONFIG_CACHE_IDLE_EVICT s (0 desativa cada limite).
+CONFIG_CACHE_MAX_DEVICES = int(os.getenv('CONFIG_CACHE_MAX_DEVICES', '5000'))
+CONFIG_CACHE_IDLE_EVICT = float(os.getenv('CONFIG_CACHE_IDLE_EVICT', '3600'))
+config_cache = devicestate.CacheDeDispositivos(CONFIG_CACHE_MAX_DEVICES, CONFIG_CACHE_IDLE_EVICT)
 config_cache_lock = threading.Lock()
+# Notificada a cada resposta de dispositivo guardada (o fan-out de frota espera nela)
+config_cache_cond = threading.Condition(config_cache_lock)
+
+# --- Presença dos dispositivos (ver presence.py) ---
+# Dispositivo sem tráfego há PRESENCE_OFFLINE_AFTER s (heartbeat do firmware: 10 s) ou com LWT
+# 'offline' é recusado na hora (503); timeouts dos demais se adaptam ao RTT observado.
+PRESENCE_OFFLINE_AFTER = float(os.getenv('PRESENCE_OFFLINE_AFTER', '35'))
+PRESENCE_MIN_TIMEOUT = float(os.getenv('PRESENCE_MIN_TIMEOUT', '1'))
+PRESENCE_TRACK_DATA = os.getenv('PRESENCE_TRACK_DATA', '1') == '1'  # assina +/sensors/+/data só para presença
+# Qualquer id publicado em +/sensors/+/data ganha um registro: mesmo limite por LRU/inatividade
+PRESENCE_MAX_DEVICES = int(os.getenv('PRESENCE_MAX_DEVICES', '20000'))
+PRESENCE_IDLE_EVICT = float(os.getenv('PRESENCE_IDLE_EVICT', str(7 * 24 * 3600)))
+presenca = presence.RegistroDePresenca(PRESENCE_OFFLINE_AFTER, PRESENCE_MIN_TIMEOUT,
+                                       PRESENCE_MAX_DEVICES, PRESENCE_IDLE_EVICT)
 
-# --- Cache for storing rules responses ---
-# Structure: { "rules": {...}, "timestamp": ... }
+# --- Snapshot de regras ---
+# O ingestor publica (retido) em callback/rules um snapshot versionado a cada
+# mudança; a API guarda os bytes como vieram e serve direto da memória.
+# Structure: { "rules": {"body": bytes, "version": int|None, "etag": str, "timestamp": ...} }
 rules_cache = {}
 rules_cache_lock = threading.Lock()
+rules_cache_event = threading.Event()  # sinaliza a chegada de um snapshot
+
+# --- Lotes de regras (POST /rules/bulk) ---
+# O ingestor responde cada lote em callback/rules/bulk/<id_lote>.
+# Structure: { id_lote: {"event": Event, "result": dict|None} }
+RULES_BULK_MAX = int(os.getenv('RULES_BULK_MAX', '5000'))  # operações por lote
+RULES_BULK_TIMEOUT = float(os.getenv('RULES_BULK_TIMEOUT', '10'))  # s esperando o resultado do ingestor
+rules_bulk_pending = {}
+rules_bulk_lock = threading.Lock()
 
 # --- MQTT Callbacks ---
 def on_message(client, userdata, message):
@@ -41,87 +101,120 @@ def on_message(client, userdata, message):
     Armazena respostas de configuração do ESP32 no cache.
     """
     topic = message.topic
+    
+    # Presença: dados e heartbeat só marcam o dispositivo como visto (sem decodificar o payload)
+    parts = topic.split('/')
+    if len(parts) == 4 and parts[1] == 'sensors' and parts[3] == 'data':
+        presenca.visto(parts[0])
+        return
+    if len(parts) == 3 and parts[0] == 'device':
+        if parts[2] == 'status':
+            presenca.status(parts[1], message.payload.strip().lower() != b'offline')
+        else:
+            presenca.visto(parts[1])
+        return
+    
     payload = message.payload.decode('utf-8')
     
-    print(f"📨 Mensagem MQTT recebida no tópico: {topic}", flush=True)
-    print(f"   Payload: {payload}", flush=True)  # Show full payload
+    log_mqtt.debug("📨 Mensagem MQTT recebida no tópico: %s", topic)
+    log_mqtt.debug("   Payload: %s", lazy_trunc(payload, 500))
     
     try:
-        parts = topic.split('/')
-        print(f"   Topic parts: {parts}")
+        log_mqtt.debug("   Topic parts: %s", parts)
         
         # Handle new response pattern: <device_id>/settings/sensors/{operation}/response
         if len(parts) >= 5 and parts[1] == 'settings' and parts[2] == 'sensors' and parts[4] == 'response':
             device_id = parts[0]
             operation = parts[3]  # 'get', 'set', or 'remove'
+            presenca.visto(device_id)
             
-            print(f"   🔍 Detectado: device_id={device_id}, operation={operation}")
+            log_mqtt.debug("   🔍 Detectado: device_id=%s, operation=%s", device_id, operation)
             
             # Parse response (could be JSON or simple string like "OK"/"ERROR")
             try:
                 data = json.loads(payload) if payload.strip() else {}
-                print(f"   📦 Dados parseados (JSON): {data}")
+                log_mqtt.debug("   📦 Dados parseados (JSON): %s", data)
             except:
                 data = payload  # Simple string response
-                print(f"   📦 Dados parseados (string): {data}")
+                log_mqtt.debug("   📦 Dados parseados (string): %s", data)
             
             # Store in cache with operation-specific key
-            with config_cache_lock:
-                if device_id not in config_cache:
-                    config_cache[device_id] = {}
+            with config_cache_cond:
+                respostas = config_cache.get(device_id) or {}
                 cache_key = f'sensors_{operation}_response'
-                config_cache[device_id][cache_key] = {
+                respostas[cache_key] = {
                     'data': data,
                     'timestamp': time.time()
                 }
+                config_cache[device_id] = respostas  # (re)insere como mais recente
+                config_cache_cond.notify_all()
             
-            print(f"✅ Resposta '{operation}' de '{device_id}' armazenada no cache com chave '{cache_key}'")
-            print(f"   Cache atual para {device_id}: {list(config_cache[device_id].keys())}")
+            log_mqtt.debug("✅ Resposta '%s' de '%s' armazenada no cache com chave '%s'", operation, device_id, cache_key)
+            log_mqtt.debug("   Cache atual para %s: %s", device_id, list(respostas.keys()))
             return
         
         # Legacy: Parse do tópico: config/{device_id}/{type}
         if len(parts) >= 3 and parts[0] == 'config':
             device_id = parts[1]
             config_type = parts[2]  # 'sensors' ou 'wifi'
+            presenca.visto(device_id)
             
             # Parse JSON payload
             data = json.loads(payload)
             
             # Armazena no cache
             with config_cache_lock:
-                if device_id not in config_cache:
-                    config_cache[device_id] = {}
-                config_cache[device_id][config_type] = {
+                respostas = config_cache.get(device_id) or {}
+                respostas[config_type] = {
                     'data': data,
                     'timestamp': time.time()
                 }
+                config_cache[device_id] = respostas
             
-            print(f"✅ Configuração '{config_type}' de '{device_id}' armazenada no cache")
+            log_mqtt.debug("✅ Configuração '%s' de '%s' armazenada no cache", config_type, device_id)
+            return
+        
+        # Resultado de um lote de regras: callback/rules/bulk/<id_lote>
+        if len(parts) == 4 and parts[0] == 'callback' and parts[1] == 'rules' and parts[2] == 'bulk':
+            with rules_bulk_lock:
+                pendente = rules_bulk_pending.get(parts[3])
+            if pendente:
+                pendente['result'] = json.loads(payload)
+                pendente['event'].set()
             return
         
-        # Tratar resposta de regras via callback/rules
+        # Tratar snapshot de regras via callback/rules
         if topic == 'callback/rules':
             data = json.loads(payload)
+            version = data.get('version') if isinstance(data, dict) else None
             
-            # Armazena no cache de regras
             with rules_cache_lock:
+                atual = rules_cache.get('rules')
+                # Ignora snapshots antigos (ex.: retido chegando depois de um mais novo)
+                if atual and version is not None and atual['version'] is not None and version <= atual['version']:
+                    log_mqtt.debug("ℹ️ Snapshot de regras v%s ignorado (atual v%s)", version, atual['version'])
+                    return
                 rules_cache['rules'] = {
-                    'data': data,
+                    'body': message.payload,
+                    'version': version,
+                    # Ingestor antigo (sem versão): ETag derivada do conteúdo
+                    'etag': f"rules-{version}" if version is not None else f"rules-c{zlib.crc32(message.payload):08x}",
                     'timestamp': time.time()
                 }
+            rules_cache_event.set()
             
-            print(f"✅ Regras recebidas e armazenadas no cache")
+            log_mqtt.debug("✅ Snapshot de regras v%s armazenado (%s bytes)", version, len(message.payload))
             return
     
     except Exception as e:
-        print(f"❌ Erro ao processar mensagem MQTT: {e}")
+        log_mqtt.error("❌ Erro ao processar mensagem MQTT: %s", e)
 
 def on_connect(client, userdata, flags, rc):
     """Callback quando conecta ao broker MQTT."""
     if rc == 0:
-        print("✅ Conectado ao MQTT Broker com sucesso!")
-        print(f"   Broker: {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
-        print(f"   Client ID: {client._client_id.decode() if hasattr(client._client_id, 'decode') else client._client_id}")
+        log.info("✅ Conectado ao MQTT Broker com sucesso!")
+        log.info("   Broker: %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+        log.info("   Client ID: %s", client._client_id.decode() if hasattr(client._client_id, 'decode') else client._client_id)
         
         # Subscreve aos tópicos de resposta dos ESP32s
         client.subscribe("+/settings/sensors/get/response")  # New pattern
@@ -130,31 +223,41 @@ def on_connect(client, userdata, flags, rc):
         client.subscribe("config/+/sensors")  # Legacy support
         client.subscribe("config/+/wifi")
         client.subscribe(MQTT_TOPIC)
-        print("📡 Subscrito aos tópicos de resposta de sensores e WiFi")
-        print("   Tópicos subscritos:")
-        print("   - +/settings/sensors/get/response")
-        print("   - +/settings/sensors/set/response")
-        print("   - +/settings/sensors/remove/response")
-        print("   - config/+/sensors")
-        print("   - config/+/wifi")
-        print(f"   - {MQTT_TOPIC}")
+        client.subscribe("device/+/status")  # online/offline (LWT), retido
+        client.subscribe("device/+/heartbeat")
+        if PRESENCE_TRACK_DATA:
+            client.subscribe("+/sensors/+/data")
+        log.info("📡 Subscrito aos tópicos de resposta de sensores e WiFi")
+        log.info("   Tópicos subscritos:")
+        log.info("   - +/settings/sensors/get/response")
+        log.info("   - +/settings/sensors/set/response")
+        log.info("   - +/settings/sensors/remove/response")
+        log.info("   - config/+/sensors")
+        log.info("   - config/+/wifi")
+        log.info("   - %s", MQTT_TOPIC)
+        log.info("   - device/+/status, device/+/heartbeat%s (presença)", ", +/sensors/+/data" if PRESENCE_TRACK_DATA else "")
     else:
-        print(f"❌ Falha na conexão MQTT. Código de retorno: {rc}")
+        log.error("❌ Falha na conexão MQTT. Código de retorno: %s", rc)
 
 # --- Conexões ---
 try:
     influx_client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
     query_api = influx_client.query_api()
-    print("Conectado ao InfluxDB com sucesso!")
+    delete_api = influx_client.delete_api()
+    # Cliente só das leituras de histórico, com timeout: ao estourar a conexão é fechada e o
+    # InfluxDB cancela a consulta (deletes e exportações seguem no cliente sem limite)
+    leitura_api = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG,
+                                 timeout=int(QUERY_TIMEOUT * 1000)).query_api()
+    log.info("Conectado ao InfluxDB com sucesso!")
 
     # Conexão MQTT (para publicar configurações e receber respostas)
-    print(f"Conectando ao MQTT Broker em {MQTT_BROKER_HOST}...")
+    log.info("Conectando ao MQTT Broker em %s...", MQTT_BROKER_HOST)
     mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
     mqtt_client.on_connect = on_connect
     mqtt_client.on_message = on_message
     mqtt_client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
 except Exception as e:
-    print(f"Não foi possível conectar ao Broker MQTT: {e}")
+    log.error("Não foi possível conectar ao Broker MQTT: %s", e)
     exit(1)
 
 # Loop principal para manter o script rodando
@@ -162,46 +265,216 @@ except Exception as e:
 try:
     mqtt_client.loop_start()
 except KeyboardInterrupt:
-    print("Script interrompido pelo usuário. Desconectando...")
+    log.info("Script interrompido pelo usuário. Desconectando...")
     mqtt_client.disconnect()
     influx_client.close()
-    print("Desconectado.")
+    log.info("Desconectado.")
+
+
+# --- Jobs em background (deletes no InfluxDB) ---
+# Poucos workers de propósito: deletes grandes pesam no InfluxDB
+JOBS_MAX_WORKERS = int(os.getenv('JOBS_MAX_WORKERS', '1'))
+JOBS_DELETE_CHUNK_HOURS = float(os.getenv('JOBS_DELETE_CHUNK_HOURS', '24'))
+fila_jobs = jobs.FilaDeJobs(max_workers=JOBS_MAX_WORKERS)
+
+# --- Exportação Arrow/Parquet (ver export.py) ---
+# Fila própria, para uma exportação longa não segurar os deletes
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+EXPORT_MAX_WORKERS = int(os.getenv('EXPORT_MAX_WORKERS', '1'))
+EXPORT_CHUNK_HOURS = float(os.getenv('EXPORT_CHUNK_HOURS', '24'))  # faixa de tempo por arquivo/consulta
+EXPORT_BATCH_ROWS = int(os.getenv('EXPORT_BATCH_ROWS', '100000'))  # linhas em memória antes de gravar um lote
+fila_exportacoes = jobs.FilaDeJobs(max_workers=EXPORT_MAX_WORKERS)
+
+def _enfileirar_delete(predicate, descricao):
+    """Enfileira um delete no bucket e retorna o dict do job (deduplicado por predicate)."""
+    job, novo = jobs.submeter_delete(
+        fila_jobs, delete_api, INFLUXDB_BUCKET, INFLUXDB_ORG, predicate, descricao,
+        primeira_janela=timedelta(hours=JOBS_DELETE_CHUNK_HOURS)
+    )
+    info = job.to_dict()
+    info['deduplicated'] = not novo
+    return info
 
+def _recusa_se_offline(device_id):
+    """Resposta 503 imediata se o dispositivo está offline; None para seguir com a requisição.
+
+    '?force=1' ignora o registro de presença e tenta mesmo assim.
+    """
+    if request.args.get('force') in ('1', 'true') or presenca.estado(device_id) != presence.OFFLINE:
+        return None
+    info = presenca.info(device_id)
+    log.info("⛔ %s está offline (visto há %ss): requisição recusada", device_id, info['seconds_since_seen'])
+    response = jsonify({
+        "error": "device_offline",
+        "message": f"ESP32 '{device_id}' está offline. Use ?force=1 para tentar mesmo assim.",
+        "device": device_id,
+        "presence": info
+    })
+    response.headers['Retry-After'] = str(int(PRESENCE_OFFLINE_AFTER))
+    return response, 503
 
 # --- Rotas da API ---
+@app.route('/devices/presence')
+def devices_presence():
+    """Estado de presença (online/offline/unknown), último contato e RTT de cada dispositivo."""
+    return jsonify(presenca.to_dict())
+
+@app.route('/jobs')
+def list_jobs():
+    """Lista os jobs em background (mais recentes por último)."""
+    todos = sorted(fila_jobs.listar() + fila_exportacoes.listar(), key=lambda job: job.criado_em)
+    return jsonify({"jobs": [job.to_dict() for job in todos]})
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Status de um job: queued, running, done ou failed (com progresso por faixa de tempo)."""
+    job = fila_jobs.obter(job_id) or fila_exportacoes.obter(job_id)
+    if job is None:
+        return jsonify({"error": "job not found", "job_id": job_id}), 404
+    return jsonify(job.to_dict())
+
+def _info_exportacao(manifesto):
+    """Manifesto + job atual; 'interrupted' se ficou pela metade sem job (ex.: a API reiniciou)."""
+    info = dict(manifesto)
+    job = fila_exportacoes.ativo(f"export:{manifesto['id']}")
+    info['job'] = job.to_dict() if job else None
+    if info['status'] in ('queued', 'running') and job is None:
+        info['status'] = 'interrupted'
+    info['download'] = f"/exports/{manifesto['id']}/download"
+    return info
+
+def _submeter_exportacao(pedido):
+    manifesto, job = export.submeter_exportacao(
+        fila_exportacoes, query_api, INFLUXDB_BUCKET, INFLUXDB_ORG, INFLUX_SCHEMA, EXPORT_DIR, pedido,
+        timedelta(hours=EXPORT_CHUNK_HOURS), EXPORT_BATCH_ROWS
+    )
+    info = _info_exportacao(export.ler_manifesto(EXPORT_DIR, manifesto['id']) or manifesto)
+    if job is None:
+        return jsonify({"status": "done", "export": info}), 200
+    log.info("📦 Exportação %s enfileirada (job %s): %s", manifesto['id'], job.id, job.descricao)
+    response = jsonify({"status": "accepted", "export": info, "job": job.to_dict()})
+    response.headers['Location'] = f"/exports/{manifesto['id']}"
+    return response, 202
+
+@app.route('/exports', methods=['GET', 'POST'])
+def exports():
+    """
+    GET: lista as exportações no disco.
+    POST: exporta um dispositivo para Arrow IPC ou Parquet em background.
+    
+    Body JSON:
+    {
+      "device": "esp32_device_1",
+      "sensors": ["sensor_3", "sensor_5"],   // opcional (padrão: todos)
+      "fields": ["temperature"],             // opcional (padrão: todos)
+      "start": "-30d", "stop": "now",        // RFC3339 ou relativo
+      "format": "parquet",                   // ou "arrow"
+      "compression": "zstd"                  // parquet: zstd, snappy, gzip, lz4, none; arrow: zstd, lz4, none
+    }
+    
+    Responde 202 com o job; o mesmo pedido de novo retoma a exportação de onde
+    parou (ou devolve 200 se já estiver concluída).
+    """
+    if request.method == 'GET':
+        return jsonify({"exports": [_info_exportacao(m) for m in export.listar(EXPORT_DIR)]})
+    try:
+        if not export.disponivel():
+            return jsonify({"error": "export_unavailable", "message": "pyarrow não está instalado na API"}), 503
+        try:
+            pedido = export.normalizar_pedido(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return _submeter_exportacao(pedido)
+    except Exception as e:
+        log.exception("❌ Erro ao criar exportação: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/exports/<export_id>', methods=['GET', 'DELETE'])
+def export_status(export_id):
+    """Estado da exportação (faixas concluídas, linhas, arquivos) ou remoção dos arquivos (DELETE)."""
+    manifesto = export.ler_manifesto(EXPORT_DIR, export_id)
+    if manifesto is None:
+        return jsonify({"error": "export not found", "export_id": export_id}), 404
+    if request.method == 'GET':
+        return jsonify(_info_exportacao(manifesto))
+    if fila_exportacoes.ativo(f"export:{export_id}"):
+        return jsonify({"error": "export is running", "export_id": export_id}), 409
+    export.remover(EXPORT_DIR, export_id)
+    log.info("🗑️ Exportação %s removida", export_id)
+    return jsonify({"status": "deleted", "export_id": export_id})
+
+@app.route('/exports/<export_id>/resume', methods=['POST'])
+def resume_export(export_id):
+    """Retoma uma exportação interrompida ou com falha a partir da primeira faixa pendente."""
+    manifesto = export.ler_manifesto(EXPORT_DIR, export_id)
+    if manifesto is None:
+        return jsonify({"error": "export not found", "export_id": export_id}), 404
+    if not export.disponivel():
+        return jsonify({"error": "export_unavailable", "message": "pyarrow não está instalado na API"}), 503
+    pedido = dict(manifesto['request'], _inicio=manifesto['start'], _fim=manifesto['stop'], _relativo=False)
+    return _submeter_exportacao(pedido)
+
+@app.route('/exports/<export_id>/download')
+def download_export(export_id):
+    """Baixa a exportação concluída: o arquivo direto se for uma parte só, senão um .zip com as partes."""
+    manifesto = export.ler_manifesto(EXPORT_DIR, export_id)
+    if manifesto is None:
+        return jsonify({"error": "export not found", "export_id": export_id}), 404
+    if manifesto['status'] != 'done':
+        return jsonify({"error": "export not finished", "export": _info_exportacao(manifesto)}), 409
+    nome_base = f"{manifesto['request']['device']}-{export_id}"
+    partes = export.arquivos(EXPORT_DIR, manifesto)
+    if len(partes) == 1:
+        extensao = os.path.splitext(partes[0][1])[1]
+        return send_from_directory(os.path.abspath(os.path.dirname(partes[0][0])), partes[0][1],
+                                   as_attachment=True, download_name=nome_base + extensao)
+    response = app.response_class(export.zip_em_streaming(partes), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{nome_base}.zip"'
+    return response
+
+@app.route('/exports/<export_id>/files/<nome>')
+def download_export_part(export_id, nome):
+    """Baixa uma parte (uma faixa de tempo) da exportação."""
+    manifesto = export.ler_manifesto(EXPORT_DIR, export_id)
+    if manifesto is None or nome not in {p['file'] for p in manifesto['parts']}:
+        return jsonify({"error": "file not found", "export_id": export_id, "file": nome}), 404
+    return send_from_directory(os.path.abspath(os.path.join(EXPORT_DIR, export_id)), nome, as_attachment=True)
+
 @app.route('/health')
 def health_rules():
-    """Verifica se a API está no ar."""
-    return jsonify({"status": "API Server is running"})
+    """Verifica se a API está no ar (e o tamanho dos caches por dispositivo)."""
+    with config_cache_lock:
+        cache = config_cache.estatisticas()
+    return jsonify({
+        "status": "API Server is running",
+        "device_state": {"config_cache": cache, "presence": presenca.estatisticas()},
+        "queries": admissao.estatisticas(),
+    })
 
 @app.route('/influxdb/clear', methods=['POST'])
 def clear_influxdb():
     """
     Deletes ALL data from the InfluxDB bucket.
     This is a destructive operation - use with caution!
+    
+    O delete roda em background: responde 202 com o job (GET /jobs/<id>).
     """
     try:
-        # Get delete API
-        delete_api = influx_client.delete_api()
-        
-        # Delete all data from the beginning of time to now
-        start = "1970-01-01T00:00:00Z"
-        stop = "2100-01-01T00:00:00Z"
-        
         # Delete all data in the bucket (no predicate means delete everything)
-        delete_api.delete(start, stop, '', bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG)
+        job = _enfileirar_delete('', f"clear bucket '{INFLUXDB_BUCKET}'")
         
-        print(f"🗑️ All data cleared from InfluxDB bucket: {INFLUXDB_BUCKET}")
+        log.info("🗑️ Limpeza do bucket %s enfileirada (job %s)", INFLUXDB_BUCKET, job['id'])
         
-        return jsonify({
-            "status": "success",
-            "message": f"All data cleared from bucket '{INFLUXDB_BUCKET}'",
-            "bucket": INFLUXDB_BUCKET
+        response = jsonify({
+            "status": "accepted",
+            "message": f"Clearing bucket '{INFLUXDB_BUCKET}' in background",
+            "bucket": INFLUXDB_BUCKET,
+            "job": job
         })
+        response.headers['Location'] = f"/jobs/{job['id']}"
+        return response, 202
     except Exception as e:
-        print(f"❌ Error clearing InfluxDB: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Error clearing InfluxDB: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/<device_id>/sensors/<sensor_id>/read')
@@ -212,23 +485,41 @@ def get_data(device_id, sensor_id):
     ?start= : Período de início (ex: -1h, -5m, -1d). Padrão: -1h
     ?every= : Intervalo de agregação (ex: 1m, 5s, 10m). Padrão: Retorna dados brutos.
     ?measurement = : Medida que vai ser utilizada. Padrão: Todas as medidas.
+                     (com INFLUX_SCHEMA=tipo, filtra pelo campo, ex.: temperature)
+    ?max_points= : Reduz a resposta a no máximo N pontos para gráficos (ver downsample.py).
+                   Padrão: sem redução.
+    ?downsample= : 'lttb' (padrão) ou 'minmax' (mínimo e máximo de cada balde).
+    
+    A consulta passa pelo controle de admissão (admission.py): sem vaga na
+    classe de custo dela em QUERY_QUEUE_TIMEOUT s responde 429 com
+    Retry-After; passando de QUERY_TIMEOUT s responde 504.
+    
+    O sensor_id da URL é o nome do measurement legado ('sensor_<id>'); no
+    layout por tipo o prefixo é removido e o filtro é pela tag sensor_id.
     """
     
     # Obter parâmetros da query string (ex: ?start=-1h&every=5m)
     start_range = request.args.get('start', '-1h') # Padrão: última hora
     every_window = request.args.get('every') # Padrão: null (sem agregação)
     measurement = request.args.get('measurement') # Padrão: null (sem filtro)
+    max_points = request.args.get('max_points', type=int) # Padrão: null (todos os pontos)
+    metodo = request.args.get('downsample', downsample.LTTB)
+    if max_points is not None and max_points < downsample.MIN_PONTOS:
+        return jsonify({"error": f"'max_points' deve ser pelo menos {downsample.MIN_PONTOS}"}), 400
+    if metodo not in downsample.METODOS:
+        return jsonify({"error": f"'downsample' deve ser {' ou '.join(downsample.METODOS)}"}), 400
 
     # Montar a query Flux dinamicamente
     q_influx_parts = [
         f'from(bucket: "{INFLUXDB_BUCKET}")',
         f'|> range(start: {start_range})',
-        f'|> filter(fn: (r) => r["device_id"] == "{device_id}")',
-        f'|> filter(fn: (r) => r["_measurement"] == "{sensor_id}")'  # sensor_id is the measurement name
-    ]
+    ] + influx_schema.filtros_flux_do_sensor(INFLUX_SCHEMA, device_id, sensor_id)
 
     if measurement:
-        q_influx_parts.append(f'|> filter(fn: (r) => r["_measurement"] == "{measurement}")')
+        if INFLUX_SCHEMA == influx_schema.SCHEMA_TIPO:
+            q_influx_parts.append(f'|> filter(fn: (r) => r["_field"] == "{measurement}")')
+        else:
+            q_influx_parts.append(f'|> filter(fn: (r) => r["_measurement"] == "{measurement}")')
 
     # Adicionar agregação (média) se 'every' foi fornecido
     if every_window:
@@ -241,43 +532,90 @@ def get_data(device_id, sensor_id):
     # Junta as partes da query
     q_influx = "\n".join(q_influx_parts)
     
-    print(f"--- Executando Query Influx ---\n{q_influx}\n---------------------------------")
+    log.debug("--- Executando Query Influx ---\n%s\n---------------------------------", q_influx)
+
+    classe = admissao.classificar(admission.estimar_custo(start_range, every_window))
 
     # Executar a query e processar o resultado
     try:
-        result = query_api.query(org=INFLUXDB_ORG, query=q_influx)
-        
-        # Agrupa campos pelo timestamp para sensores multi-campo (joystick, gyro, etc.)
-        time_grouped = {}  # { "timestamp": { "field1": value1, "field2": value2, ... } }
-        
-        for table in result:
-            for record in table.records:
-                timestamp = record.get_time().isoformat()
-                field_name = record.get_field()  # Nome do campo (x, y, button, temperature, etc.)
-                field_value = record.get_value()
-                measurement = record.get_measurement()
+        # Montagem e redução dos pontos também ocupam a vaga: numa leitura bruta
+        # longa elas custam tanto quanto a própria consulta
+        with admissao.admitir(classe):
+            result = leitura_api.query(org=INFLUXDB_ORG, query=q_influx)
+        
+            # Agrupa campos pelo timestamp para sensores multi-campo (joystick, gyro, etc.)
+            time_grouped = {}  # { "timestamp": { "field1": value1, "field2": value2, ... } }
+            instantes = {}  # { "timestamp": segundos desde a época } (eixo x da redução)
+        
+            for table in result:
+                for record in table.records:
+                    instante = record.get_time()
+                    timestamp = instante.isoformat()
+                    field_name = record.get_field()  # Nome do campo (x, y, button, temperature, etc.)
+                    field_value = record.get_value()
+                    # Mantém o formato da resposta nos dois layouts ('sensor_<id>')
+                    measurement = influx_schema.measurement_legado(sensor_id)
                 
-                # Inicializa estrutura para este timestamp se não existir
-                if timestamp not in time_grouped:
-                    time_grouped[timestamp] = {
-                        "time": timestamp,
-                        "measurement": measurement,
-                        "value": {}
-                    }
+                    # Inicializa estrutura para este timestamp se não existir
+                    if timestamp not in time_grouped:
+                        instantes[timestamp] = instante.timestamp()
+                        time_grouped[timestamp] = {
+                            "time": timestamp,
+                            "measurement": measurement,
+                            "value": {}
+                        }
                 
-                # Adiciona o campo ao dicionário de valores
-                time_grouped[timestamp]["value"][field_name] = field_value
+                    # Adiciona o campo ao dicionário de valores
+                    time_grouped[timestamp]["value"][field_name] = field_value
+        
+            # Converte de volta para lista, ordenada por timestamp
+            data_points = sorted(time_grouped.values(), key=lambda x: x["time"])
+            total = len(data_points)
         
-        # Converte de volta para lista, ordenada por timestamp
-        data_points = sorted(time_grouped.values(), key=lambda x: x["time"])
+            # Redução para gráficos: mantém picos em vez de achatar como a média por janela
+            if max_points is not None:
+                data_points = downsample.reduzir(data_points, max_points, metodo,
+                                                 [instantes[p["time"]] for p in data_points])
         
         # Retornar o JSON
-        return jsonify(data_points)
+        response = jsonify(data_points)
+        response.headers['X-Query-Cost-Class'] = classe
+        if max_points is not None:
+            response.headers['X-Total-Points'] = str(total)
+            response.headers['X-Returned-Points'] = str(len(data_points))
+        return response
 
+    except admission.SemVaga as e:
+        log.warning("⛔ Leitura %s/%s recusada: sem vaga para consultas '%s' (start=%s, every=%s)",
+                    device_id, sensor_id, e.classe, start_range, every_window)
+        response = jsonify({
+            "error": "too_many_queries",
+            "message": f"Muitas consultas '{e.classe}' em andamento. Tente de novo em {e.retry_after}s "
+                       "ou reduza o intervalo (?start=) / agregue (?every=).",
+            "cost_class": e.classe,
+            "retry_after": e.retry_after
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
     except Exception as e:
-        print(f"Erro ao consultar InfluxDB: {e}")
+        if _timeout_da_consulta(e):
+            log.warning("⏱️ Leitura %s/%s passou de %ss ('%s', start=%s): cancelada",
+                        device_id, sensor_id, QUERY_TIMEOUT, classe, start_range)
+            return jsonify({
+                "error": "query_timeout",
+                "message": f"A consulta passou de {QUERY_TIMEOUT:g}s. Reduza o intervalo (?start=), "
+                           "agregue (?every=) ou use POST /exports.",
+                "cost_class": classe
+            }), 504
+        log.error("Erro ao consultar InfluxDB: %s", e)
         return jsonify({"error": str(e)}), 500
 
+def _timeout_da_consulta(e):
+    """True se a exceção do cliente InfluxDB veio do timeout de leitura (direto ou após os retries)."""
+    if isinstance(e, urllib3.exceptions.MaxRetryError):
+        e = e.reason
+    return isinstance(e, urllib3.exceptions.TimeoutError)
+
 @app.route('/<device_id>/settings/sensors/get')
 def get_sensors_config(device_id):
     """
@@ -286,6 +624,9 @@ def get_sensors_config(device_id):
     Timeout de 5 segundos.
     """
     try:
+        offline = _recusa_se_offline(device_id)
+        if offline:
+            return offline
         cache_key = 'sensors_get_response'
         
         # Limpa cache antigo para este device
@@ -296,32 +637,34 @@ def get_sensors_config(device_id):
         # Envia requisição MQTT
         request_topic = f"{device_id}/settings/sensors/get"
         mqtt_client.publish(request_topic, "", qos=1)
-        print(f"📤 GET sensors solicitado: {request_topic}")
-        print(f"   Aguardando resposta em: {device_id}/settings/sensors/get/response")
-        print(f"   MQTT conectado: {mqtt_client.is_connected()}")
+        log.info("📤 GET sensors solicitado: %s", request_topic)
+        log.debug("   Aguardando resposta em: %s/settings/sensors/get/response", device_id)
+        log.debug("   MQTT conectado: %s", mqtt_client.is_connected())
         
-        # Aguarda resposta (polling no cache)
-        timeout = 5
+        # Aguarda resposta (polling no cache), com timeout adaptado ao RTT do dispositivo
+        timeout = presenca.timeout(device_id, 5)
         start_time = time.time()
         
         while (time.time() - start_time) < timeout:
             with config_cache_lock:
                 if device_id in config_cache and cache_key in config_cache[device_id]:
-                    response_data = config_cache[device_id][cache_key]['data']
-                    print(f"✅ Resposta GET recebida após {time.time() - start_time:.2f}s")
-                    return jsonify(response_data)
+                    entrada = config_cache[device_id][cache_key]
+                    presenca.resposta(device_id, entrada['timestamp'] - start_time)
+                    log.info("✅ Resposta GET recebida após %.2fs", time.time() - start_time)
+                    return jsonify(entrada['data'])
             time.sleep(0.1)
         
         # Timeout
-        print(f"⏱️ Timeout aguardando resposta de {device_id}")
+        presenca.sem_resposta(device_id)
+        log.warning("⏱️ Timeout aguardando resposta de %s", device_id)
         return jsonify({
             "error": "timeout",
-            "message": f"ESP32 '{device_id}' não respondeu em {timeout} segundos.",
+            "message": f"ESP32 '{device_id}' não respondeu em {timeout:.1f} segundos.",
             "sensors": []
         }), 408
 
     except Exception as e:
-        print(f"Erro ao solicitar configuração de sensores: {e}")
+        log.error("Erro ao solicitar configuração de sensores: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/<device_id>/settings/wifi/get')
@@ -331,12 +674,15 @@ def get_wifi_config(device_id):
     Timeout de 5 segundos.
     """
     try:
+        offline = _recusa_se_offline(device_id)
+        if offline:
+            return offline
         # Primeiro, verifica se temos cache recente (< 10 segundos)
         with config_cache_lock:
             if device_id in config_cache and 'wifi' in config_cache[device_id]:
                 cache_age = time.time() - config_cache[device_id]['wifi']['timestamp']
                 if cache_age < 10:  # Cache válido por 10 segundos
-                    print(f"📦 Retornando configuração WiFi do cache (idade: {cache_age:.1f}s)")
+                    log.info("📦 Retornando configuração WiFi do cache (idade: %.1fs)", cache_age)
                     return jsonify(config_cache[device_id]['wifi']['data'])
         
         # Limpa cache antigo para este device
@@ -347,28 +693,30 @@ def get_wifi_config(device_id):
         # Envia requisição MQTT
         request_topic = f"config/{device_id}/wifi/get"
         mqtt_client.publish(request_topic, "", qos=1)
-        print(f"📤 Solicitação WiFi enviada via MQTT: {request_topic}")
+        log.info("📤 Solicitação WiFi enviada via MQTT: %s", request_topic)
         
-        # Aguarda resposta (polling no cache)
-        timeout = 5  # segundos
+        # Aguarda resposta (polling no cache), com timeout adaptado ao RTT do dispositivo
+        timeout = presenca.timeout(device_id, 5)  # segundos
         start_time = time.time()
         
         while (time.time() - start_time) < timeout:
             with config_cache_lock:
                 if device_id in config_cache and 'wifi' in config_cache[device_id]:
-                    print(f"✅ Resposta WiFi recebida do ESP32 após {time.time() - start_time:.2f}s")
+                    presenca.resposta(device_id, config_cache[device_id]['wifi']['timestamp'] - start_time)
+                    log.info("✅ Resposta WiFi recebida do ESP32 após %.2fs", time.time() - start_time)
                     return jsonify(config_cache[device_id]['wifi']['data'])
             time.sleep(0.1)  # Aguarda 100ms antes de verificar novamente
         
         # Timeout - ESP32 não respondeu
-        print(f"⏱️ Timeout aguardando resposta WiFi de {device_id}")
+        presenca.sem_resposta(device_id)
+        log.warning("⏱️ Timeout aguardando resposta WiFi de %s", device_id)
         return jsonify({
             "error": "timeout",
-            "message": f"ESP32 '{device_id}' não respondeu em {timeout} segundos. Verifique se o dispositivo está online."
+            "message": f"ESP32 '{device_id}' não respondeu em {timeout:.1f} segundos. Verifique se o dispositivo está online."
         }), 408  # 408 Request Timeout
 
     except Exception as e:
-        print(f"Erro ao solicitar configuração WiFi: {e}")
+        log.error("Erro ao solicitar configuração WiFi: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/<device_id>/settings/sensors/set', methods=['POST'])
@@ -399,7 +747,10 @@ def set_sensors_config(device_id):
         if not isinstance(new_sensors, list):
             return jsonify({"error": "sensors must be an array"}), 400
         
-        print(f"📝 SET sensor(es) em {device_id}: {len(new_sensors)} sensor(es)")
+        log.info("📝 SET sensor(es) em %s: %s sensor(es)", device_id, len(new_sensors))
+        offline = _recusa_se_offline(device_id)
+        if offline:
+            return offline
         
         cache_key = 'sensors_set_response'
         
@@ -412,25 +763,25 @@ def set_sensors_config(device_id):
         topic = f"{device_id}/settings/sensors/set"
         payload = json.dumps(new_config)
         
-        print(f"📤 Publicando no MQTT:", flush=True)
-        print(f"   Tópico: {topic}", flush=True)
-        print(f"   Payload: {payload}", flush=True)
-        print(f"   Broker: {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}", flush=True)
+        log.info("📤 Publicando no MQTT:")
+        log.info("   Tópico: %s", topic)
+        log.debug("   Payload: %s", payload)
+        log.debug("   Broker: %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
         
         (result, mid) = mqtt_client.publish(topic, payload, qos=1)
         
-        print(f"   Resultado da publicação: {result} (0=sucesso, outros=erro)", flush=True)
-        print(f"   Message ID: {mid}", flush=True)
+        log.debug("   Resultado da publicação: %s (0=sucesso, outros=erro)", result)
+        log.debug("   Message ID: %s", mid)
         
         if result != mqtt.MQTT_ERR_SUCCESS:
-            print(f"❌ Falha ao publicar no MQTT broker: código {result}")
+            log.error("❌ Falha ao publicar no MQTT broker: código %s", result)
             return jsonify({"error": "Failed to publish to MQTT broker", "code": result}), 500
         
-        print(f"📤 Sensor config enviado para {topic}")
-        print(f"   Aguardando resposta em: {device_id}/settings/sensors/set/response")
+        log.info("📤 Sensor config enviado para %s", topic)
+        log.debug("   Aguardando resposta em: %s/settings/sensors/set/response", device_id)
         
-        # Aguarda resposta OK/ERROR
-        timeout = 5
+        # Aguarda resposta OK/ERROR, com timeout adaptado ao RTT do dispositivo
+        timeout = presenca.timeout(device_id, 5)
         start_time = time.time()
         
         while (time.time() - start_time) < timeout:
@@ -438,16 +789,17 @@ def set_sensors_config(device_id):
                 if device_id in config_cache and cache_key in config_cache[device_id]:
                     response = config_cache[device_id][cache_key]['data']
                     elapsed = time.time() - start_time
+                    presenca.resposta(device_id, config_cache[device_id][cache_key]['timestamp'] - start_time)
                     
                     if response == "OK" or (isinstance(response, dict) and response.get('status') == 'OK'):
-                        print(f"✅ ESP32 confirmou SET após {elapsed:.2f}s")
+                        log.info("✅ ESP32 confirmou SET após %.2fs", elapsed)
                         return jsonify({
                             "status": "success",
                             "message": "Sensor configuration applied successfully",
                             "device": device_id
                         })
                     else:
-                        print(f"❌ ESP32 retornou erro: {response}")
+                        log.error("❌ ESP32 retornou erro: %s", response)
                         return jsonify({
                             "status": "error",
                             "message": f"ESP32 returned error: {response}",
@@ -456,18 +808,143 @@ def set_sensors_config(device_id):
             time.sleep(0.1)
         
         # Timeout
-        print(f"⏱️ Timeout aguardando confirmação de {device_id}")
+        presenca.sem_resposta(device_id)
+        log.warning("⏱️ Timeout aguardando confirmação de %s", device_id)
         return jsonify({
             "error": "timeout",
-            "message": f"ESP32 '{device_id}' não confirmou a operação em {timeout} segundos."
+            "message": f"ESP32 '{device_id}' não confirmou a operação em {timeout:.1f} segundos."
         }), 408
 
     except Exception as e:
-        print(f"Erro ao processar SET de sensores: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Erro ao processar SET de sensores: %s", e)
         return jsonify({"error": str(e)}), 400
 
+# --- Operações de frota ---
+FLEET_MAX_IN_FLIGHT = int(os.getenv('FLEET_MAX_IN_FLIGHT', '50'))  # dispositivos aguardando ack ao mesmo tempo
+FLEET_ACK_TIMEOUT = float(os.getenv('FLEET_ACK_TIMEOUT', '5'))  # s esperando o ack de cada dispositivo
+
+def _resposta_ok(response):
+    return response == "OK" or (isinstance(response, dict) and response.get('status') == 'OK')
+
+def _dispositivos_do_seletor(seletor):
+    """{"devices": [...]}, {"prefix": "..."} ou {"all": true} (os dois últimos entre os dispositivos conhecidos)."""
+    if isinstance(seletor.get('devices'), list):
+        return list(dict.fromkeys(str(d) for d in seletor['devices']))
+    with config_cache_lock:
+        conhecidos = set(config_cache)
+    conhecidos = sorted(conhecidos.union(presenca.dispositivos()))
+    if seletor.get('prefix'):
+        return [d for d in conhecidos if d.startswith(seletor['prefix'])]
+    if seletor.get('all'):
+        return conhecidos
+    return []
+
+def _fan_out(dispositivos, operacao, payload, max_em_voo, timeout):
+    """Gerador: publica '<device>/settings/sensors/<operacao>' para todos os dispositivos
+    com no máximo 'max_em_voo' aguardando ack e devolve cada resultado assim que chega.
+    Dispositivos offline saem na hora; o timeout de cada um se adapta ao seu RTT.
+    """
+    cache_key = f'sensors_{operacao}_response'
+    pendentes = deque(dispositivos)
+    em_voo = {}  # device_id -> (instante da publicação, prazo)
+    while pendentes or em_voo:
+        prontos = []
+        # Completa a janela de publicações
+        while pendentes and len(em_voo) < max_em_voo:
+            device_id = pendentes.popleft()
+            if presenca.estado(device_id) == presence.OFFLINE:
+                prontos.append({"device": device_id, "status": "offline", "presence": presenca.info(device_id)})
+                continue
+            with config_cache_lock:
+                config_cache.get(device_id, {}).pop(cache_key, None)
+            agora = time.time()
+            em_voo[device_id] = (agora, agora + presenca.timeout(device_id, timeout))
+            (result, mid) = mqtt_client.publish(f"{device_id}/settings/sensors/{operacao}", payload, qos=1)
+            if result != mqtt.MQTT_ERR_SUCCESS:
+                del em_voo[device_id]
+                prontos.append({"device": device_id, "status": "error", "message": f"MQTT publish failed (code: {result})"})
+        
+        # Espera o próximo ack (ou o próximo timeout) sem polling
+        with config_cache_cond:
+            while em_voo:
+                agora = time.time()
+                for device_id, (enviado, prazo) in list(em_voo.items()):
+                    entrada = config_cache.get(device_id, {}).get(cache_key)
+                    if entrada is not None:
+                        del em_voo[device_id]
+                        presenca.resposta(device_id, entrada['timestamp'] - enviado)
+                        ok = _resposta_ok(entrada['data'])
+                        prontos.append({
+                            "device": device_id,
+                            "status": "success" if ok else "error",
+                            "elapsed": round(entrada['timestamp'] - enviado, 3),
+                            **({} if ok else {"message": f"ESP32 returned error: {entrada['data']}"})
+                        })
+                    elif agora >= prazo:
+                        del em_voo[device_id]
+                        presenca.sem_resposta(device_id)
+                        prontos.append({"device": device_id, "status": "timeout", "elapsed": round(agora - enviado, 3)})
+                if prontos:
+                    break
+                config_cache_cond.wait(min(prazo for _, prazo in em_voo.values()) - agora)
+        yield from prontos
+
+@app.route('/fleet/settings/sensors/<operacao>', methods=['POST'])
+def fleet_sensors(operacao):
+    """
+    Aplica a mesma operação de sensores (set ou remove) em vários dispositivos
+    em paralelo: publica para todos com até 'max_in_flight' aguardando ack e
+    devolve o resultado de cada um (NDJSON, em streaming) assim que o ack
+    chega. O tempo total fica perto de um ack por janela, e não N × timeout.
+    
+    Body (JSON):
+    {
+      "selector": {"devices": ["esp1", "esp2"]},   // ou {"prefix": "sala_"} / {"all": true}
+      "config": {"sensors": [...]},                // payload de /<device_id>/settings/sensors/set
+      "max_in_flight": 50,                          // opcional (FLEET_MAX_IN_FLIGHT)
+      "timeout": 5                                  // opcional, s por dispositivo (FLEET_ACK_TIMEOUT)
+    }
+    Para remove, "config" é {"id": "<sensor_id>"}.
+    
+    Cada linha: {"device", "status": "success|error|timeout|offline", "elapsed"};
+    a última linha é {"summary": {...}}. Dispositivos offline (ver presence.py)
+    não recebem a publicação; o timeout de cada um se adapta ao seu RTT.
+    """
+    if operacao not in ('set', 'remove'):
+        return jsonify({"error": "operation must be 'set' or 'remove'"}), 404
+    try:
+        body = request.get_json()
+        seletor = body.get('selector') or {}
+        config = body.get('config')
+        if operacao == 'set' and (not isinstance(config, dict) or not isinstance(config.get('sensors'), list)):
+            return jsonify({"error": "Invalid payload. Expected config: {sensors: [...]}"}), 400
+        if operacao == 'remove' and (not isinstance(config, dict) or 'id' not in config):
+            return jsonify({"error": "Invalid payload. Expected config: {id: ...}"}), 400
+        max_em_voo = max(1, int(body.get('max_in_flight', FLEET_MAX_IN_FLIGHT)))
+        timeout = float(body.get('timeout', FLEET_ACK_TIMEOUT))
+    except Exception as e:
+        return jsonify({"error": f"Invalid body: {e}"}), 400
+    
+    dispositivos = _dispositivos_do_seletor(seletor)
+    if not dispositivos:
+        return jsonify({"error": "selector matched no devices"}), 400
+    
+    payload = json.dumps(config)
+    log.info("🚀 Frota: %s em %s dispositivo(s) (janela %s, timeout %ss)", operacao, len(dispositivos), max_em_voo, timeout)
+    
+    def linhas():
+        inicio = time.time()
+        totais = {"total": len(dispositivos), "success": 0, "error": 0, "timeout": 0, "offline": 0}
+        for resultado in _fan_out(dispositivos, operacao, payload, max_em_voo, timeout):
+            totais[resultado['status']] += 1
+            yield json.dumps(resultado) + '\n'
+        totais['elapsed'] = round(time.time() - inicio, 3)
+        log.info("🏁 Frota: %s concluído em %.2fs (%s ok, %s erro, %s timeout)", operacao, totais['elapsed'],
+                 totais['success'], totais['error'], totais['timeout'])
+        yield json.dumps({"summary": totais}) + '\n'
+    
+    return app.response_class(linhas(), mimetype='application/x-ndjson')
+
 @app.route('/<device_id>/sensors/remove', methods=['POST'])
 def remove_sensor(device_id):
     """
@@ -485,7 +962,10 @@ def remove_sensor(device_id):
             return jsonify({"error": "Invalid payload. Expected {sensor_id: ...}"}), 400
         
         sensor_id = data['sensor_id']
-        print(f"🗑️ REMOVE sensor '{sensor_id}' de {device_id}")
+        log.info("🗑️ REMOVE sensor '%s' de %s", sensor_id, device_id)
+        offline = _recusa_se_offline(device_id)
+        if offline:
+            return offline
         
         cache_key = 'sensors_remove_response'
         
@@ -503,11 +983,11 @@ def remove_sensor(device_id):
         if result != mqtt.MQTT_ERR_SUCCESS:
             return jsonify({"error": "Failed to publish to MQTT broker", "code": result}), 500
         
-        print(f"📤 Remove enviado para {topic}")
-        print(f"   Aguardando resposta em: {device_id}/settings/sensors/remove/response")
+        log.info("📤 Remove enviado para %s", topic)
+        log.debug("   Aguardando resposta em: %s/settings/sensors/remove/response", device_id)
         
-        # Aguarda resposta OK/ERROR
-        timeout = 5
+        # Aguarda resposta OK/ERROR, com timeout adaptado ao RTT do dispositivo
+        timeout = presenca.timeout(device_id, 5)
         start_time = time.time()
         
         while (time.time() - start_time) < timeout:
@@ -515,39 +995,32 @@ def remove_sensor(device_id):
                 if device_id in config_cache and cache_key in config_cache[device_id]:
                     response = config_cache[device_id][cache_key]['data']
                     elapsed = time.time() - start_time
+                    presenca.resposta(device_id, config_cache[device_id][cache_key]['timestamp'] - start_time)
                     
                     if response == "OK" or (isinstance(response, dict) and response.get('status') == 'OK'):
-                        print(f"✅ ESP32 confirmou REMOVE após {elapsed:.2f}s")
+                        log.info("✅ ESP32 confirmou REMOVE após %.2fs", elapsed)
                         
-                        # Delete InfluxDB measurement for this sensor
+                        # Delete InfluxDB measurement for this sensor (em background)
+                        delete_job = None
                         try:
-                            measurement_name = f"sensor_{sensor_id}"
-                            delete_api = influx_client.delete_api()
-                            
-                            # Delete all data for this measurement
-                            start = "1970-01-01T00:00:00Z"
-                            stop = "2099-12-31T23:59:59Z"
-                            
-                            delete_api.delete(
-                                start=start,
-                                stop=stop,
-                                predicate=f'_measurement="{measurement_name}"',
-                                bucket=INFLUXDB_BUCKET,
-                                org=INFLUXDB_ORG
+                            delete_job = _enfileirar_delete(
+                                influx_schema.predicado_delete_do_sensor(INFLUX_SCHEMA, device_id, sensor_id),
+                                f"delete data of sensor '{sensor_id}' of device '{device_id}'"
                             )
-                            
-                            print(f"🗑️ InfluxDB measurement '{measurement_name}' deleted")
+                            log.info("🗑️ Delete dos dados do sensor '%s' de %s enfileirado (job %s)",
+                                     sensor_id, device_id, delete_job['id'])
                         except Exception as influx_err:
-                            print(f"⚠️ Failed to delete InfluxDB measurement: {influx_err}")
+                            log.warning("⚠️ Failed to enqueue InfluxDB delete: %s", influx_err)
                             # Don't fail the request if InfluxDB delete fails
                         
                         return jsonify({
                             "status": "success",
                             "message": f"Sensor '{sensor_id}' removed successfully",
-                            "device": device_id
+                            "device": device_id,
+                            "delete_job": delete_job
                         })
                     else:
-                        print(f"❌ ESP32 retornou erro: {response}")
+                        log.error("❌ ESP32 retornou erro: %s", response)
                         return jsonify({
                             "status": "error",
                             "message": f"ESP32 returned error: {response}",
@@ -556,16 +1029,15 @@ def remove_sensor(device_id):
             time.sleep(0.1)
         
         # Timeout
-        print(f"⏱️ Timeout aguardando confirmação de {device_id}")
+        presenca.sem_resposta(device_id)
+        log.warning("⏱️ Timeout aguardando confirmação de %s", device_id)
         return jsonify({
             "error": "timeout",
-            "message": f"ESP32 '{device_id}' não confirmou a remoção em {timeout} segundos."
+            "message": f"ESP32 '{device_id}' não confirmou a remoção em {timeout:.1f} segundos."
         }), 408
 
     except Exception as e:
-        print(f"Erro ao processar REMOVE de sensor: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Erro ao processar REMOVE de sensor: %s", e)
         return jsonify({"error": str(e)}), 400
 
 @app.route('/<device_id>/settings/wifi/set', methods=['POST'])
@@ -587,9 +1059,9 @@ def set_wifi_config(device_id):
         if not wifi_config:
             return jsonify({"error": "Invalid payload. Expected JSON object"}), 400
         
-        print(f"📝 Recebida configuração WiFi para {device_id}")
-        print(f"   SSID: {wifi_config.get('ssid', 'N/A')}")
-        print(f"   MQTT Broker: {wifi_config.get('mqtt_broker', 'N/A')}")
+        log.info("📝 Recebida configuração WiFi para %s", device_id)
+        log.info("   SSID: %s", wifi_config.get('ssid', 'N/A'))
+        log.info("   MQTT Broker: %s", wifi_config.get('mqtt_broker', 'N/A'))
         
         topic = f"config/{device_id}/wifi/set"
         payload = json.dumps(wifi_config)
@@ -597,7 +1069,7 @@ def set_wifi_config(device_id):
         (result, mid) = mqtt_client.publish(topic, payload, qos=1)
         
         if result == mqtt.MQTT_ERR_SUCCESS:
-            print(f"✅ Configuração WiFi enviada para {topic} (MID: {mid})")
+            log.info("✅ Configuração WiFi enviada para %s (MID: %s)", topic, mid)
             
             # Atualiza cache local (sem password por segurança)
             safe_config = wifi_config.copy()
@@ -605,12 +1077,12 @@ def set_wifi_config(device_id):
                 safe_config['password'] = '***'
             
             with config_cache_lock:
-                if device_id not in config_cache:
-                    config_cache[device_id] = {}
-                config_cache[device_id]['wifi'] = {
+                respostas = config_cache.get(device_id) or {}
+                respostas['wifi'] = {
                     'data': safe_config,
                     'timestamp': time.time()
                 }
+                config_cache[device_id] = respostas
             
             return jsonify({
                 "status": "config_sent",
@@ -619,13 +1091,11 @@ def set_wifi_config(device_id):
                 "note": "ESP32 will restart to apply WiFi settings"
             })
         else:
-            print(f"❌ Erro ao publicar no MQTT (Código: {result})")
+            log.error("❌ Erro ao publicar no MQTT (Código: %s)", result)
             return jsonify({"error": "Failed to publish to MQTT broker", "code": result}), 500
 
     except Exception as e:
-        print(f"Erro ao processar configuração WiFi: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Erro ao processar configuração WiFi: %s", e)
         return jsonify({"error": str(e)}), 400
 
 @app.route('/<device_id>/settings/device/reset', methods=['POST'])
@@ -637,7 +1107,7 @@ def reset_device(device_id):
     Topic: <device_id>/settings/device/reset
     """
     try:
-        print(f"🔄 Reset solicitado para {device_id}", flush=True)
+        log.info("🔄 Reset solicitado para %s", device_id)
         
         topic = f"{device_id}/settings/device/reset"
         payload = ""  # Empty payload
@@ -645,48 +1115,37 @@ def reset_device(device_id):
         (result, mid) = mqtt_client.publish(topic, payload, qos=1)
         
         if result == mqtt.MQTT_ERR_SUCCESS:
-            print(f"✅ Comando de reset enviado para {topic} (MID: {mid})", flush=True)
+            log.info("✅ Comando de reset enviado para %s (MID: %s)", topic, mid)
             
             # Limpa cache local do dispositivo
             with config_cache_lock:
                 if device_id in config_cache:
                     del config_cache[device_id]
-                    print(f"🗑️ Cache do dispositivo {device_id} removido", flush=True)
+                    log.info("🗑️ Cache do dispositivo %s removido", device_id)
             
-            # Delete all InfluxDB measurements for this device
+            # Delete all InfluxDB measurements for this device (em background)
+            delete_job = None
             try:
-                delete_api = influx_client.delete_api()
-                start = "1970-01-01T00:00:00Z"
-                stop = "2099-12-31T23:59:59Z"
-                
                 # Delete all measurements tagged with this device_id
-                delete_api.delete(
-                    start=start,
-                    stop=stop,
-                    predicate=f'device_id="{device_id}"',
-                    bucket=INFLUXDB_BUCKET,
-                    org=INFLUXDB_ORG
-                )
-                
-                print(f"🗑️ All InfluxDB data for device '{device_id}' deleted", flush=True)
+                delete_job = _enfileirar_delete(f'device_id="{device_id}"', f"delete data of device '{device_id}'")
+                log.info("🗑️ Delete dos dados de '%s' enfileirado (job %s)", device_id, delete_job['id'])
             except Exception as influx_err:
-                print(f"⚠️ Failed to delete InfluxDB data for device: {influx_err}", flush=True)
+                log.warning("⚠️ Failed to enqueue InfluxDB delete for device: %s", influx_err)
                 # Don't fail the request if InfluxDB delete fails
             
             return jsonify({
                 "status": "reset_sent",
                 "device": device_id,
                 "topic": topic,
-                "message": "Reset command sent to device. All configuration and data cleared."
+                "message": "Reset command sent to device. Configuration cleared; data is being deleted in background.",
+                "delete_job": delete_job
             })
         else:
-            print(f"❌ Erro ao publicar reset no MQTT (Código: {result})", flush=True)
+            log.error("❌ Erro ao publicar reset no MQTT (Código: %s)", result)
             return jsonify({"error": f"MQTT publish failed (code: {result})"}), 500
 
     except Exception as e:
-        print(f"Erro ao processar reset do dispositivo: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        log.exception("Erro ao processar reset do dispositivo: %s", e)
         return jsonify({"error": str(e)}), 400
 
 @app.route('/config/<device_id>', methods=['POST'])
@@ -707,14 +1166,14 @@ def set_config(device_id):
         (result, mid) = mqtt_client.publish(topic, config_json, qos=1) # QoS 1 para garantir entrega
         
         if result == mqtt.MQTT_ERR_SUCCESS:
-            print(f"Publicada nova config para {topic} (MID: {mid})")
+            log.info("Publicada nova config para %s (MID: %s)", topic, mid)
             return jsonify({"status": "config_sent", "device": device_id, "topic": topic})
         else:
-            print(f"Erro ao publicar no MQTT (Código: {result})")
+            log.error("Erro ao publicar no MQTT (Código: %s)", result)
             return jsonify({"error": "Failed to publish to MQTT broker", "code": result}), 500
 
     except Exception as e:
-        print(f"Erro ao processar /config: {e}")
+        log.error("Erro ao processar /config: %s", e)
         return jsonify({"error": str(e)}), 400 # 400 Bad Request
 
 @app.route('/rules', methods=['GET', 'POST', 'PUT', 'DELETE'])
@@ -737,47 +1196,32 @@ def manage_rules():
     elif request.method == 'DELETE':
         return _delete_rule()
 
+def _resposta_snapshot_regras(snapshot):
+    """Serve os bytes do snapshot com ETag; If-None-Match igual responde 304."""
+    response = app.response_class(snapshot['body'], mimetype='application/json')
+    response.set_etag(snapshot['etag'])
+    # O cliente pode guardar, mas deve revalidar (barato: 304 sem corpo)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 def _get_rules():
     """
-    Solicita listagem de todas as regras ao ingestor via MQTT e aguarda resposta.
-    Similar a get_sensors_config().
-    Tópico: rules/get
-    Resposta esperada em: callback/rules
-    Timeout: 5 segundos
+    Lista as regras a partir do snapshot versionado mantido em memória.
+    O ingestor publica o snapshot (retido) em callback/rules sempre que as
+    regras mudam, então a leitura normal não faz nenhuma ida ao MQTT.
+    Suporta ETag / If-None-Match (304 Not Modified).
+    
+    Fallback (nenhum snapshot recebido ainda): publica rules/get e aguarda
+    a resposta em callback/rules por até 5 segundos.
     """
     try:
-        # Primeiro, verifica se temos cache recente (< 10 segundos)
-        with rules_cache_lock:
-            if 'rules' in rules_cache:
-                cache_age = time.time() - rules_cache['rules']['timestamp']
-                if cache_age < 10:  # Cache válido por 10 segundos
-                    print(f"📦 Retornando regras do cache (idade: {cache_age:.1f}s)")
-                    return jsonify(rules_cache['rules']['data'])
-        
-        # Limpa cache antigo
-        with rules_cache_lock:
-            if 'rules' in rules_cache:
-                del rules_cache['rules']
-        
-        # Envia requisição MQTT
-        request_topic = "rules/get"
-        mqtt_client.publish(request_topic, "{}", qos=1)
-        print(f"📤 Solicitação enviada via MQTT: {request_topic}")
-        
-        # Aguarda resposta (polling no cache)
         timeout = 5  # segundos
-        start_time = time.time()
-        
-        while (time.time() - start_time) < timeout:
-            with rules_cache_lock:
-                if 'rules' in rules_cache:
-                    elapsed = time.time() - start_time
-                    print(f"✅ Resposta recebida após {elapsed:.2f}s")
-                    return jsonify(rules_cache['rules']['data'])
-            time.sleep(0.1)  # Aguarda 100ms antes de verificar novamente
+        snapshot = _snapshot_regras(timeout)
+        if snapshot:
+            return _resposta_snapshot_regras(snapshot)
         
         # Timeout - Ingestor não respondeu
-        print(f"⏱️ Timeout aguardando resposta de regras")
+        log.warning("⏱️ Timeout aguardando resposta de regras")
         return jsonify({
             "error": "timeout",
             "message": f"Ingestor não respondeu em {timeout} segundos. Verifique se o serviço está online.",
@@ -785,9 +1229,149 @@ def _get_rules():
         }), 408  # 408 Request Timeout
 
     except Exception as e:
-        print(f"Erro ao solicitar regras: {e}")
+        log.error("Erro ao solicitar regras: %s", e)
         return jsonify({"error": str(e)}), 500
 
+def _snapshot_regras(timeout):
+    """Snapshot de regras em memória; sem nenhum ainda, pede rules/get e espera até 'timeout' s."""
+    with rules_cache_lock:
+        snapshot = rules_cache.get('rules')
+    if snapshot:
+        log.debug("📦 Retornando snapshot de regras v%s", snapshot['version'])
+        return snapshot
+    
+    # Envia requisição MQTT
+    rules_cache_event.clear()
+    request_topic = "rules/get"
+    mqtt_client.publish(request_topic, "{}", qos=1)
+    log.info("📤 Nenhum snapshot de regras em memória. Solicitação enviada via MQTT: %s", request_topic)
+    
+    start_time = time.time()
+    if rules_cache_event.wait(timeout):
+        with rules_cache_lock:
+            snapshot = rules_cache.get('rules')
+        if snapshot:
+            log.info("✅ Snapshot de regras recebido após %.2fs", time.time() - start_time)
+    return snapshot
+
+@app.route('/rules/export')
+def export_rules():
+    """
+    Exporta todas as regras em NDJSON (uma regra por linha), no formato
+    aceito de volta por POST /rules/bulk. Suporta ETag / If-None-Match.
+    """
+    try:
+        snapshot = _snapshot_regras(5)
+        if not snapshot:
+            return jsonify({"error": "timeout", "message": "Ingestor não respondeu. Verifique se o serviço está online."}), 408
+        
+        regras = json.loads(snapshot['body']).get('rules', [])
+        def linhas():
+            for regra in regras:
+                yield json.dumps(regra, ensure_ascii=False) + '\n'
+        
+        response = app.response_class(linhas(), mimetype='application/x-ndjson')
+        response.set_etag(snapshot['etag'])
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Content-Disposition'] = f'attachment; filename="rules-{snapshot["version"]}.ndjson"'
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        log.error("Erro ao exportar regras: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+def _valida_operacao(operacao):
+    """Normaliza uma operação do lote para {"op", "regra"}; retorna (operação, erro)."""
+    if not isinstance(operacao, dict):
+        return None, "operation must be a JSON object"
+    if 'op' not in operacao:
+        # Linha do /rules/export: a própria regra, aplicada como upsert
+        operacao = {"op": "update", "rule": operacao}
+    op, regra = operacao.get('op'), operacao.get('rule')
+    if op not in ('add', 'update', 'delete'):
+        return None, f"invalid op: {op!r} (use add, update or delete)"
+    if not isinstance(regra, dict) or not regra.get('id_regra'):
+        return None, "'rule.id_regra' is required"
+    if op == 'add' and not all(campo in regra for campo in ('condicao', 'entao', 'senao')):
+        return None, "Missing required fields: condicao, entao, senao"
+    if op == 'delete':
+        regra = {"id_regra": regra['id_regra']}
+    return {"op": op, "regra": regra}, None
+
+@app.route('/rules/bulk', methods=['POST'])
+def bulk_rules():
+    """
+    Aplica um lote de operações de regras numa única transação do ingestor:
+    ou todas são aplicadas, ou nenhuma. O ingestor salva o arquivo e publica
+    o snapshot uma vez só e devolve o resultado de cada operação.
+    
+    Body (JSON):
+    {"operations": [{"op": "add", "rule": {...}}, {"op": "update", "rule": {...}},
+                    {"op": "delete", "rule": {"id_regra": "r1"}}]}
+    
+    ou NDJSON (Content-Type: application/x-ndjson), uma operação por linha.
+    Linhas sem 'op' (ex.: a saída de /rules/export) são tratadas como update,
+    que cria a regra se ela não existir.
+    
+    Respostas: 200 aplicado, 400 lote inválido (nada enviado), 409 rejeitado
+    pelo ingestor (nada aplicado), 202 enviado mas sem resposta do ingestor
+    em RULES_BULK_TIMEOUT segundos.
+    """
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            operacoes = [json.loads(linha) for linha in request.get_data(as_text=True).splitlines() if linha.strip()]
+        else:
+            body = request.get_json()
+            operacoes = body.get('operations') if isinstance(body, dict) else body
+        if not isinstance(operacoes, list) or not operacoes:
+            return jsonify({"error": "'operations' must be a non-empty list"}), 400
+        if len(operacoes) > RULES_BULK_MAX:
+            return jsonify({"error": f"Too many operations: {len(operacoes)} (max {RULES_BULK_MAX})"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Invalid body: {e}"}), 400
+    
+    lote, resultados = [], []
+    for i, operacao in enumerate(operacoes):
+        normalizada, erro = _valida_operacao(operacao)
+        if erro:
+            resultados.append({"index": i, "status": "error", "error": erro})
+        else:
+            lote.append(normalizada)
+            resultados.append({"index": i, "op": normalizada['op'], "id_regra": normalizada['regra']['id_regra'], "status": "ok"})
+    if len(lote) != len(operacoes):
+        for r in resultados:
+            if r['status'] == 'ok':
+                r['status'] = 'skipped'
+        return jsonify({"status": "rejected", "results": resultados}), 400
+    
+    id_lote = uuid.uuid4().hex
+    pendente = {"event": threading.Event(), "result": None}
+    with rules_bulk_lock:
+        rules_bulk_pending[id_lote] = pendente
+    try:
+        payload = json.dumps({"id_lote": id_lote, "operacoes": lote})
+        (result, mid) = mqtt_client.publish("rules/bulk", payload, qos=1)
+        if result != mqtt.MQTT_ERR_SUCCESS:
+            return jsonify({"error": f"MQTT publish failed (code: {result})"}), 500
+        log.info("📤 Lote de regras %s enviado (%s operações, %s bytes)", id_lote, len(lote), len(payload))
+        
+        if not pendente['event'].wait(RULES_BULK_TIMEOUT):
+            return jsonify({
+                "status": "sent",
+                "batch_id": id_lote,
+                "message": f"Ingestor não respondeu em {RULES_BULK_TIMEOUT:g} segundos; o lote pode ter sido aplicado."
+            }), 202
+        resposta = pendente['result']
+        return jsonify({
+            "status": "applied" if resposta.get('aplicado') else "rejected",
+            "batch_id": id_lote,
+            "version": resposta.get('versao'),
+            "results": resposta.get('resultados', [])
+        }), 200 if resposta.get('aplicado') else 409
+    finally:
+        with rules_bulk_lock:
+            rules_bulk_pending.pop(id_lote, None)
+
 def _create_rule():
     """
     Cria uma nova regra de automação (pode envolver múltiplos dispositivos).
@@ -925,5 +1509,5 @@ if __name__ == '__main__':
     import sys
     sys.stdout.flush()
     sys.stderr.flush()
-    print("Iniciando API server Flask...", flush=True)
+    log.info("Iniciando API server Flask...")
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False) # debug=True é útil para desenvolvimento
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Redução de séries para gráficos (GET .../read?max_points=N).
+
+Um gráfico só desenha ~1000-2000 pontos; mandar dias de amostras brutas só
+aumenta o payload e o tempo de renderização, e a média por janela
+(?every=) achata os picos. Aqui os pontos (já agrupados por timestamp, como
+get_data devolve) são reduzidos a no máximo N mantendo a forma da curva:
+
+- 'lttb' (padrão): Largest-Triangle-Three-Buckets. Divide a série em N-2
+  baldes e escolhe em cada um o ponto que forma o maior triângulo com o
+  ponto escolhido no balde anterior e a média do balde seguinte. Picos
+  isolados formam triângulos grandes e são preservados.
+- 'minmax': guarda o mínimo e o máximo de cada campo em cada balde. Mantém
+  o envelope exato (nenhum extremo some), à custa de mais pontos por balde.
+
+Sensores multi-campo (joystick, MPU) são reduzidos juntos: a área do
+triângulo é somada entre os campos, cada um normalizado pela sua amplitude,
+para que um campo com escala grande não decida sozinho. Os dois algoritmos
+têm custo linear no número de pontos e devolvem índices, sem copiar a série.
+"""
+
+import math
+
+LTTB = 'lttb'
+MINMAX = 'minmax'
+METODOS = (LTTB, MINMAX)
+MIN_PONTOS = 3
+
+
+def _numerico(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool) and math.isfinite(valor)
+
+
+def _amplitudes(pontos):
+    """{campo: max - min} dos campos numéricos (amplitude 0 vira 1 para não dividir por zero)."""
+    minimos, maximos = {}, {}
+    for p in pontos:
+        for campo, v in p['value'].items():
+            if _numerico(v):
+                if campo not in minimos or v < minimos[campo]:
+                    minimos[campo] = v
+                if campo not in maximos or v > maximos[campo]:
+                    maximos[campo] = v
+    return {campo: (maximos[campo] - minimos[campo]) or 1.0 for campo in minimos}
+
+
+def lttb(pontos, limite, instantes, amplitudes=None):
+    """Índices escolhidos pelo LTTB (sempre inclui o primeiro e o último ponto)."""
+    n = len(pontos)
+    amplitudes = amplitudes or _amplitudes(pontos)
+    campos = list(amplitudes)
+    tam_balde = (n - 2) / (limite - 2)
+    escolhidos = [0]
+    a = 0
+    for i in range(limite - 2):
+        inicio = int(i * tam_balde) + 1
+        fim = int((i + 1) * tam_balde) + 1
+        # Média do balde seguinte (o último balde usa o último ponto)
+        prox_inicio, prox_fim = fim, min(int((i + 2) * tam_balde) + 1, n)
+        if prox_inicio >= prox_fim:
+            prox_inicio, prox_fim = n - 1, n
+        xc = sum(instantes[prox_inicio:prox_fim]) / (prox_fim - prox_inicio)
+        yc = {}
+        for campo in campos:
+            valores = [v for v in (pontos[j]['value'].get(campo) for j in range(prox_inicio, prox_fim)) if _numerico(v)]
+            if valores:
+                yc[campo] = sum(valores) / len(valores)
+
+        xa, va = instantes[a], pontos[a]['value']
+        melhor, melhor_area = inicio, -1.0
+        for j in range(inicio, fim):
+            xb, vb = instantes[j], pontos[j]['value']
+            area = 0.0
+            for campo, media in yc.items():
+                ya, yb = va.get(campo), vb.get(campo)
+                if _numerico(ya) and _numerico(yb):
+                    area += abs((xa - xc) * (yb - ya) - (xa - xb) * (media - ya)) / amplitudes[campo]
+            if area > melhor_area:
+                melhor, melhor_area = j, area
+        escolhidos.append(melhor)
+        a = melhor
+    escolhidos.append(n - 1)
+    return escolhidos
+
+
+def minmax(pontos, limite, amplitudes=None):
+    """Índices dos extremos de cada campo por balde, mais o primeiro e o último ponto."""
+    n = len(pontos)
+    campos = list(amplitudes or _amplitudes(pontos))
+    baldes = max(1, (limite - 2) // (2 * len(campos)))
+    tam_balde = n / baldes
+    escolhidos = {0, n - 1}
+    for i in range(baldes):
+        inicio, fim = int(i * tam_balde), min(int((i + 1) * tam_balde), n)
+        extremos = {}  # campo -> [(min, idx), (max, idx)]
+        for j in range(inicio, fim):
+            for campo, v in pontos[j]['value'].items():
+                if not _numerico(v):
+                    continue
+                e = extremos.get(campo)
+                if e is None:
+                    extremos[campo] = [(v, j), (v, j)]
+                else:
+                    if v < e[0][0]:
+                        e[0] = (v, j)
+                    if v > e[1][0]:
+                        e[1] = (v, j)
+        for (_, i_min), (_, i_max) in extremos.values():
+            escolhidos.add(i_min)
+            escolhidos.add(i_max)
+    return sorted(escolhidos)
+
+
+def reduzir(pontos, limite, metodo=LTTB, instantes=None):
+    """Reduz 'pontos' (ordenados por tempo) a no máximo 'limite' pontos.
+
+    'instantes' são os tempos numéricos de cada ponto (padrão: a posição).
+    Séries que já cabem no limite ou sem nenhum campo numérico (ex.: teclado)
+    voltam inteiras.
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método de redução inválido: {metodo!r} (use {' ou '.join(METODOS)})")
+    if limite < MIN_PONTOS:
+        raise ValueError(f"max_points deve ser pelo menos {MIN_PONTOS}")
+    amplitudes = _amplitudes(pontos)
+    if len(pontos) <= limite or not amplitudes:
+        return pontos
+    if instantes is None:
+        instantes = range(len(pontos))
+    if metodo == LTTB or limite < 2 * len(amplitudes) + 2:
+        # minmax precisa de 2 pontos por campo por balde: abaixo disso só o LTTB cabe no limite
+        indices = lttb(pontos, limite, instantes, amplitudes)
+    else:
+        indices = minmax(pontos, limite, amplitudes)
+    return [pontos[i] for i in indices]
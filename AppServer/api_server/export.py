@@ -0,0 +1,408 @@
+"""
+Exportação de séries do InfluxDB para arquivos Arrow IPC ou Parquet (análise offline).
+
+Em vez de raspar o JSON de /read, o analista pede um dispositivo, sensores e
+intervalo (POST /exports) e baixa arquivos colunares comprimidos depois:
+
+- Roda como job em background (jobs.FilaDeJobs), fora do caminho dos requests.
+- O intervalo é lido em faixas de tempo fixas (query_stream, sem carregar a
+  faixa inteira) e os registros vão para buffers por coluna, despejados em
+  lotes de no máximo 'lote_linhas' linhas: a memória não depende do tamanho
+  da exportação.
+- Cada faixa vira um arquivo 'part-NNNNN' no diretório da exportação, escrito
+  com nome temporário e renomeado no fim; o manifest.json registra as faixas
+  concluídas. Se a API reiniciar ou o job falhar, pedir a mesma exportação de
+  novo (ou POST /exports/<id>/resume) continua da primeira faixa pendente.
+- O id da exportação é um hash do pedido: pedidos iguais caem no mesmo
+  diretório.
+
+Formato longo, uma linha por campo de cada amostra (funciona para qualquer
+tipo de sensor e para os dois layouts de INFLUX_SCHEMA):
+
+    time (timestamp ns UTC), device_id, sensor_id, sensor_type, field
+    (dicionário), value (float64) e value_text (texto, ex.: teclado)
+
+O pyarrow só é importado quando uma exportação roda: sem ele a API continua
+funcionando e POST /exports responde 503.
+"""
+
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import influx_schema
+from timerange import parse_instante, relativo
+
+log = logging.getLogger('api.export')
+
+EXTENSOES = {'parquet': '.parquet', 'arrow': '.arrow'}
+COMPRESSOES = {
+    'parquet': ('zstd', 'snappy', 'gzip', 'lz4', 'none'),
+    'arrow': ('zstd', 'lz4', 'none'),  # o IPC do Arrow só comprime buffers com zstd ou lz4
+}
+MANIFESTO = 'manifest.json'
+COLUNAS = ('time', 'device_id', 'sensor_id', 'sensor_type', 'field', 'value', 'value_text')
+
+
+class ExportacaoIndisponivel(RuntimeError):
+    """pyarrow não está instalado."""
+
+
+def disponivel():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ExportacaoIndisponivel("pyarrow não está instalado (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _schema(pa, formato):
+    # O formato de arquivo Arrow IPC não aceita trocar o dicionário entre lotes (cada lote
+    # montaria o seu): lá os textos vão sem dicionário e a compressão cuida das repetições.
+    # No Parquet cada row group tem o seu dicionário, então a codificação fica.
+    texto = pa.dictionary(pa.int32(), pa.string()) if formato == 'parquet' else pa.string()
+    return pa.schema([
+        ('time', pa.timestamp('ns', tz='UTC')),
+        ('device_id', texto),
+        ('sensor_id', texto),
+        ('sensor_type', texto),
+        ('field', texto),
+        ('value', pa.float64()),
+        ('value_text', pa.string()),
+    ])
+
+
+def _iso(instante):
+    return instante.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _lista_de_textos(valor, nome):
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        valor = [valor]
+    if not isinstance(valor, list) or not all(isinstance(v, (str, int)) for v in valor):
+        raise ValueError(f"'{nome}' deve ser uma lista de textos")
+    return sorted({str(v) for v in valor}) or None
+
+
+def normalizar_pedido(dados, agora=None):
+    """Valida o corpo de POST /exports e devolve o pedido canônico (ValueError se inválido)."""
+    if not isinstance(dados, dict):
+        raise ValueError("Corpo deve ser um objeto JSON")
+    device_id = dados.get('device')
+    if not device_id or not isinstance(device_id, str):
+        raise ValueError("'device' é obrigatório")
+    formato = dados.get('format', 'parquet')
+    if formato not in EXTENSOES:
+        raise ValueError(f"'format' deve ser {' ou '.join(EXTENSOES)}")
+    compressao = dados.get('compression', 'zstd')
+    if compressao not in COMPRESSOES[formato]:
+        raise ValueError(f"'compression' para {formato} deve ser um de: {', '.join(COMPRESSOES[formato])}")
+    if 'start' not in dados:
+        raise ValueError("'start' é obrigatório (RFC3339 ou relativo, ex.: -30d)")
+    inicio_txt, fim_txt = str(dados['start']), str(dados.get('stop', 'now'))
+    agora = agora or datetime.now(timezone.utc)
+    inicio, fim = parse_instante(inicio_txt, agora), parse_instante(fim_txt, agora)
+    if inicio >= fim:
+        raise ValueError("'start' deve ser anterior a 'stop'")
+    return {
+        'device': device_id,
+        'sensors': _lista_de_textos(dados.get('sensors'), 'sensors'),
+        'fields': _lista_de_textos(dados.get('fields'), 'fields'),
+        'start': inicio_txt,
+        'stop': fim_txt,
+        'format': formato,
+        'compression': compressao,
+        # Instantes resolvidos: intervalos relativos ficam fixos a partir do primeiro pedido
+        '_inicio': _iso(inicio),
+        '_fim': _iso(fim),
+        '_relativo': relativo(inicio_txt) or relativo(fim_txt),
+    }
+
+
+def id_da_exportacao(pedido):
+    """Hash dos parâmetros do pedido (sem os instantes resolvidos)."""
+    chave = json.dumps({k: v for k, v in pedido.items() if not k.startswith('_')}, sort_keys=True)
+    return hashlib.sha1(chave.encode('utf-8')).hexdigest()[:16]
+
+
+def _diretorio(base, export_id):
+    return os.path.join(base, export_id)
+
+
+def ler_manifesto(base, export_id):
+    try:
+        with open(os.path.join(_diretorio(base, export_id), MANIFESTO)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _gravar_manifesto(base, manifesto):
+    manifesto['updated_at'] = time.time()
+    caminho = os.path.join(_diretorio(base, manifesto['id']), MANIFESTO)
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w') as f:
+        json.dump(manifesto, f, indent=2)
+    os.replace(temporario, caminho)
+
+
+def listar(base):
+    if not os.path.isdir(base):
+        return []
+    manifestos = (ler_manifesto(base, nome) for nome in sorted(os.listdir(base)))
+    return sorted((m for m in manifestos if m), key=lambda m: m['created_at'])
+
+
+def remover(base, export_id):
+    shutil.rmtree(_diretorio(base, export_id), ignore_errors=True)
+
+
+def faixas(manifesto):
+    """[(inicio, fim)] das faixas de tempo da exportação, do passado para o presente."""
+    inicio = datetime.fromisoformat(manifesto['start'].replace('Z', '+00:00'))
+    fim = datetime.fromisoformat(manifesto['stop'].replace('Z', '+00:00'))
+    passo = timedelta(seconds=manifesto['chunk_seconds'])
+    resultado = []
+    while inicio < fim:
+        resultado.append((inicio, min(inicio + passo, fim)))
+        inicio += passo
+    return resultado
+
+
+class _Colunas:
+    """Buffers por coluna de um lote em construção."""
+
+    def __init__(self):
+        self.limpar()
+
+    def limpar(self):
+        self.dados = {nome: [] for nome in COLUNAS}
+
+    def __len__(self):
+        return len(self.dados['time'])
+
+    def adicionar(self, ts_ns, device_id, sensor_id, sensor_type, campo, valor):
+        d = self.dados
+        d['time'].append(ts_ns)
+        d['device_id'].append(device_id)
+        d['sensor_id'].append(sensor_id)
+        d['sensor_type'].append(sensor_type)
+        d['field'].append(campo)
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            d['value'].append(float(valor))
+            d['value_text'].append(None)
+        else:
+            d['value'].append(None)
+            d['value_text'].append(None if valor is None else str(valor))
+
+    def lote(self, pa, schema):
+        arrays = [pa.array(self.dados[nome], type=campo.type.value_type).dictionary_encode()
+                  if pa.types.is_dictionary(campo.type) else pa.array(self.dados[nome], type=campo.type)
+                  for nome, campo in zip(COLUNAS, schema)]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Escritor:
+    """Arquivo de uma faixa: Parquet (um row group por lote) ou Arrow IPC (formato de arquivo)."""
+
+    def __init__(self, pa, schema, caminho, formato, compressao):
+        compressao = None if compressao == 'none' else compressao
+        if formato == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(caminho, schema, compression=compressao or 'none')
+            self._escrever = lambda lote: self._writer.write_table(pa.Table.from_batches([lote]))
+        else:
+            self._sink = pa.OSFile(caminho, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, schema,
+                                           options=pa.ipc.IpcWriteOptions(compression=compressao))
+            self._escrever = self._writer.write_batch
+
+    def escrever(self, lote):
+        self._escrever(lote)
+
+    def fechar(self):
+        self._writer.close()
+        if hasattr(self, '_sink'):
+            self._sink.close()
+
+
+def _flux(bucket, schema, pedido, inicio, fim):
+    partes = [f'from(bucket: "{bucket}")', f'|> range(start: {_iso(inicio)}, stop: {_iso(fim)})']
+    partes += influx_schema.filtros_flux_do_dispositivo(schema, pedido['device'], pedido['sensors'])
+    if pedido['fields']:
+        cond = ' or '.join(f'r["_field"] == "{c}"' for c in pedido['fields'])
+        partes.append(f'|> filter(fn: (r) => {cond})')
+    # Só as colunas usadas (colunas inexistentes no layout são ignoradas pelo keep)
+    partes.append('|> keep(columns: ["_time", "_value", "_field", "_measurement", "device_id", "sensor_id", "sensor_type"])')
+    return '\n'.join(partes)
+
+
+def exportar_faixa(pa, query_api, org, bucket, schema, manifesto, inicio, fim, caminho, lote_linhas):
+    """Lê uma faixa e grava 'caminho'. Retorna o número de linhas (0 = nada gravado)."""
+    arrow_schema = _schema(pa, manifesto['format'])
+    colunas = _Colunas()
+    escritor = None
+    linhas = 0
+    flux = _flux(bucket, schema, manifesto['request'], inicio, fim)
+    try:
+        for registro in query_api.query_stream(org=org, query=flux):
+            instante = registro.get_time()
+            ts_ns = int(instante.timestamp()) * 1_000_000_000 + instante.microsecond * 1000
+            sensor_id, sensor_type = influx_schema.sensor_do_registro(schema, registro)
+            colunas.adicionar(ts_ns, registro.values.get('device_id'), sensor_id, sensor_type,
+                              registro.get_field(), registro.get_value())
+            if len(colunas) >= lote_linhas:
+                escritor = escritor or _Escritor(pa, arrow_schema, caminho, manifesto['format'], manifesto['compression'])
+                escritor.escrever(colunas.lote(pa, arrow_schema))
+                linhas += len(colunas)
+                colunas.limpar()
+        if len(colunas):
+            escritor = escritor or _Escritor(pa, arrow_schema, caminho, manifesto['format'], manifesto['compression'])
+            escritor.escrever(colunas.lote(pa, arrow_schema))
+            linhas += len(colunas)
+    finally:
+        if escritor is not None:
+            escritor.fechar()
+    return linhas
+
+
+def _nome_da_parte(manifesto, indice):
+    return f"part-{indice:05d}{EXTENSOES[manifesto['format']]}"
+
+
+def submeter_exportacao(fila, query_api, bucket, org, schema, base, pedido, chunk, lote_linhas):
+    """Cria (ou retoma) a exportação e enfileira o job. Retorna (manifesto, job ou None).
+
+    Exportação já concluída não gera job novo. Pedido relativo (ex.: start=-7d)
+    já concluído recomeça do zero, com o intervalo resolvido agora.
+    """
+    export_id = id_da_exportacao(pedido)
+    manifesto = ler_manifesto(base, export_id)
+    if manifesto is not None and manifesto['status'] == 'done':
+        if not pedido['_relativo']:
+            return manifesto, None
+        remover(base, export_id)
+        manifesto = None
+    if manifesto is None:
+        os.makedirs(_diretorio(base, export_id), exist_ok=True)
+        manifesto = {
+            'id': export_id,
+            'request': {k: v for k, v in pedido.items() if not k.startswith('_')},
+            'start': pedido['_inicio'],
+            'stop': pedido['_fim'],
+            'format': pedido['format'],
+            'compression': pedido['compression'],
+            'chunk_seconds': chunk.total_seconds(),
+            'status': 'queued',
+            'chunks_done': 0,
+            'chunks_total': None,
+            'rows': 0,
+            'bytes': 0,
+            'parts': [],
+            'error': None,
+            'created_at': time.time(),
+        }
+        manifesto['chunks_total'] = len(faixas(manifesto))
+        _gravar_manifesto(base, manifesto)
+
+    def executar(job):
+        pa = _pyarrow()
+        m = ler_manifesto(base, export_id)
+        lista = faixas(m)
+        job.total = len(lista)
+        job.progresso = m['chunks_done']
+        m['status'], m['error'] = 'running', None
+        _gravar_manifesto(base, m)
+        if m['chunks_done']:
+            log.info("⏯️ Exportação %s retomada na faixa %s/%s", export_id, m['chunks_done'] + 1, len(lista))
+        try:
+            for indice in range(m['chunks_done'], len(lista)):
+                inicio, fim = lista[indice]
+                nome = _nome_da_parte(m, indice)
+                caminho = os.path.join(_diretorio(base, export_id), nome)
+                linhas = exportar_faixa(pa, query_api, org, bucket, schema, m, inicio, fim, caminho + '.tmp',
+                                        lote_linhas)
+                if linhas:
+                    os.replace(caminho + '.tmp', caminho)
+                    tamanho = os.path.getsize(caminho)
+                    m['parts'].append({'file': nome, 'start': _iso(inicio), 'stop': _iso(fim),
+                                       'rows': linhas, 'bytes': tamanho})
+                    m['rows'] += linhas
+                    m['bytes'] += tamanho
+                m['chunks_done'] = indice + 1
+                _gravar_manifesto(base, m)
+                job.progresso = indice + 1
+                log.debug("📦 Exportação %s: faixa %s/%s, %s linhas", export_id, indice + 1, len(lista), linhas)
+            if not m['parts']:
+                # Sem dados no intervalo: um arquivo vazio (só o schema) para o download funcionar igual
+                nome = _nome_da_parte(m, 0)
+                escritor = _Escritor(pa, _schema(pa, m['format']), os.path.join(_diretorio(base, export_id), nome),
+                                     m['format'], m['compression'])
+                escritor.fechar()
+                m['parts'].append({'file': nome, 'start': m['start'], 'stop': m['stop'], 'rows': 0,
+                                   'bytes': os.path.getsize(os.path.join(_diretorio(base, export_id), nome))})
+            m['status'] = 'done'
+        except Exception as e:
+            m['status'], m['error'] = 'failed', str(e)
+            raise
+        finally:
+            _gravar_manifesto(base, m)
+        return {'export_id': export_id, 'rows': m['rows'], 'bytes': m['bytes'], 'parts': len(m['parts'])}
+
+    descricao = f"export {pedido['device']} {manifesto['start']} → {manifesto['stop']} ({pedido['format']})"
+    job, _ = fila.submeter('export', f"export:{export_id}", descricao, executar)
+    return manifesto, job
+
+
+def arquivos(base, manifesto):
+    """[(caminho, nome)] das partes de uma exportação concluída."""
+    diretorio = _diretorio(base, manifesto['id'])
+    return [(os.path.join(diretorio, p['file']), p['file']) for p in manifesto['parts']]
+
+
+class _Saida(io.RawIOBase):
+    """Destino não posicionável do zip: acumula os bytes até o gerador entregá-los."""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def coletar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def zip_em_streaming(lista, bloco=1 << 20):
+    """Gera um .zip (sem recompressão: as partes já são comprimidas) em pedaços, sem arquivo temporário."""
+    saida = _Saida()
+    with zipfile.ZipFile(saida, 'w', zipfile.ZIP_STORED, allowZip64=True) as destino:
+        for caminho, nome in lista:
+            with open(caminho, 'rb') as origem, destino.open(nome, 'w', force_zip64=True) as entrada:
+                while True:
+                    dados = origem.read(bloco)
+                    if not dados:
+                        break
+                    entrada.write(dados)
+                    yield saida.coletar()
+    yield saida.coletar()
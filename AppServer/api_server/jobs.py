@@ -0,0 +1,173 @@
+"""
+Fila de jobs em background da API (operações demoradas fora do request).
+
+Usada para os deletes no InfluxDB (remoção de sensor, reset de dispositivo,
+limpeza do bucket): o request só enfileira o job e responde 202 com o id;
+o andamento é consultado em GET /jobs/<id>.
+
+- Concorrência limitada (ThreadPoolExecutor com poucos workers), para que
+  manutenção destrutiva nunca ocupe todos os workers do Flask nem o InfluxDB.
+- Deduplicação por escopo: pedir de novo o mesmo delete enquanto o anterior
+  está na fila ou rodando devolve o job existente.
+- Deletes são quebrados em faixas de tempo, do presente para o passado, com
+  janelas que dobram de tamanho (dados recentes são densos, antigos esparsos).
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+log = logging.getLogger('api.jobs')
+
+# Limites de tempo usados pelos deletes "de tudo" (mesmos valores de antes)
+INICIO_DOS_TEMPOS = datetime(1970, 1, 1, tzinfo=timezone.utc)
+FIM_DOS_TEMPOS = datetime(2099, 12, 31, 23, 59, 59, tzinfo=timezone.utc)
+
+
+def faixas_de_tempo(primeira_janela=timedelta(hours=24), agora=None,
+                    inicio=INICIO_DOS_TEMPOS, fim=FIM_DOS_TEMPOS):
+    """Divide [inicio, fim] em faixas do presente para o passado, dobrando a janela.
+
+    A primeira faixa vai de (agora - primeira_janela) até 'fim' (inclui
+    qualquer ponto com timestamp no futuro). Para 56 anos com janela inicial
+    de 1 dia são ~16 faixas.
+    """
+    agora = agora or datetime.now(timezone.utc)
+    faixas = []
+    limite_superior = fim
+    corte = max(agora - primeira_janela, inicio)
+    janela = primeira_janela
+    while True:
+        faixas.append((corte, limite_superior))
+        if corte <= inicio:
+            return faixas
+        limite_superior = corte
+        janela *= 2
+        corte = max(corte - janela, inicio)
+
+
+def _iso(instante):
+    return instante.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class Job:
+    """Estado de um job; só os workers da fila alteram os campos depois de criado."""
+
+    def __init__(self, tipo, escopo, descricao):
+        self.id = uuid.uuid4().hex[:12]
+        self.tipo = tipo
+        self.escopo = escopo
+        self.descricao = descricao
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.progresso = 0
+        self.total = None
+        self.erro = None
+        self.resultado = None
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.finalizado_em = None
+
+    @property
+    def ativo(self):
+        return self.status in ('queued', 'running')
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "type": self.tipo,
+            "scope": self.escopo,
+            "description": self.descricao,
+            "status": self.status,
+            "progress": self.progresso,
+            "total": self.total,
+            "error": self.erro,
+            "result": self.resultado,
+            "created_at": self.criado_em,
+            "started_at": self.iniciado_em,
+            "finished_at": self.finalizado_em,
+        }
+
+
+class FilaDeJobs:
+    def __init__(self, max_workers=1, max_historico=200):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='api-job')
+        self._lock = threading.Lock()
+        self._jobs = {}  # id -> Job (em ordem de criação)
+        self._ativos_por_escopo = {}  # escopo -> Job na fila ou rodando
+        self.max_historico = max_historico
+
+    def submeter(self, tipo, escopo, descricao, executar):
+        """Enfileira 'executar(job)' e retorna (job, novo).
+
+        Se já existe um job ativo para o mesmo escopo, retorna esse job e
+        novo=False em vez de enfileirar outro.
+        """
+        with self._lock:
+            existente = self._ativos_por_escopo.get(escopo)
+            if existente is not None and existente.ativo:
+                log.info("♻️ Job %s já cobre o escopo %s (%s)", existente.id, escopo, existente.status)
+                return existente, False
+            job = Job(tipo, escopo, descricao)
+            self._jobs[job.id] = job
+            self._ativos_por_escopo[escopo] = job
+            self._podar()
+        self._executor.submit(self._rodar, job, executar)
+        log.info("📥 Job %s enfileirado: %s", job.id, descricao)
+        return job, True
+
+    def obter(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def listar(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def ativo(self, escopo):
+        """Job na fila ou rodando para o escopo, ou None."""
+        with self._lock:
+            job = self._ativos_por_escopo.get(escopo)
+            return job if job is not None and job.ativo else None
+
+    def _rodar(self, job, executar):
+        job.status = 'running'
+        job.iniciado_em = time.time()
+        try:
+            job.resultado = executar(job)
+            job.status = 'done'
+            log.info("✅ Job %s concluído em %.1fs: %s", job.id, time.time() - job.iniciado_em, job.descricao)
+        except Exception as e:
+            job.erro = str(e)
+            job.status = 'failed'
+            log.exception("❌ Job %s falhou: %s", job.id, e)
+        finally:
+            job.finalizado_em = time.time()
+            with self._lock:
+                if self._ativos_por_escopo.get(job.escopo) is job:
+                    del self._ativos_por_escopo[job.escopo]
+
+    def _podar(self):
+        """Descarta os jobs finalizados mais antigos além de max_historico (chamado com o lock)."""
+        excedente = len(self._jobs) - self.max_historico
+        if excedente <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if not j.ativo][:excedente]:
+            del self._jobs[job_id]
+
+
+def submeter_delete(fila, delete_api, bucket, org, predicate, descricao, primeira_janela=timedelta(hours=24)):
+    """Enfileira um delete no InfluxDB quebrado em faixas de tempo. Retorna (job, novo)."""
+
+    def executar(job):
+        faixas = faixas_de_tempo(primeira_janela)
+        job.total = len(faixas)
+        for inicio, fim in faixas:
+            delete_api.delete(start=_iso(inicio), stop=_iso(fim), predicate=predicate, bucket=bucket, org=org)
+            job.progresso += 1
+            log.debug("🗑️ Job %s: faixa %s/%s (%s → %s)", job.id, job.progresso, job.total, _iso(inicio), _iso(fim))
+        return {"bucket": bucket, "predicate": predicate, "ranges": job.total}
+
+    return fila.submeter('influx_delete', f"delete:{bucket}:{predicate}", descricao, executar)
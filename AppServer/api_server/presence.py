@@ -0,0 +1,146 @@
+"""
+Registro de presença dos dispositivos na API.
+
+Alimentado pelo tráfego MQTT que a API já recebe (ou assina só para isso):
+- qualquer mensagem do dispositivo (dados, heartbeat, respostas) marca
+  "visto agora";
+- o status retido em 'device/<id>/status' ("online"/"offline", este último
+  publicado pelo broker como LWT quando a conexão cai) muda o estado na hora;
+- o tempo de resposta de cada requisição alimenta um RTT suavizado.
+
+Estados: 'online', 'offline' (LWT recebido ou sem tráfego há mais de
+'offline_apos' segundos) e 'unknown' (nunca visto desde que a API subiu).
+Requisições a dispositivos 'offline' falham na hora; 'unknown' continua com
+o timeout padrão, para não recusar dispositivos só porque a API reiniciou.
+
+O timeout adaptativo segue o RTO do TCP (RFC 6298): srtt + 4 * rttvar,
+limitado entre 'timeout_minimo' e o timeout padrão do endpoint.
+
+Os registros ficam num devicestate.CacheDeDispositivos: no máximo
+'max_dispositivos' (sai o sem tráfego há mais tempo) e sem os que estão
+mudos há mais de 'ocioso_apos' s, que voltam a 'unknown'.
+"""
+
+import threading
+import time
+
+import devicestate
+
+ONLINE = 'online'
+OFFLINE = 'offline'
+DESCONHECIDO = 'unknown'
+
+
+class _Dispositivo:
+    __slots__ = ('visto', 'status', 'srtt', 'rttvar', 'respostas', 'timeouts')
+
+    def __init__(self):
+        self.visto = None
+        self.status = None  # último status explícito (LWT / device/<id>/status)
+        self.srtt = None
+        self.rttvar = None
+        self.respostas = 0
+        self.timeouts = 0
+
+
+class RegistroDePresenca:
+    def __init__(self, offline_apos=35.0, timeout_minimo=1.0, max_dispositivos=0, ocioso_apos=0.0):
+        self.offline_apos = offline_apos
+        self.timeout_minimo = timeout_minimo
+        self._dispositivos = devicestate.CacheDeDispositivos(max_dispositivos, ocioso_apos)
+        self._lock = threading.Lock()
+
+    def _dispositivo(self, device_id):
+        """Registro do dispositivo, criado se preciso e marcado como o mais recente."""
+        d = self._dispositivos.get(device_id)
+        if d is None:
+            d = self._dispositivos[device_id] = _Dispositivo()
+        else:
+            self._dispositivos.tocar(device_id)
+        return d
+
+    def visto(self, device_id, agora=None):
+        """Tráfego do dispositivo (caminho quente: chamado a cada mensagem de dados)."""
+        agora = agora or time.time()
+        with self._lock:
+            d = self._dispositivo(device_id)
+            d.visto = agora
+            if d.status == OFFLINE:
+                d.status = ONLINE  # voltou a falar depois do LWT
+
+    def status(self, device_id, online, agora=None):
+        agora = agora or time.time()
+        with self._lock:
+            d = self._dispositivo(device_id)
+            d.status = ONLINE if online else OFFLINE
+            if online:
+                d.visto = agora
+
+    def resposta(self, device_id, rtt, agora=None):
+        """Resposta a uma requisição: atualiza o RTT suavizado (RFC 6298)."""
+        with self._lock:
+            d = self._dispositivo(device_id)
+            d.visto = agora or time.time()
+            d.respostas += 1
+            d.timeouts = 0
+            if d.srtt is None:
+                d.srtt, d.rttvar = rtt, rtt / 2
+            else:
+                d.rttvar = 0.75 * d.rttvar + 0.25 * abs(d.srtt - rtt)
+                d.srtt = 0.875 * d.srtt + 0.125 * rtt
+
+    def sem_resposta(self, device_id):
+        # Timeout não é atividade: não adia a expulsão de um dispositivo que sumiu
+        with self._lock:
+            d = self._dispositivos.get(device_id)
+            if d is None:
+                d = self._dispositivos[device_id] = _Dispositivo()
+            d.timeouts += 1
+
+    def estado(self, device_id, agora=None):
+        agora = agora or time.time()
+        with self._lock:
+            d = self._dispositivos.get(device_id)
+            if d is None or (d.visto is None and d.status is None):
+                return DESCONHECIDO
+            if d.status == OFFLINE:
+                return OFFLINE
+            if d.visto is not None and agora - d.visto > self.offline_apos:
+                return OFFLINE
+            return ONLINE
+
+    def timeout(self, device_id, padrao):
+        """Timeout para esperar a resposta do dispositivo: RTO adaptativo ou 'padrao' sem histórico."""
+        with self._lock:
+            d = self._dispositivos.get(device_id)
+            if d is None or d.srtt is None:
+                return padrao
+            rto = d.srtt + 4 * d.rttvar
+        return min(padrao, max(self.timeout_minimo, rto))
+
+    def dispositivos(self):
+        with self._lock:
+            return list(self._dispositivos)
+
+    def info(self, device_id, agora=None):
+        agora = agora or time.time()
+        estado = self.estado(device_id, agora)
+        with self._lock:
+            d = self._dispositivos.get(device_id) or _Dispositivo()
+            return {
+                "state": estado,
+                "last_seen": d.visto,
+                "seconds_since_seen": round(agora - d.visto, 1) if d.visto else None,
+                "rtt": round(d.srtt, 3) if d.srtt is not None else None,
+                "rttvar": round(d.rttvar, 3) if d.rttvar is not None else None,
+                "responses": d.respostas,
+                "consecutive_timeouts": d.timeouts,
+            }
+
+    def estatisticas(self):
+        with self._lock:
+            return self._dispositivos.estatisticas()
+
+    def to_dict(self, agora=None):
+        agora = agora or time.time()
+        return {device_id: self.info(device_id, agora) for device_id in self.dispositivos()}
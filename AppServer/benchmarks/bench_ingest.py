@@ -0,0 +1,301 @@
+"""
+Benchmark ponta a ponta do ingestor (ingestor/main.py).
+
+Sobe localmente um broker MQTT fake (ou usa um broker real com --broker), um
+InfluxDB fake e a API fake, roda o ingestor real como subprocesso e injeta
+tráfego sintético no formato do firmware.
+
+Relata:
+- mensagens/s sustentadas (amostras que chegaram ao InfluxDB fake)
+- latência p50/p99 amostra → escrita
+- crescimento de memória (RSS) do(s) processo(s) do ingestor
+- custo da avaliação de regras por amostra em função do número de regras
+
+Uso (a partir de AppServer/benchmarks):
+    python bench_ingest.py --messages 20000 --devices 50
+    python bench_ingest.py --messages 20000 --rate 2000 --rules 200
+    python bench_ingest.py --messages 20000 --instances 3   # modo cluster ($share)
+    python bench_ingest.py --rules-only --rule-counts 0,10,100,1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import aiomqtt
+
+from fake_broker import FakeBroker
+from fakes import FakeApi, FakeInflux
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+APPSERVER = os.path.dirname(AQUI)
+INGESTOR_DIR = os.path.join(APPSERVER, 'ingestor')
+COMMON_DIR = os.path.join(APPSERVER, 'common')
+
+DHT_11 = 9
+
+
+def percentil(valores, p):
+    if not valores:
+        return float('nan')
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, int(round(p / 100.0 * (len(ordenados) - 1)))))
+    return ordenados[k]
+
+
+def rss_kb(pid):
+    """RSS atual de um processo (Linux)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for linha in f:
+                if linha.startswith('VmRSS:'):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_total_kb(procs):
+    valores = [rss_kb(p.pid) for p in procs]
+    return None if None in valores else sum(valores)
+
+
+def payload_amostra(device_id, sensor_id, seq):
+    """Amostra de DHT11 no formato do firmware, com 'seq' para medir latência."""
+    return json.dumps({
+        "device_id": device_id,
+        "sensor_id": sensor_id,
+        "type": DHT_11,
+        "values": {
+            "temperature": round(random.uniform(15.0, 35.0), 2),
+            "humidity": round(random.uniform(30.0, 80.0), 2),
+            "seq": seq,
+        },
+        "timestamp": time.time(),
+    })
+
+
+def regras_sinteticas(n, devices, sensores_por_device):
+    """N regras 'limite' espalhadas pelos sensores do tráfego, sem ações (não geram HTTP)."""
+    regras = {}
+    for i in range(n):
+        d = i % devices
+        regras[f"bench_{i}"] = {
+            "id_regra": f"bench_{i}",
+            "condicao": [{
+                "tipo": "limite",
+                "id_device": f"bench_dev_{d}",
+                "id_sensor": (i // devices) % sensores_por_device,
+                "medida": "temperature",
+                "operador": ">",
+                "valor_limite": 15.0 + (i * 7.3) % 20.0,
+                "tempo": 0,
+            }],
+            "entao": [],
+            "senao": [],
+        }
+    return regras
+
+
+async def _publicar(host, porta, args, inicio_seq, total, enviados):
+    async with aiomqtt.Client(hostname=host, port=porta, identifier=f"bench_pub_{os.getpid()}") as client:
+        t0 = time.perf_counter()
+        for i in range(total):
+            seq = inicio_seq + i
+            d = seq % args.devices
+            s = (seq // args.devices) % args.sensors
+            enviados[seq] = time.time()
+            await client.publish(f"bench_dev_{d}/sensors/{s}/data", payload_amostra(f"bench_dev_{d}", s, seq))
+            if args.rate and i % 50 == 0:
+                atraso = t0 + (i + 1) / args.rate - time.perf_counter()
+                if atraso > 0:
+                    await asyncio.sleep(atraso)
+
+
+async def bench_pipeline(args):
+    broker = None
+    if args.broker:
+        host, _, porta = args.broker.partition(':')
+        porta = int(porta or 1883)
+    else:
+        broker = await FakeBroker().iniciar()
+        host, porta = broker.host, broker.porta
+    influx = await FakeInflux(atraso=args.influx_delay).iniciar()
+    api = await FakeApi().iniciar()
+
+    workdir = tempfile.mkdtemp(prefix='bench_ingest_')
+    with open(os.path.join(workdir, 'rules_config.json'), 'w') as f:
+        json.dump(regras_sinteticas(args.rules, args.devices, args.sensors), f)
+
+    env = dict(os.environ,
+               INFLUXDB_URL=influx.url, INFLUXDB_TOKEN='bench', INFLUXDB_ORG='bench', INFLUXDB_BUCKET='bench',
+               MQTT_BROKER_HOST=host, MQTT_BROKER_PORT=str(porta), API_SERVER_URL=api.url,
+               METRICS_PORT='0', LOG_LEVEL=args.log_level, INGESTOR_INSTANCES=str(args.instances),
+               PYTHONPATH=os.pathsep.join([COMMON_DIR, INGESTOR_DIR]))
+    procs = [
+        await asyncio.create_subprocess_exec(sys.executable, '-u', os.path.join(INGESTOR_DIR, 'main.py'),
+                                             cwd=workdir, env=dict(env, INGESTOR_INSTANCE_ID=str(k)))
+        for k in range(args.instances)
+    ]
+    enviados = {}
+    try:
+        # Aquecimento: espera o ingestor assinar e a primeira amostra chegar ao Influx fake
+        limite = time.time() + 30
+        seq = -1
+        while not influx.chegadas and time.time() < limite:
+            await _publicar(host, porta, args, seq, 1, enviados)
+            seq -= 1
+            await asyncio.sleep(0.2)
+        if not influx.chegadas:
+            raise RuntimeError("O ingestor não gravou nenhuma amostra em 30 s (veja o log acima)")
+
+        # No cluster, espera todas as instâncias assinarem antes de medir
+        if args.instances > 1 and broker:
+            while sum(1 for s in broker.sessoes if any(f.startswith('$share/') for f in s.filtros)) < args.instances:
+                if time.time() > limite:
+                    raise RuntimeError("Nem todas as instâncias do ingestor assinaram em 30 s")
+                await asyncio.sleep(0.1)
+
+        rss_inicio = rss_total_kb(procs)
+        rss_pico = rss_inicio or 0
+        inicio = time.time()
+        publicador = asyncio.create_task(_publicar(host, porta, args, 0, args.messages, enviados))
+
+        limite = None
+        while True:
+            await asyncio.sleep(0.2)
+            rss_pico = max(rss_pico, rss_total_kb(procs) or 0)
+            recebidos = sum(1 for s in influx.chegadas if s >= 0)
+            if publicador.done():
+                publicador.result()
+                limite = limite or time.time() + args.drain_timeout
+                if recebidos >= args.messages or time.time() > limite:
+                    break
+            for proc in procs:
+                if proc.returncode is not None:
+                    raise RuntimeError(f"O ingestor terminou com código {proc.returncode}")
+        fim_publicacao = max(enviados[s] for s in range(args.messages))
+        rss_fim = rss_total_kb(procs)
+    finally:
+        for proc in procs:
+            if proc.returncode is None:
+                proc.terminate()
+                await proc.wait()
+        await api.parar()
+        await influx.parar()
+        if broker:
+            await broker.parar()
+
+    chegadas = {s: t for s, t in influx.chegadas.items() if s >= 0}
+    latencias = [chegadas[s] - enviados[s] for s in chegadas]
+    ultimo = max(chegadas.values()) if chegadas else inicio
+    duracao = max(ultimo - inicio, 1e-9)
+    return {
+        "instances": args.instances,
+        "messages_sent": args.messages,
+        "messages_written": len(chegadas),
+        "publish_rate_msgs_per_s": args.messages / max(fim_publicacao - inicio, 1e-9),
+        "sustained_msgs_per_s": len(chegadas) / duracao,
+        "latency_p50_ms": percentil(latencias, 50) * 1000,
+        "latency_p99_ms": percentil(latencias, 99) * 1000,
+        "latency_max_ms": max(latencias) * 1000 if latencias else float('nan'),
+        "influx_lines": influx.linhas,
+        "influx_requests": influx.escritas,
+        "actuator_requests": api.comandos,
+        "rss_start_kb": rss_inicio,
+        "rss_end_kb": rss_fim,
+        "rss_peak_kb": rss_pico,
+        "rss_growth_kb": (rss_fim - rss_inicio) if rss_inicio and rss_fim else None,
+    }
+
+
+def bench_regras(args):
+    """Mede o custo de async_verificar_regras por amostra, em processo, para cada número de regras."""
+    os.environ.setdefault('MQTT_BROKER_PORT', '1883')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    sys.path[:0] = [COMMON_DIR, INGESTOR_DIR]
+    os.chdir(tempfile.mkdtemp(prefix='bench_rules_'))
+    import main as ingestor
+
+    resultados = []
+    for n in [int(x) for x in args.rule_counts.split(',')]:
+        for cenario in ('outros_sensores', 'mesmo_campo'):
+            if cenario == 'outros_sensores':
+                regras = regras_sinteticas(n, args.devices, args.sensors)
+            else:
+                regras = regras_sinteticas(n, 1, 1)
+            ingestor.regras.clear()
+            ingestor.regras.update(json.loads(json.dumps(regras)))
+            if hasattr(ingestor, 'reconstruir_indices'):
+                ingestor.reconstruir_indices()
+
+            async def rodar():
+                valores = [{"temperature": 15.0 + (i * 0.37) % 20.0, "humidity": 50.0} for i in range(args.samples)]
+                t0 = time.perf_counter()
+                for v in valores:
+                    await ingestor.async_verificar_regras(None, "bench_dev_0", 0, v)
+                return time.perf_counter() - t0
+
+            duracoes = [asyncio.run(rodar()) for _ in range(args.repeat)]
+            melhor = min(duracoes)
+            resultados.append({
+                "rules": n,
+                "scenario": cenario,
+                "us_per_sample": melhor / args.samples * 1e6,
+                "samples_per_s": args.samples / melhor,
+                "stdev_us": (statistics.pstdev(duracoes) / args.samples * 1e6) if len(duracoes) > 1 else 0.0,
+            })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=10000, help='amostras medidas (após o aquecimento)')
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--sensors', type=int, default=3, help='sensores por dispositivo')
+    parser.add_argument('--rate', type=float, default=0, help='msgs/s do publicador (0 = o mais rápido possível)')
+    parser.add_argument('--rules', type=int, default=0, help='regras sintéticas carregadas no ingestor')
+    parser.add_argument('--instances', type=int, default=1,
+                        help='instâncias do ingestor em modo cluster (assinatura $share; o broker fake suporta)')
+    parser.add_argument('--broker', help='host:porta de um broker real (padrão: broker fake em processo)')
+    parser.add_argument('--influx-delay', type=float, default=0.0, help='atraso artificial (s) por escrita no Influx fake')
+    parser.add_argument('--drain-timeout', type=float, default=30.0, help='espera máxima (s) após publicar tudo')
+    parser.add_argument('--log-level', default='WARNING', help='LOG_LEVEL do ingestor durante o benchmark')
+    parser.add_argument('--rules-only', action='store_true', help='roda só o benchmark do motor de regras')
+    parser.add_argument('--rule-counts', default='0,10,100,1000')
+    parser.add_argument('--samples', type=int, default=2000, help='amostras por medição do motor de regras')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    resultados = {}
+    if args.rules_only:
+        resultados['rules'] = bench_regras(args)
+    else:
+        resultados['pipeline'] = asyncio.run(bench_pipeline(args))
+
+    if 'pipeline' in resultados:
+        print("\n=== Pipeline de ingestão ===")
+        for chave, valor in resultados['pipeline'].items():
+            print(f"  {chave:28s} {valor:.2f}" if isinstance(valor, float) else f"  {chave:28s} {valor}")
+    if 'rules' in resultados:
+        print("\n=== Avaliação de regras (por amostra) ===")
+        print(f"  {'regras':>7s}  {'cenário':16s} {'µs/amostra':>11s} {'amostras/s':>12s}")
+        for r in resultados['rules']:
+            print(f"  {r['rules']:7d}  {r['scenario']:16s} {r['us_per_sample']:11.2f} {r['samples_per_s']:12.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Broker MQTT 3.1.1 mínimo em asyncio, só para benchmarks locais.
+
+Suporta CONNECT, SUBSCRIBE/UNSUBSCRIBE (com '+' e '#'), assinaturas
+compartilhadas ('$share/<grupo>/<filtro>', entrega em rodízio entre os membros
+do grupo), PUBLISH QoS 0/1/2 vindo dos clientes, mensagens retidas, PINGREQ
+e DISCONNECT. As entregas
+para assinantes são sempre QoS 0. Não implementa sessões persistentes,
+autenticação nem will messages: para isso use um mosquitto de verdade
+(opção --broker do bench_ingest.py).
+"""
+
+import asyncio
+import struct
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def _str(data, pos):
+    (tam,) = struct.unpack_from('!H', data, pos)
+    return data[pos + 2:pos + 2 + tam].decode('utf-8'), pos + 2 + tam
+
+
+def topico_casa(filtro, topico):
+    """Verifica se 'topico' casa com o filtro MQTT (com '+' e '#')."""
+    f = filtro.split('/')
+    t = topico.split('/')
+    for i, parte in enumerate(f):
+        if parte == '#':
+            return True
+        if i >= len(t):
+            return False
+        if parte != '+' and parte != t[i]:
+            return False
+    return len(f) == len(t)
+
+
+def pacote_publish(topico, payload, retain=False):
+    topico_b = topico.encode('utf-8')
+    corpo = struct.pack('!H', len(topico_b)) + topico_b + payload
+    return bytes([0x30 | (1 if retain else 0)]) + _varint(len(corpo)) + corpo
+
+
+class _Sessao:
+    __slots__ = ('writer', 'filtros', 'client_id')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.filtros = set()
+        self.client_id = ''
+
+
+class FakeBroker:
+    def __init__(self, host='127.0.0.1', porta=0):
+        self.host = host
+        self.porta = porta
+        self.sessoes = set()
+        self.retidas = {}
+        self.publicadas = 0
+        self._rodizio = {}  # grupo $share -> próxima posição
+        self._server = None
+
+    async def iniciar(self):
+        self._server = await asyncio.start_server(self._cliente, self.host, self.porta)
+        self.porta = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def parar(self):
+        if self._server:
+            self._server.close()
+            for sessao in list(self.sessoes):
+                sessao.writer.close()
+            await self._server.wait_closed()
+
+    async def _ler_pacote(self, reader):
+        cabecalho = await reader.readexactly(1)
+        mult, tam = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            tam += (byte & 0x7F) * mult
+            if not byte & 0x80:
+                break
+            mult *= 128
+        corpo = await reader.readexactly(tam) if tam else b''
+        return cabecalho[0], corpo
+
+    async def _cliente(self, reader, writer):
+        sessao = _Sessao(writer)
+        self.sessoes.add(sessao)
+        try:
+            while True:
+                primeiro, corpo = await self._ler_pacote(reader)
+                tipo = primeiro >> 4
+                if tipo == 1:  # CONNECT
+                    _, pos = _str(corpo, 0)
+                    pos += 4  # nível, flags, keepalive
+                    sessao.client_id, _ = _str(corpo, pos)
+                    writer.write(b'\x20\x02\x00\x00')
+                elif tipo == 3:  # PUBLISH
+                    qos = (primeiro >> 1) & 0x03
+                    retain = primeiro & 0x01
+                    topico, pos = _str(corpo, 0)
+                    if qos:
+                        (pid,) = struct.unpack_from('!H', corpo, pos)
+                        pos += 2
+                        writer.write((b'\x40\x02' if qos == 1 else b'\x50\x02') + struct.pack('!H', pid))
+                    payload = corpo[pos:]
+                    if retain:
+                        if payload:
+                            self.retidas[topico] = payload
+                        else:
+                            self.retidas.pop(topico, None)
+                    await self._distribuir(topico, payload)
+                elif tipo == 6:  # PUBREL (QoS 2)
+                    writer.write(b'\x70\x02' + corpo[:2])
+                elif tipo == 8:  # SUBSCRIBE
+                    (pid,) = struct.unpack_from('!H', corpo, 0)
+                    pos, concedidos, novos = 2, bytearray(), []
+                    while pos < len(corpo):
+                        filtro, pos = _str(corpo, pos)
+                        pos += 1
+                        sessao.filtros.add(filtro)
+                        novos.append(filtro)
+                        concedidos.append(0)
+                    writer.write(b'\x90' + _varint(2 + len(concedidos)) + struct.pack('!H', pid) + bytes(concedidos))
+                    for topico, payload in self.retidas.items():
+                        if any(topico_casa(f, topico) for f in novos):
+                            writer.write(pacote_publish(topico, payload, retain=True))
+                elif tipo == 10:  # UNSUBSCRIBE
+                    (pid,) = struct.unpack_from('!H', corpo, 0)
+                    pos = 2
+                    while pos < len(corpo):
+                        filtro, pos = _str(corpo, pos)
+                        sessao.filtros.discard(filtro)
+                    writer.write(b'\xb0\x02' + struct.pack('!H', pid))
+                elif tipo == 12:  # PINGREQ
+                    writer.write(b'\xd0\x00')
+                elif tipo == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessoes.discard(sessao)
+            writer.close()
+
+    async def _distribuir(self, topico, payload):
+        self.publicadas += 1
+        destinos = []
+        grupos = {}  # grupo $share -> sessões com filtro que casa
+        for sessao in self.sessoes:
+            normal = False
+            for f in sessao.filtros:
+                if f.startswith('$share/'):
+                    _, grupo, filtro = f.split('/', 2)
+                    if topico_casa(filtro, topico):
+                        grupos.setdefault(grupo, []).append(sessao)
+                elif topico_casa(f, topico):
+                    normal = True
+            if normal:
+                destinos.append(sessao)
+        for grupo, membros in grupos.items():
+            posicao = self._rodizio.get(grupo, 0)
+            self._rodizio[grupo] = posicao + 1
+            destinos.append(membros[posicao % len(membros)])
+        if not destinos:
+            return
+        pacote = pacote_publish(topico, payload)
+        for sessao in destinos:
+            sessao.writer.write(pacote)
+            transport = sessao.writer.transport
+            if transport.get_write_buffer_size() > 1 << 20:
+                await sessao.writer.drain()
@@ -0,0 +1,109 @@
+"""
+Dublês HTTP locais para os benchmarks: endpoint de escrita do InfluxDB v2 e
+a rota /<device_id>/settings/sensors/set da API.
+"""
+
+import asyncio
+import gzip
+import time
+
+from aiohttp import web
+
+
+class _ServidorHttp:
+    def __init__(self, host='127.0.0.1', porta=0):
+        self.host = host
+        self.porta = porta
+        self._runner = None
+
+    def rotas(self, app):
+        raise NotImplementedError
+
+    async def iniciar(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.rotas(app)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.porta)
+        await site.start()
+        self.porta = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def parar(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.porta}'
+
+
+class FakeInflux(_ServidorHttp):
+    """Aceita escritas em line protocol e registra quando cada 'seq' chegou.
+
+    O gerador de carga coloca um campo 'seq' nos 'values' de cada amostra;
+    aqui guardamos o instante de chegada de cada seq para calcular a latência
+    amostra → escrita sem depender de relógio do ingestor.
+    """
+
+    def __init__(self, host='127.0.0.1', porta=0, atraso=0.0):
+        super().__init__(host, porta)
+        self.atraso = atraso
+        self.linhas = 0
+        self.escritas = 0
+        self.bytes = 0
+        self.chegadas = {}  # seq -> time.time()
+        self.fora_do_ar = False
+
+    def rotas(self, app):
+        app.router.add_get('/ping', self._ping)
+        app.router.add_get('/health', self._ping)
+        app.router.add_post('/api/v2/write', self._write)
+
+    async def _ping(self, request):
+        if self.fora_do_ar:
+            return web.Response(status=503)
+        return web.Response(status=204)
+
+    async def _write(self, request):
+        if self.fora_do_ar:
+            return web.json_response({'code': 'unavailable'}, status=503)
+        corpo = await request.read()
+        if request.headers.get('Content-Encoding') == 'gzip':
+            corpo = gzip.decompress(corpo)
+        if self.atraso:
+            await asyncio.sleep(self.atraso)
+        agora = time.time()
+        self.escritas += 1
+        self.bytes += len(corpo)
+        for linha in corpo.split(b'\n'):
+            if not linha:
+                continue
+            self.linhas += 1
+            pos = linha.find(b'seq=')
+            if pos >= 0:
+                fim = pos + 4
+                while fim < len(linha) and linha[fim:fim + 1] not in (b',', b' '):
+                    fim += 1
+                try:
+                    seq = int(float(linha[pos + 4:fim].rstrip(b'i')))
+                except ValueError:
+                    continue
+                self.chegadas.setdefault(seq, agora)
+        return web.Response(status=204)
+
+
+class FakeApi(_ServidorHttp):
+    """Responde 200 para comandos de atuador enviados pelas regras do ingestor."""
+
+    def __init__(self, host='127.0.0.1', porta=0):
+        super().__init__(host, porta)
+        self.comandos = 0
+
+    def rotas(self, app):
+        app.router.add_post('/{device_id}/settings/sensors/set', self._set)
+
+    async def _set(self, request):
+        await request.read()
+        self.comandos += 1
+        return web.json_response({'status': 'success'})
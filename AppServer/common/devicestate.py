@@ -0,0 +1,185 @@
+"""
+Estado por dispositivo com memória limitada, para o ingestor e a API.
+
+Os caches indexados por device_id (sensor_configs no ingestor, config_cache
+e presença na API) ganham uma entrada para qualquer id que apareça no
+broker, inclusive de dispositivos desativados ou de firmware com defeito
+gerando ids novos, e nunca encolhiam. CacheDeDispositivos é um dict com:
+
+- limite de dispositivos (max_dispositivos): ao passar do limite, sai o
+  dispositivo sem atividade há mais tempo (LRU);
+- expulsão por inatividade (ocioso_apos, em s): entradas não tocadas nesse
+  tempo saem a cada inserção nova ou quando o dono chama expirar();
+- 'protegido(device_id)': dispositivos que nunca saem (ex.: usados por regras);
+- contadores de expulsões por motivo, para as métricas.
+
+Atividade é escrita (cache[id] = ...) ou tocar(id); leituras não mudam a
+ordem, para que consultas da API não mantenham vivo um dispositivo mudo.
+A ordem fica no OrderedDict (move_to_end, O(1)) e o instante do último
+toque num registro com __slots__ junto do valor. Não é thread-safe: na API
+o acesso já é feito sob o lock de cada cache.
+"""
+
+import sys
+import time
+from collections import OrderedDict
+
+LRU = 'lru'
+OCIOSO = 'idle'
+MOTIVOS = (LRU, OCIOSO)
+
+
+class _Entrada:
+    __slots__ = ('valor', 'visto')
+
+    def __init__(self, valor, visto):
+        self.valor = valor
+        self.visto = visto
+
+
+class CacheDeDispositivos:
+    def __init__(self, max_dispositivos=0, ocioso_apos=0.0, protegido=None, ao_expulsar=None, relogio=time.monotonic):
+        """max_dispositivos=0 e ocioso_apos=0 desativam o respectivo limite."""
+        self.max_dispositivos = max_dispositivos
+        self.ocioso_apos = ocioso_apos
+        self.protegido = protegido
+        self.ao_expulsar = ao_expulsar
+        self.relogio = relogio
+        self.expulsos = {motivo: 0 for motivo in MOTIVOS}
+        self._entradas = OrderedDict()  # device_id -> _Entrada, do menos para o mais recente
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def __contains__(self, device_id):
+        return device_id in self._entradas
+
+    def __iter__(self):
+        return iter(list(self._entradas))
+
+    def __getitem__(self, device_id):
+        return self._entradas[device_id].valor
+
+    def get(self, device_id, padrao=None):
+        entrada = self._entradas.get(device_id)
+        return padrao if entrada is None else entrada.valor
+
+    def __setitem__(self, device_id, valor):
+        agora = self.relogio()
+        entrada = self._entradas.get(device_id)
+        if entrada is not None:
+            entrada.valor, entrada.visto = valor, agora
+            self._entradas.move_to_end(device_id)
+            return
+        # ids vindos do tópico são strings novas a cada mensagem: guarda uma cópia única
+        if isinstance(device_id, str):
+            device_id = sys.intern(device_id)
+        self._entradas[device_id] = _Entrada(valor, agora)
+        self.expirar(agora)
+        if self.max_dispositivos and len(self._entradas) > self.max_dispositivos:
+            self._expulsar_do_inicio(LRU, lambda entrada: len(self._entradas) > self.max_dispositivos, agora)
+
+    def __delitem__(self, device_id):
+        del self._entradas[device_id]
+
+    def setdefault(self, device_id, padrao):
+        if device_id not in self._entradas:
+            self[device_id] = padrao
+        return self._entradas[device_id].valor
+
+    def pop(self, device_id, *padrao):
+        entrada = self._entradas.pop(device_id, None)
+        if entrada is None:
+            if padrao:
+                return padrao[0]
+            raise KeyError(device_id)
+        return entrada.valor
+
+    def keys(self):
+        return list(self._entradas)
+
+    def values(self):
+        return [entrada.valor for entrada in self._entradas.values()]
+
+    def items(self):
+        return [(device_id, entrada.valor) for device_id, entrada in self._entradas.items()]
+
+    def clear(self):
+        self._entradas.clear()
+
+    def tocar(self, device_id):
+        """Registra atividade do dispositivo (sem criar a entrada se ela não existe)."""
+        entrada = self._entradas.get(device_id)
+        if entrada is not None:
+            entrada.visto = self.relogio()
+            self._entradas.move_to_end(device_id)
+
+    def expirar(self, agora=None):
+        """Remove as entradas sem atividade há mais de ocioso_apos. Retorna quantas saíram."""
+        if not self.ocioso_apos or not self._entradas:
+            return 0
+        agora = self.relogio() if agora is None else agora
+        limite = agora - self.ocioso_apos
+        return self._expulsar_do_inicio(OCIOSO, lambda entrada: entrada.visto < limite, agora)
+
+    def _expulsar_do_inicio(self, motivo, condicao, agora):
+        """Remove do início (menos recente) enquanto 'condicao(entrada)' valer.
+
+        Protegidos vão para o fim como se tivessem acabado de ser tocados; no
+        máximo uma volta completa, para o caso de todos serem protegidos.
+        """
+        removidos = 0
+        for _ in range(len(self._entradas)):
+            device_id, entrada = next(iter(self._entradas.items()))
+            if not condicao(entrada):
+                break
+            if self.protegido is not None and self.protegido(device_id):
+                entrada.visto = agora
+                self._entradas.move_to_end(device_id)
+                continue
+            del self._entradas[device_id]
+            self.expulsos[motivo] += 1
+            removidos += 1
+            if self.ao_expulsar is not None:
+                self.ao_expulsar(device_id, entrada.valor, motivo)
+        return removidos
+
+    def estatisticas(self):
+        return {
+            "devices": len(self._entradas),
+            "max_devices": self.max_dispositivos or None,
+            "idle_evict_after": self.ocioso_apos or None,
+            "evicted": dict(self.expulsos),
+        }
+
+
+class ConfigSensor:
+    """Configuração de um sensor no cache (o mesmo formato de '<device>/settings/sensors/get/response')."""
+
+    __slots__ = ('id', 'desc', 'tipo', 'pinos', 'atributo1')
+
+    def __init__(self, id, desc='', tipo=-1, pinos=(), atributo1=0):
+        self.id = id
+        self.desc = sys.intern(desc) if isinstance(desc, str) else desc
+        self.tipo = tipo
+        self.pinos = tuple(pinos) if isinstance(pinos, (list, tuple)) else pinos
+        self.atributo1 = atributo1
+
+    @classmethod
+    def de_dict(cls, dados):
+        return cls(dados['id'], dados.get('desc', ''), dados.get('tipo', -1), dados.get('pinos', ()),
+                   dados.get('atributo1', 0))
+
+    def to_dict(self, **alteracoes):
+        dados = {"id": self.id, "desc": self.desc, "tipo": self.tipo, "pinos": list(self.pinos),
+                 "atributo1": self.atributo1}
+        dados.update(alteracoes)
+        return dados
+
+    def __eq__(self, outro):
+        if not isinstance(outro, ConfigSensor):
+            return NotImplemented
+        return all(getattr(self, campo) == getattr(outro, campo) for campo in self.__slots__)
+
+    def __repr__(self):
+        return f"ConfigSensor({self.to_dict()!r})"
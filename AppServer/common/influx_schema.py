@@ -0,0 +1,144 @@
+"""
+Layout dos dados de sensores no InfluxDB, compartilhado entre ingestor e API.
+
+Dois modos, escolhidos pela variável INFLUX_SCHEMA (a mesma nos dois serviços):
+
+- "sensor" (padrão, legado): um measurement por sensor, 'sensor_<id>', e um
+  ponto por campo com a tag 'field'. Tags: device_id, sensor_type,
+  sensor_type_id, field.
+- "tipo": um measurement por tipo de sensor (ex.: 'DHT_11'), com tags
+  device_id, sensor_id, sensor_type_id e um único ponto multi-campo por
+  amostra. Menos séries e consultas entre sensores do mesmo tipo
+  ("todas as temperaturas de DS18_B20") viram um filtro em um measurement.
+
+Para mover dados existentes do layout legado para o novo: ingestor/migrate_schema.py.
+"""
+
+import os
+
+from influxdb_client import Point
+
+SCHEMA_SENSOR = 'sensor'
+SCHEMA_TIPO = 'tipo'
+SCHEMAS = (SCHEMA_SENSOR, SCHEMA_TIPO)
+
+PREFIXO_MEASUREMENT_LEGADO = 'sensor_'
+
+
+def schema_configurado():
+    """Lê INFLUX_SCHEMA do ambiente (valor inválido é um erro de configuração)."""
+    schema = os.getenv('INFLUX_SCHEMA', SCHEMA_SENSOR).strip().lower()
+    if schema not in SCHEMAS:
+        raise ValueError(f"INFLUX_SCHEMA inválido: {schema!r} (use {' ou '.join(SCHEMAS)})")
+    return schema
+
+
+def id_do_sensor(sensor_id):
+    """'sensor_12' -> '12' (a API recebe o nome do measurement legado na URL)."""
+    sensor_id = str(sensor_id)
+    if sensor_id.startswith(PREFIXO_MEASUREMENT_LEGADO):
+        return sensor_id[len(PREFIXO_MEASUREMENT_LEGADO):]
+    return sensor_id
+
+
+def measurement_legado(sensor_id):
+    return f"{PREFIXO_MEASUREMENT_LEGADO}{id_do_sensor(sensor_id)}"
+
+
+def _valor(valor, como_string):
+    return str(valor) if como_string else float(valor)
+
+
+def pontos_da_amostra(schema, device_id, sensor_id, sensor_type_id, sensor_type_name, valores, ts_ns,
+                      como_string=False):
+    """Monta os pontos de uma amostra no layout escolhido.
+
+    Retorna (pontos, ignorados), onde 'ignorados' lista (campo, valor, erro)
+    para valores que não puderam ser convertidos.
+    """
+    pontos, ignorados = [], []
+    if schema == SCHEMA_TIPO:
+        ponto = Point(sensor_type_name) \
+            .tag("device_id", device_id) \
+            .tag("sensor_id", str(sensor_id)) \
+            .tag("sensor_type_id", str(sensor_type_id))
+        campos = 0
+        for nome, valor in valores.items():
+            try:
+                ponto.field(nome, _valor(valor, como_string))
+                campos += 1
+            except (ValueError, TypeError) as e:
+                ignorados.append((nome, valor, e))
+        if campos:
+            pontos.append(ponto.time(ts_ns, write_precision='ns'))
+        return pontos, ignorados
+
+    measurement = measurement_legado(sensor_id)
+    for nome, valor in valores.items():
+        try:
+            pontos.append(
+                Point(measurement)
+                .tag("device_id", device_id)
+                .tag("sensor_type", sensor_type_name)
+                .tag("sensor_type_id", str(sensor_type_id))
+                .tag("field", nome)
+                .field(nome, _valor(valor, como_string))
+                .time(ts_ns, write_precision='ns')
+            )
+        except (ValueError, TypeError) as e:
+            ignorados.append((nome, valor, e))
+    return pontos, ignorados
+
+
+def ponto_do_atuador(schema, device_id, sensor_id, sensor_type_id, sensor_type_name, valor, ts_ns):
+    """Ponto de um atuador (SG_90/RELE): um único campo 'value' (sem tag 'field' no layout legado)."""
+    if schema == SCHEMA_TIPO:
+        ponto = Point(sensor_type_name) \
+            .tag("device_id", device_id) \
+            .tag("sensor_id", str(sensor_id)) \
+            .tag("sensor_type_id", str(sensor_type_id))
+    else:
+        ponto = Point(measurement_legado(sensor_id)) \
+            .tag("device_id", device_id) \
+            .tag("sensor_type", sensor_type_name) \
+            .tag("sensor_type_id", str(sensor_type_id))
+    return ponto.field("value", float(valor)).time(ts_ns, write_precision='ns')
+
+
+def filtros_flux_do_sensor(schema, device_id, sensor_id):
+    """Filtros Flux que selecionam os dados de um sensor de um dispositivo."""
+    if schema == SCHEMA_TIPO:
+        return [
+            f'|> filter(fn: (r) => r["sensor_id"] == "{id_do_sensor(sensor_id)}" and r["device_id"] == "{device_id}")',
+        ]
+    return [
+        f'|> filter(fn: (r) => r["device_id"] == "{device_id}")',
+        f'|> filter(fn: (r) => r["_measurement"] == "{measurement_legado(sensor_id)}")',
+    ]
+
+
+def predicado_delete_do_sensor(schema, device_id, sensor_id):
+    """Predicate da API de delete do InfluxDB para os dados de um sensor de um dispositivo."""
+    if schema == SCHEMA_TIPO:
+        return f'sensor_id="{id_do_sensor(sensor_id)}" AND device_id="{device_id}"'
+    return f'_measurement="{measurement_legado(sensor_id)}" AND device_id="{device_id}"'
+
+
+def filtros_flux_do_dispositivo(schema, device_id, sensor_ids=None):
+    """Filtros Flux dos dados de um dispositivo, opcionalmente só de alguns sensores."""
+    filtros = [f'|> filter(fn: (r) => r["device_id"] == "{device_id}")']
+    if sensor_ids:
+        if schema == SCHEMA_TIPO:
+            cond = ' or '.join(f'r["sensor_id"] == "{id_do_sensor(s)}"' for s in sensor_ids)
+        else:
+            cond = ' or '.join(f'r["_measurement"] == "{measurement_legado(s)}"' for s in sensor_ids)
+        filtros.append(f'|> filter(fn: (r) => {cond})')
+    return filtros
+
+
+def sensor_do_registro(schema, registro):
+    """(sensor_id, nome do tipo) de um registro lido do InfluxDB, nos dois layouts."""
+    valores = registro.values
+    if schema == SCHEMA_TIPO:
+        return valores.get('sensor_id'), registro.get_measurement()
+    return id_do_sensor(registro.get_measurement()), valores.get('sensor_type')
@@ -0,0 +1,180 @@
+"""
+Camada de logging compartilhada pelos serviços Python (ingestor, api_server, dummy-esp32).
+
+- Níveis por serviço/categoria via variáveis de ambiente
+- Formatação preguiçosa (argumentos estilo '%s' só são formatados se o registro for emitido)
+- Amostragem por categoria (máximo de registros/s por logger, só abaixo de ERROR)
+- Escrita em stdout feita por uma thread própria (QueueHandler/QueueListener),
+  então o event loop / as threads do Flask nunca bloqueiam no I/O do console
+
+Variáveis de ambiente:
+    LOG_LEVEL   Nível padrão (DEBUG, INFO, WARNING, ERROR). Padrão: INFO
+    LOG_LEVELS  Níveis por categoria, ex: "ingestor.dados=WARNING,api.mqtt=DEBUG"
+    LOG_SAMPLE  Máximo de registros/s por categoria, ex: "ingestor.dados=20"
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s [%(name)s] %(message)s'
+
+# Tipos que podem ser formatados depois, na thread do listener, sem risco de
+# terem mudado no meio do caminho
+_TIPOS_IMUTAVEIS = (str, int, float, bool, type(None), bytes)
+
+_listener = None
+
+
+class lazy_json:
+    """Adia o json.dumps de um objeto até o registro ser realmente emitido.
+
+    Uso: log.debug("Regras: %s", lazy_json(payload, indent=2))
+    """
+
+    __slots__ = ('obj', 'kwargs')
+
+    def __init__(self, obj, **kwargs):
+        self.obj = obj
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return json.dumps(self.obj, **self.kwargs)
+
+
+class lazy_trunc:
+    """Adia a conversão em string (e o corte) de um valor grande, como um payload."""
+
+    __slots__ = ('obj', 'limite')
+
+    def __init__(self, obj, limite=100):
+        self.obj = obj
+        self.limite = limite
+
+    def __str__(self):
+        if isinstance(self.obj, (bytes, bytearray)):
+            texto = self.obj.decode('utf-8', 'replace')
+        else:
+            texto = self.obj if isinstance(self.obj, str) else str(self.obj)
+        if len(texto) > self.limite:
+            return f"{texto[:self.limite]}..."
+        return texto
+
+
+class AmostragemPorCategoria(logging.Filter):
+    """Limita a taxa de registros por categoria (nome do logger) com um token bucket.
+
+    ERROR e acima nunca são descartados. Quando um registro volta a passar,
+    ele informa quantos foram suprimidos desde o último emitido.
+    """
+
+    def __init__(self, taxas):
+        super().__init__()
+        self._taxas = taxas
+        self._estado = {}  # categoria -> [tokens, ultimo_refill, suprimidos]
+        self._lock = threading.Lock()
+
+    def _taxa(self, nome):
+        # Procura a categoria mais específica configurada (ex: 'ingestor.dados' antes de 'ingestor')
+        while nome:
+            if nome in self._taxas:
+                return nome, self._taxas[nome]
+            nome = nome.rpartition('.')[0]
+        return None, None
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        categoria, taxa = self._taxa(record.name)
+        if categoria is None:
+            return True
+
+        agora = time.monotonic()
+        with self._lock:
+            estado = self._estado.get(categoria)
+            if estado is None:
+                estado = self._estado[categoria] = [taxa, agora, 0]
+            estado[0] = min(taxa, estado[0] + (agora - estado[1]) * taxa)
+            estado[1] = agora
+            if estado[0] < 1:
+                estado[2] += 1
+                return False
+            estado[0] -= 1
+            suprimidos, estado[2] = estado[2], 0
+
+        if suprimidos:
+            record.msg = f"{record.msg} [+{suprimidos} suprimidas]"
+        return True
+
+
+class QueueHandlerPreguicoso(logging.handlers.QueueHandler):
+    """QueueHandler que deixa a formatação para a thread do listener.
+
+    O QueueHandler padrão formata a mensagem na thread de quem loga. Aqui isso
+    só acontece quando algum argumento é mutável (dict, lista, lazy_json...),
+    para que o texto reflita o estado no momento da chamada.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks são raros: formata já para liberar os frames
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args and not all(isinstance(a, _TIPOS_IMUTAVEIS) for a in _args(record)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def _args(record):
+    if isinstance(record.args, dict):
+        return record.args.values()
+    return record.args
+
+
+def _parse_pares(valor):
+    pares = {}
+    for item in (valor or '').split(','):
+        nome, sep, v = item.strip().partition('=')
+        if sep and nome and v:
+            pares[nome.strip()] = v.strip()
+    return pares
+
+
+def setup_logging(servico):
+    """Configura o logging do processo e retorna o logger raiz do serviço."""
+    global _listener
+    if _listener is not None:
+        return logging.getLogger(servico)
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    fila = queue.SimpleQueue()
+    queue_handler = QueueHandlerPreguicoso(fila)
+
+    taxas = {}
+    for nome, v in _parse_pares(os.getenv('LOG_SAMPLE')).items():
+        try:
+            taxas[nome] = float(v)
+        except ValueError:
+            pass
+    if taxas:
+        queue_handler.addFilter(AmostragemPorCategoria(taxas))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for nome, nivel in _parse_pares(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(nome).setLevel(nivel.upper())
+
+    _listener = logging.handlers.QueueListener(fila, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logging.getLogger(servico)
@@ -0,0 +1,36 @@
+"""
+Intervalos de tempo nos parâmetros das ferramentas e da API (mesma sintaxe do Flux).
+
+    parse_duracao('6h')                  -> timedelta(hours=6)
+    parse_instante('-30d', agora)        -> agora - 30 dias
+    parse_instante('2025-01-01T00:00:00Z', agora)
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+
+_DURACAO = re.compile(r'^(\d+)([smhdw])$')
+_UNIDADES = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_duracao(texto):
+    m = _DURACAO.match(texto.strip())
+    if not m:
+        raise ValueError(f"Duração inválida: {texto!r} (ex.: 30m, 6h, 1d)")
+    return timedelta(**{_UNIDADES[m.group(2)]: int(m.group(1))})
+
+
+def parse_instante(texto, agora):
+    """Aceita RFC3339 (2025-01-01T00:00:00Z), relativo (-30d) ou 'now'."""
+    texto = texto.strip()
+    if texto == 'now':
+        return agora
+    if texto.startswith('-'):
+        return agora - parse_duracao(texto[1:])
+    return datetime.fromisoformat(texto.replace('Z', '+00:00')).astimezone(timezone.utc)
+
+
+def relativo(texto):
+    """True se o instante depende de quando é avaliado ('now' ou '-30d')."""
+    texto = texto.strip()
+    return texto == 'now' or texto.startswith('-')
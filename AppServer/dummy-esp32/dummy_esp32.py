@@ -4,15 +4,24 @@ Simula um dispositivo ESP32 que:
 - Se inscreve em tópicos de configuração MQTT (GET/SET)
 - [NOVO] Se inscreve em tópicos de comando de atuador (config/+/actuators/+/set)
 - Publica leituras de sensores com dados fictícios
+
+Para simular muitos dispositivos no formato real do firmware, use o modo
+frota (fleet.py), ativado com FLEET_DEVICES > 0.
 """
 
 import asyncio
 import aiomqtt
 import json
+import logging
 import random
 import os
 from datetime import datetime
 
+from iotlog import setup_logging
+
+log = setup_logging('dummy')
+log_dados = logging.getLogger('dummy.dados')
+
 
 class DummyESP32:
     def __init__(self, device_id=None, mqtt_broker=None, mqtt_port=None):
@@ -110,7 +119,7 @@ class DummyESP32:
             pin = sensor.get("pin")
             sampling_interval = sensor.get("sampling_interval", 5000) / 1000.0  # Converte para segundos
             
-            print(f"[{self.device_id}] Iniciando tarefa de sensor para {sensor_id} (a cada {sampling_interval}s)")
+            log.info("[%s] Iniciando tarefa de sensor para %s (a cada %ss)", self.device_id, sensor_id, sampling_interval)
             
             while True:
                 if sensor.get("enabled", True):
@@ -129,35 +138,35 @@ class DummyESP32:
                     if self.client:
                         try:
                             await self.client.publish(topic, json.dumps(payload))
-                            print(f"[{self.device_id}] Publicado {sensor_id}: {value}")
+                            log_dados.debug("[%s] Publicado %s: %s", self.device_id, sensor_id, value)
                         except Exception as e:
-                            print(f"[{self.device_id}] Falha ao publicar: {e}")
+                            log.error("[%s] Falha ao publicar: %s", self.device_id, e)
                 
                 await asyncio.sleep(sampling_interval)
         
         except asyncio.CancelledError:
-            print(f"[{self.device_id}] Tarefa do sensor {sensor_id} cancelada.")
+            log.info("[%s] Tarefa do sensor %s cancelada.", self.device_id, sensor_id)
         except Exception as e:
-            print(f"[{self.device_id}] Erro na tarefa do sensor {sensor_id}: {e}")
+            log.error("[%s] Erro na tarefa do sensor %s: %s", self.device_id, sensor_id, e)
 
     async def stop_all_sensor_tasks(self):
         """Para e cancela todas as tarefas de sensores em execução"""
         if not self.sensor_tasks:
             return
             
-        print(f"[{self.device_id}] Cancelando {len(self.sensor_tasks)} tarefas de sensores...")
+        log.info("[%s] Cancelando %s tarefas de sensores...", self.device_id, len(self.sensor_tasks))
         for task in self.sensor_tasks:
             task.cancel()
         
         await asyncio.gather(*self.sensor_tasks, return_exceptions=True)
         self.sensor_tasks = []
-        print(f"[{self.device_id}] Todas as tarefas de sensores paradas.")
+        log.info("[%s] Todas as tarefas de sensores paradas.", self.device_id)
 
     async def restart_sensor_tasks(self):
         """Para tarefas antigas e inicia novas com base na configuração atual"""
         await self.stop_all_sensor_tasks()
         
-        print(f"[{self.device_id}] Iniciando novas tarefas de sensores com base na configuração...")
+        log.info("[%s] Iniciando novas tarefas de sensores com base na configuração...", self.device_id)
         for sensor in self.sensors_config.get("sensors", []):
             if sensor.get("enabled", True):
                 task = asyncio.create_task(self.publish_sensor_reading(sensor))
@@ -165,25 +174,25 @@ class DummyESP32:
 
     async def message_handler(self):
         """Processa todas as mensagens MQTT recebidas"""
-        print(f"[{self.device_id}] Manipulador de mensagens iniciado.")
+        log.info("[%s] Manipulador de mensagens iniciado.", self.device_id)
         async for message in self.client.messages:
             topic = message.topic.value
             payload = message.payload.decode()
             
-            print(f"[{self.device_id}] Mensagem recebida em {topic}")
+            log.debug("[%s] Mensagem recebida em %s", self.device_id, topic)
             
             try:
                 # Lidar com GET de sensores
                 if topic == f"config/{self.device_id}/sensors/get":
                     response_topic = f"config/{self.device_id}/sensors"
                     await self.client.publish(response_topic, json.dumps(self.sensors_config))
-                    print(f"[{self.device_id}] Configuração de sensores publicada em {response_topic}")
+                    log.info("[%s] Configuração de sensores publicada em %s", self.device_id, response_topic)
                 
                 # Lidar com SET de sensores
                 elif topic == f"config/{self.device_id}/sensors/set":
                     new_config = json.loads(payload)
                     self.sensors_config = new_config
-                    print(f"[{self.device_id}] Configuração de sensores atualizada: {len(new_config.get('sensors', []))} sensores")
+                    log.info("[%s] Configuração de sensores atualizada: %s sensores", self.device_id, len(new_config.get('sensors', [])))
                     
                     # Reinicia tarefas de sensores com nova config
                     await self.restart_sensor_tasks()
@@ -194,34 +203,32 @@ class DummyESP32:
                     safe_wifi = self.wifi_config.copy()
                     safe_wifi["password"] = "********" # Não enviar senha
                     await self.client.publish(response_topic, json.dumps(safe_wifi))
-                    print(f"[{self.device_id}] Configuração de wifi publicada em {response_topic}")
+                    log.info("[%s] Configuração de wifi publicada em %s", self.device_id, response_topic)
                 
                 # Lidar com SET de wifi
                 elif topic == f"config/{self.device_id}/wifi/set":
                     new_wifi = json.loads(payload)
                     self.wifi_config = new_wifi
-                    print(f"[{self.device_id}] Configuração de wifi atualizada: SSID={new_wifi.get('ssid')}")
+                    log.info("[%s] Configuração de wifi atualizada: SSID=%s", self.device_id, new_wifi.get('ssid'))
 
                 # *** [NOVO] Lidar com comando de atuador vindo do Ingestor ***
                 elif topic.startswith(f"config/{self.device_id}/actuators/") and topic.endswith("/set"):
                     actuator_id = topic.split('/')[-2]
                     command = json.loads(payload)
                     value = command.get("value")
-                    print(f"")
-                    print(f"[{self.device_id}] ⚡️ COMANDO ATUADOR RECEBIDO ⚡️")
-                    print(f"    Atuador: {actuator_id}")
-                    print(f"    Valor:   {value}")
-                    print(f"")
+                    log.info("[%s] ⚡️ COMANDO ATUADOR RECEBIDO ⚡️", self.device_id)
+                    log.info("    Atuador: %s", actuator_id)
+                    log.info("    Valor:   %s", value)
             
             except json.JSONDecodeError as e:
-                print(f"[{self.device_id}] Erro ao decodificar JSON: {e}")
+                log.error("[%s] Erro ao decodificar JSON: %s", self.device_id, e)
             except Exception as e:
-                print(f"[{self.device_id}] Erro ao manipular mensagem: {e}")
+                log.error("[%s] Erro ao manipular mensagem: %s", self.device_id, e)
 
     async def start(self):
         """Inicia o simulador dummy ESP32"""
-        print(f"[{self.device_id}] Iniciando simulador dummy ESP32 (Async)...")
-        print(f"[{self.device_id}] Conectando ao broker MQTT em {self.mqtt_broker}:{self.mqtt_port}")
+        log.info("[%s] Iniciando simulador dummy ESP32 (Async)...", self.device_id)
+        log.info("[%s] Conectando ao broker MQTT em %s:%s", self.device_id, self.mqtt_broker, self.mqtt_port)
         
         while True: # Adiciona um loop de reconexão
             try:
@@ -233,7 +240,7 @@ class DummyESP32:
                     identifier=self.device_id  # <--- Esta é a correção
                 ) as client:
                     self.client = client
-                    print(f"[{self.device_id}] Conectado ao broker com sucesso.")
+                    log.info("[%s] Conectado ao broker com sucesso.", self.device_id)
                     
                     # Tópicos para se inscrever
                     config_topics = [
@@ -246,7 +253,7 @@ class DummyESP32:
                     
                     for topic in config_topics:
                         await self.client.subscribe(topic)
-                        print(f"[{self.device_id}] Inscrito em {topic}")
+                        log.info("[%s] Inscrito em %s", self.device_id, topic)
                     
                     # Inicia as tarefas de publicação de sensores
                     await self.restart_sensor_tasks()
@@ -255,24 +262,29 @@ class DummyESP32:
                     await self.message_handler()
 
             except (asyncio.CancelledError, KeyboardInterrupt):
-                print(f"\n[{self.device_id}] Parando o simulador...")
+                log.info("[%s] Parando o simulador...", self.device_id)
                 await self.stop_all_sensor_tasks()
-                print(f"[{self.device_id}] Simulador dummy ESP32 parado.")
+                log.info("[%s] Simulador dummy ESP32 parado.", self.device_id)
                 break # Sai do loop de reconexão
             except aiomqtt.MqttError as e:
-                print(f"[{self.device_id}] Erro de conexão MQTT: {e}. Tentando reconectar em 5 segundos...")
+                log.warning("[%s] Erro de conexão MQTT: %s. Tentando reconectar em 5 segundos...", self.device_id, e)
                 await self.stop_all_sensor_tasks() # Para tarefas antes de reconectar
                 await asyncio.sleep(5)
             except Exception as e:
-                print(f"[{self.device_id}] Erro inesperado: {e}")
-                traceback.print_exc()
+                log.exception("[%s] Erro inesperado: %s", self.device_id, e)
                 await self.stop_all_sensor_tasks()
                 await asyncio.sleep(5)
 
 
 if __name__ == "__main__":
+    # FLEET_DEVICES > 0 ativa o modo frota (ver fleet.py): N dispositivos virtuais no mesmo processo
+    if int(os.getenv("FLEET_DEVICES", "0")) > 0:
+        import fleet
+        fleet.main()
+        raise SystemExit(0)
+
     dummy = DummyESP32()
     try:
         asyncio.run(dummy.start())
     except KeyboardInterrupt:
-        print(f"\n[{dummy.device_id}] Processo principal interrompido. Desligando.")
\ No newline at end of file
+        log.info("[%s] Processo principal interrompido. Desligando.", dummy.device_id)
\ No newline at end of file
@@ -0,0 +1,430 @@
+"""
+Modo frota do simulador: N dispositivos virtuais em um único event loop.
+
+Cada dispositivo virtual se comporta como o firmware (ESP32codes):
+- publica em <device_id>/sensors/<id>/data com 'type' numérico (Sensor_tipo),
+  'values' como dicionário e 'atributo1' para atuadores (SG_90/RELE);
+- responde em <device_id>/settings/sensors/{get,set,remove}/response e
+  trata <device_id>/settings/device/reset.
+
+O agendamento das leituras é feito por um único heap (não uma task por
+sensor), com jitter por leitura, para escalar a milhares de sensores.
+A taxa de publicação alcançada é registrada periodicamente no log.
+
+Configuração (env ou linha de comando, ver --help):
+    FLEET_DEVICES=1000 FLEET_MIX="DHT_11=2,MPU_6050=1,RELE=1,TECLADO_4X4=0.2" \\
+    FLEET_RATES="MPU_6050=5,DHT_11=0.5" python -u fleet.py
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import os
+import random
+import time
+
+import aiomqtt
+
+from iotlog import setup_logging
+
+log = setup_logging('dummy')
+log_dados = logging.getLogger('dummy.dados')
+
+# Mesma numeração do enum Sensor_tipo do firmware (Trabalho.hpp)
+SENSOR_TYPES = {
+    0: "MPU_6050",
+    1: "DS18_B20",
+    2: "HC_SR04",
+    3: "APDS_9960",
+    4: "SG_90",
+    5: "RELE",
+    6: "JOYSTICK",
+    7: "TECLADO_4X4",
+    8: "ENCODER",
+    9: "DHT_11"
+}
+TIPO_POR_NOME = {nome: tipo for tipo, nome in SENSOR_TYPES.items()}
+ATUADORES = (4, 5)
+
+# Firmware publica a cada 5 s (PUBLISH_INTERVAL em main.cpp)
+TAXA_PADRAO_HZ = 0.2
+
+
+def gerar_valores(sensor):
+    """Gera o dicionário 'values' no formato que o ingestor espera para cada tipo."""
+    tipo = sensor.tipo
+    if tipo == 0:  # MPU_6050
+        return {
+            "x": round(random.uniform(-2.0, 2.0), 3),
+            "y": round(random.uniform(-2.0, 2.0), 3),
+            "z": round(random.uniform(-2.0, 2.0), 3),
+            "gx": round(random.uniform(-250.0, 250.0), 2),
+            "gy": round(random.uniform(-250.0, 250.0), 2),
+            "gz": round(random.uniform(-250.0, 250.0), 2),
+            "temp": round(random.uniform(20.0, 40.0), 2)
+        }
+    if tipo == 1:  # DS18_B20
+        return {"temperature": round(random.uniform(10.0, 40.0), 2)}
+    if tipo == 2:  # HC_SR04
+        return {"distance": round(random.uniform(2.0, 400.0), 2)}
+    if tipo == 3:  # APDS_9960
+        return {
+            "r": random.randint(0, 255),
+            "g": random.randint(0, 255),
+            "b": random.randint(0, 255),
+            "c": random.randint(0, 255),
+            "prox": random.randint(0, 255),
+            "gesture": random.randint(0, 4)
+        }
+    if tipo == 6:  # JOYSTICK
+        return {"x": random.randint(0, 4095), "y": random.randint(0, 4095), "bt": random.choice([0, 1])}
+    if tipo == 7:  # TECLADO_4X4: o firmware envia o buffer digitado ao apertar '#'
+        return {"input": ''.join(random.choice('0123456789') for _ in range(4))}
+    if tipo == 8:  # ENCODER
+        return {"obstacle": random.choice([0, 1])}
+    if tipo == 9:  # DHT_11
+        return {
+            "temperature": round(random.uniform(15.0, 35.0), 2),
+            "humidity": round(random.uniform(30.0, 80.0), 2)
+        }
+    return {"value": random.randint(0, 4095)}
+
+
+class SensorVirtual:
+    __slots__ = ('dispositivo', 'id', 'tipo', 'desc', 'pinos', 'atributos', 'intervalo', 'ativo')
+
+    def __init__(self, dispositivo, config, intervalo):
+        self.dispositivo = dispositivo
+        self.id = int(config["id"])
+        self.intervalo = intervalo
+        self.ativo = True
+        self.atualizar(config)
+
+    def atualizar(self, config):
+        """Aplica uma configuração no formato de addOrUpdateSensor do firmware."""
+        self.tipo = int(config.get("tipo", -1))
+        self.desc = config.get("desc", "")
+        self.pinos = config.get("pinos", [])
+        self.atributos = [config.get(f"atributo{i}", 0) or 0 for i in range(1, 5)]
+
+    def config(self):
+        """Mesmo formato da resposta de <device_id>/settings/sensors/get."""
+        cfg = {"id": self.id, "tipo": self.tipo, "desc": self.desc}
+        for i, valor in enumerate(self.atributos, start=1):
+            cfg[f"atributo{i}"] = valor
+        cfg["pinos"] = self.pinos
+        return cfg
+
+    def payload(self):
+        """Mesmo formato de buildSensorPayload (firmware) com 'values' em dicionário."""
+        dados = {
+            "device_id": self.dispositivo.device_id,
+            "sensor_id": self.id,
+            "type": self.tipo,
+        }
+        if self.tipo in ATUADORES:
+            dados["atributo1"] = self.atributos[0]
+        else:
+            dados["values"] = gerar_valores(self)
+        dados["timestamp"] = int(time.time() * 1000)
+        return json.dumps(dados)
+
+
+class DispositivoVirtual:
+    def __init__(self, frota, device_id, configs):
+        self.frota = frota
+        self.device_id = device_id
+        self.conexao = None
+        self.sensores = {}
+        for cfg in configs:
+            self.adicionar_ou_atualizar(cfg)
+
+    def adicionar_ou_atualizar(self, cfg):
+        if "id" not in cfg or "tipo" not in cfg:
+            return False
+        sensor_id = int(cfg["id"])
+        sensor = self.sensores.get(sensor_id)
+        if sensor is None:
+            tipo = int(cfg["tipo"])
+            sensor = SensorVirtual(self, cfg, self.frota.intervalo_do_tipo(tipo))
+            self.sensores[sensor_id] = sensor
+            self.frota.agendar(sensor, primeira=True)
+        else:
+            sensor.atualizar(cfg)
+        return True
+
+    def remover(self, sensor_id):
+        sensor = self.sensores.pop(sensor_id, None)
+        if sensor is None:
+            return False
+        sensor.ativo = False  # removido do heap de forma preguiçosa
+        return True
+
+    async def tratar_settings(self, operacao, payload):
+        """Responde às mensagens de configuração como o callback MQTT do firmware."""
+        base = f"{self.device_id}/settings/sensors"
+        if operacao == "get":
+            resposta = json.dumps([s.config() for s in self.sensores.values()])
+            await self.conexao.publicar(f"{base}/get/response", resposta)
+
+        elif operacao == "set":
+            try:
+                doc = json.loads(payload)
+            except json.JSONDecodeError:
+                await self.conexao.publicar(f"{base}/set/response", "ERROR: Invalid JSON")
+                return
+            lista = doc["sensors"] if isinstance(doc, dict) and isinstance(doc.get("sensors"), list) else [doc]
+            ok = sum(1 for cfg in lista if isinstance(cfg, dict) and self.adicionar_ou_atualizar(cfg))
+            erros = len(lista) - ok
+            if ok and not erros:
+                resposta = f"OK: {ok} sensor(es) processado(s)"
+            elif ok:
+                resposta = f"PARTIAL: {ok} OK, {erros} errors"
+            else:
+                resposta = "ERROR"
+            log.info("[%s] ⚙️ set: %s", self.device_id, resposta)
+            await self.conexao.publicar(f"{base}/set/response", resposta)
+
+        elif operacao == "remove":
+            try:
+                sensor_id = int(json.loads(payload)["id"])
+                removido = self.remover(sensor_id)
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                removido = False
+            await self.conexao.publicar(f"{base}/remove/response", "OK" if removido else "ERROR")
+
+    def resetar(self):
+        """Equivalente a eraseAllConfigurations(): apaga todos os sensores."""
+        log.info("[%s] 🔄 reset: apagando %s sensores", self.device_id, len(self.sensores))
+        for sensor_id in list(self.sensores):
+            self.remover(sensor_id)
+
+
+class ConexaoFrota:
+    """Uma conexão MQTT compartilhada por um grupo de dispositivos virtuais."""
+
+    def __init__(self, frota, indice, dispositivos):
+        self.frota = frota
+        self.indice = indice
+        self.dispositivos = {d.device_id: d for d in dispositivos}
+        for d in dispositivos:
+            d.conexao = self
+        self.client = None
+        # Com um dispositivo por conexão, usa o próprio device_id como client id (como o firmware)
+        self.identificador = dispositivos[0].device_id if len(dispositivos) == 1 else f"{frota.prefixo}fleet_{indice}"
+
+    async def publicar(self, topico, payload):
+        if self.client is None:
+            self.frota.descartadas += 1
+            return
+        try:
+            await self.client.publish(topico, payload)
+            self.frota.publicadas += 1
+        except aiomqtt.MqttError as e:
+            self.frota.descartadas += 1
+            log.debug("[%s] Falha ao publicar em %s: %s", self.identificador, topico, e)
+
+    async def executar(self):
+        while True:
+            try:
+                async with self.frota.limite_conexoes:
+                    client = aiomqtt.Client(hostname=self.frota.broker, port=self.frota.porta,
+                                            identifier=self.identificador)
+                    await client.__aenter__()
+                try:
+                    for device_id in self.dispositivos:
+                        await client.subscribe(f"{device_id}/settings/sensors/+")
+                        await client.subscribe(f"{device_id}/settings/device/reset")
+                    self.client = client
+                    self.frota.conectadas += 1
+                    async for message in client.messages:
+                        await self.tratar(message)
+                finally:
+                    if self.client is not None:
+                        self.frota.conectadas -= 1
+                    self.client = None
+                    await client.__aexit__(None, None, None)
+            except asyncio.CancelledError:
+                raise
+            except aiomqtt.MqttError as e:
+                log.warning("[%s] Erro de conexão MQTT: %s. Tentando reconectar em 5 segundos...", self.identificador, e)
+                await asyncio.sleep(5 + random.uniform(0, 1))
+            except Exception as e:
+                log.exception("[%s] Erro inesperado: %s", self.identificador, e)
+                await asyncio.sleep(5)
+
+    async def tratar(self, message):
+        partes = message.topic.value.split('/')
+        dispositivo = self.dispositivos.get(partes[0])
+        if dispositivo is None or len(partes) != 4 or partes[1] != 'settings':
+            return
+        if partes[2] == 'device' and partes[3] == 'reset':
+            dispositivo.resetar()
+        elif partes[2] == 'sensors' and partes[3] in ('get', 'set', 'remove'):
+            await dispositivo.tratar_settings(partes[3], message.payload.decode(errors='replace'))
+
+
+class Frota:
+    def __init__(self, dispositivos=100, prefixo="esp32_fleet_", mix=None, taxas=None, taxa_padrao=TAXA_PADRAO_HZ,
+                 jitter=0.1, conexoes=0, broker="mosquitto", porta=1883, relatorio=10.0, max_conexoes_simultaneas=50):
+        self.n_dispositivos = dispositivos
+        self.prefixo = prefixo
+        self.mix = mix or {9: 1.0, 0: 1.0, 5: 1.0}
+        self.taxas = taxas or {}
+        self.taxa_padrao = taxa_padrao
+        self.jitter = jitter
+        self.n_conexoes = conexoes or dispositivos
+        self.broker = broker
+        self.porta = porta
+        self.relatorio = relatorio
+        self.limite_conexoes = asyncio.Semaphore(max_conexoes_simultaneas)
+
+        self.agenda = []  # heap de (instante, seq, sensor)
+        self._seq = 0
+        self.dispositivos = []
+        self.conexoes = []
+        self.conectadas = 0
+        self.publicadas = 0
+        self.descartadas = 0
+        self.atrasadas = 0
+        self.atraso_max = 0.0
+
+    def intervalo_do_tipo(self, tipo):
+        taxa = self.taxas.get(tipo, self.taxa_padrao)
+        return 1.0 / taxa if taxa > 0 else None
+
+    def agendar(self, sensor, primeira=False, base=None):
+        if sensor.intervalo is None:
+            return
+        if primeira:
+            # espalha a primeira leitura dentro de um intervalo para não sincronizar a frota
+            quando = time.monotonic() + random.uniform(0, sensor.intervalo)
+        else:
+            quando = base + sensor.intervalo * (1.0 + random.uniform(-self.jitter, self.jitter))
+        self._seq += 1
+        heapq.heappush(self.agenda, (quando, self._seq, sensor))
+
+    def _montar(self):
+        """Cria os dispositivos conforme o mix: parte inteira = quantidade, fração = probabilidade."""
+        for i in range(self.n_dispositivos):
+            configs, proximo_id = [], 1
+            for tipo, quantidade in self.mix.items():
+                n = int(quantidade) + (1 if random.random() < quantidade - int(quantidade) else 0)
+                for _ in range(n):
+                    configs.append({"id": proximo_id, "tipo": tipo, "desc": f"{SENSOR_TYPES[tipo]} {proximo_id}",
+                                    "pinos": [{"pino": 10 + proximo_id, "tipo": 1}],
+                                    "atributo1": 0, "atributo2": 0, "atributo3": 0, "atributo4": 0})
+                    proximo_id += 1
+            self.dispositivos.append(DispositivoVirtual(self, f"{self.prefixo}{i}", configs))
+
+        por_conexao = -(-self.n_dispositivos // self.n_conexoes)
+        for k in range(0, self.n_dispositivos, por_conexao):
+            self.conexoes.append(ConexaoFrota(self, len(self.conexoes), self.dispositivos[k:k + por_conexao]))
+
+    def taxa_alvo(self):
+        return sum(1.0 / s.intervalo for d in self.dispositivos for s in d.sensores.values() if s.intervalo)
+
+    async def _agendador(self):
+        while True:
+            if not self.agenda:
+                await asyncio.sleep(0.1)
+                continue
+            quando = self.agenda[0][0]
+            agora = time.monotonic()
+            if quando > agora:
+                await asyncio.sleep(quando - agora)
+                continue
+            _, _, sensor = heapq.heappop(self.agenda)
+            if not sensor.ativo:
+                continue
+            atraso = agora - quando
+            if atraso > 0.1:
+                self.atrasadas += 1
+            self.atraso_max = max(self.atraso_max, atraso)
+            dispositivo = sensor.dispositivo
+            await dispositivo.conexao.publicar(f"{dispositivo.device_id}/sensors/{sensor.id}/data", sensor.payload())
+            log_dados.debug("[%s] Publicado sensor %s", dispositivo.device_id, sensor.id)
+            # reagenda a partir do horário previsto (não do atual) para manter a taxa média
+            self.agendar(sensor, base=max(quando, agora - sensor.intervalo))
+
+    async def _relatar(self):
+        inicio = anterior_t = time.monotonic()
+        anterior_n = 0
+        while True:
+            await asyncio.sleep(self.relatorio)
+            agora = time.monotonic()
+            taxa = (self.publicadas - anterior_n) / (agora - anterior_t)
+            log.info("📈 Frota: %.1f msgs/s (alvo %.1f) | conexões %s/%s | total %s | média %.1f msgs/s | "
+                     "descartadas %s | atrasadas>100ms %s | atraso máx %.0f ms",
+                     taxa, self.taxa_alvo(), self.conectadas, len(self.conexoes), self.publicadas,
+                     self.publicadas / (agora - inicio), self.descartadas, self.atrasadas, self.atraso_max * 1000)
+            anterior_t, anterior_n = agora, self.publicadas
+            self.atraso_max = 0.0
+
+    async def start(self):
+        self._montar()
+        n_sensores = sum(len(d.sensores) for d in self.dispositivos)
+        log.info("🚀 Frota: %s dispositivos, %s sensores, %s conexões MQTT em %s:%s (alvo %.1f msgs/s)",
+                 len(self.dispositivos), n_sensores, len(self.conexoes), self.broker, self.porta, self.taxa_alvo())
+        tarefas = [asyncio.create_task(c.executar()) for c in self.conexoes]
+        tarefas.append(asyncio.create_task(self._agendador()))
+        if self.relatorio > 0:
+            tarefas.append(asyncio.create_task(self._relatar()))
+        try:
+            await asyncio.gather(*tarefas)
+        finally:
+            for t in tarefas:
+                t.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+
+
+def parse_por_tipo(texto):
+    """Converte "DHT_11=2,MPU_6050=0.5" (nome ou id numérico) em {tipo: float}."""
+    resultado = {}
+    for item in filter(None, (p.strip() for p in (texto or '').split(','))):
+        nome, _, valor = item.partition('=')
+        nome = nome.strip().upper()
+        tipo = int(nome) if nome.isdigit() else TIPO_POR_NOME.get(nome)
+        if tipo not in SENSOR_TYPES:
+            raise ValueError(f"Tipo de sensor desconhecido: {nome} (use {', '.join(TIPO_POR_NOME)})")
+        resultado[tipo] = float(valor)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulador de frota de ESP32 virtuais")
+    parser.add_argument('--devices', type=int, default=int(os.getenv('FLEET_DEVICES', '100')))
+    parser.add_argument('--prefix', default=os.getenv('FLEET_PREFIX', 'esp32_fleet_'),
+                        help='prefixo dos device_id (esp32_fleet_0, esp32_fleet_1, ...)')
+    parser.add_argument('--mix', default=os.getenv('FLEET_MIX', 'DHT_11=1,MPU_6050=1,RELE=1'),
+                        help='sensores por dispositivo, por tipo (fração = probabilidade)')
+    parser.add_argument('--rates', default=os.getenv('FLEET_RATES', ''),
+                        help='leituras/s por tipo, ex.: MPU_6050=5,DHT_11=0.5 (0 = só responde a settings)')
+    parser.add_argument('--rate', type=float, default=float(os.getenv('FLEET_RATE', str(TAXA_PADRAO_HZ))),
+                        help='leituras/s padrão por sensor')
+    parser.add_argument('--jitter', type=float, default=float(os.getenv('FLEET_JITTER', '0.1')),
+                        help='variação relativa do intervalo (0.1 = ±10%%)')
+    parser.add_argument('--connections', type=int, default=int(os.getenv('FLEET_CONNECTIONS', '0')),
+                        help='conexões MQTT compartilhadas (0 = uma por dispositivo)')
+    parser.add_argument('--broker', default=os.getenv('MQTT_BROKER', 'mosquitto'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MQTT_PORT', '1883')))
+    parser.add_argument('--report', type=float, default=float(os.getenv('FLEET_REPORT_INTERVAL', '10')),
+                        help='intervalo (s) do relatório de taxa alcançada')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    frota = Frota(dispositivos=args.devices, prefixo=args.prefix, mix=parse_por_tipo(args.mix),
+                  taxas=parse_por_tipo(args.rates), taxa_padrao=args.rate, jitter=args.jitter,
+                  conexoes=args.connections, broker=args.broker, porta=args.port, relatorio=args.report)
+    try:
+        asyncio.run(frota.start())
+    except KeyboardInterrupt:
+        log.info("Frota interrompida: %s mensagens publicadas.", frota.publicadas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Agregados em janela deslizante para as condições do tipo 'agregado'.
+
+Condição:
+    {"tipo": "agregado", "id_device": "...", "id_sensor": 3, "medida": "temperature",
+     "funcao": "media", "janela": 300, "operador": ">", "valor_limite": 30, "tempo": 0}
+
+- funcao: media, min, max, contagem ou taxa (variação por segundo entre a
+  amostra mais antiga e a mais nova da janela)
+- janela: tamanho em segundos
+- filtro (opcional): {"operador": ">", "valor": 100} — só amostras que passam
+  entram na janela. Ex.: "mais de 10 detecções de proximidade em 60 s" =
+  funcao 'contagem', filtro prox > 100, operador '>' e valor_limite 10.
+
+Cada janela guarda as amostras num deque (anel limitado a max_amostras),
+a soma corrente e deques monotônicos para mínimo e máximo: inserir e expirar
+custam O(1) amortizado e a consulta de qualquer função é O(1). Condições com
+a mesma (dispositivo, sensor, campo, janela, filtro) compartilham a janela.
+"""
+
+import logging
+import operator
+from collections import deque
+
+log = logging.getLogger('ingestor.regras')
+
+FUNCOES = ('media', 'min', 'max', 'contagem', 'taxa')
+
+OPERADORES = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne
+}
+
+
+class JanelaDeslizante:
+    __slots__ = ('segundos', 'max_amostras', 'amostras', 'soma', 'minimos', 'maximos', '_seq')
+
+    def __init__(self, segundos, max_amostras=10000):
+        self.segundos = segundos
+        self.max_amostras = max_amostras
+        self.amostras = deque()  # (seq, instante, valor)
+        self.soma = 0.0
+        self.minimos = deque()  # (seq, valor), valores crescentes
+        self.maximos = deque()  # (seq, valor), valores decrescentes
+        self._seq = 0
+
+    def adicionar(self, instante, valor):
+        self._seq += 1
+        item = (self._seq, instante, valor)
+        self.amostras.append(item)
+        self.soma += valor
+        while self.minimos and self.minimos[-1][1] >= valor:
+            self.minimos.pop()
+        self.minimos.append((self._seq, valor))
+        while self.maximos and self.maximos[-1][1] <= valor:
+            self.maximos.pop()
+        self.maximos.append((self._seq, valor))
+        if len(self.amostras) > self.max_amostras:
+            self._remover_mais_antiga()
+        self.expirar(instante)
+
+    def expirar(self, agora):
+        limite = agora - self.segundos
+        while self.amostras and self.amostras[0][1] <= limite:
+            self._remover_mais_antiga()
+
+    def _remover_mais_antiga(self):
+        seq, _, valor = self.amostras.popleft()
+        if self.amostras:
+            self.soma -= valor
+        else:
+            self.soma = 0.0  # zera o erro acumulado de ponto flutuante
+        if self.minimos and self.minimos[0][0] == seq:
+            self.minimos.popleft()
+        if self.maximos and self.maximos[0][0] == seq:
+            self.maximos.popleft()
+
+    def valor(self, funcao, agora):
+        """Valor da função na janela em 'agora'; None se não houver amostras (exceto contagem)."""
+        self.expirar(agora)
+        if funcao == 'contagem':
+            return len(self.amostras)
+        if not self.amostras:
+            return None
+        if funcao == 'media':
+            return self.soma / len(self.amostras)
+        if funcao == 'min':
+            return self.minimos[0][1]
+        if funcao == 'max':
+            return self.maximos[0][1]
+        if funcao == 'taxa':
+            _, t0, v0 = self.amostras[0]
+            _, t1, v1 = self.amostras[-1]
+            return (v1 - v0) / (t1 - t0) if t1 > t0 else 0.0
+        raise ValueError(f"Função de agregado desconhecida: {funcao!r}")
+
+
+def _chave_filtro(condicao):
+    filtro = condicao.get('filtro')
+    if not filtro:
+        return None
+    return (filtro.get('operador'), filtro.get('valor'))
+
+
+def chave_da_janela(condicao):
+    """Identifica a janela usada por uma condição (condições iguais compartilham)."""
+    return (condicao.get('id_device'), condicao.get('id_sensor'), condicao.get('medida'),
+            float(condicao.get('janela', 60)), _chave_filtro(condicao))
+
+
+class RegistroDeJanelas:
+    def __init__(self, max_amostras=10000):
+        self.max_amostras = max_amostras
+        self._janelas = {}  # chave -> JanelaDeslizante
+        self._por_sensor = {}  # (device, sensor) -> [(medida, filtro, janela)]
+
+    def __len__(self):
+        return len(self._janelas)
+
+    def reconstruir(self, regras):
+        """Cria as janelas das condições 'agregado' e descarta as que nenhuma regra usa mais.
+
+        Janelas que continuam em uso mantêm as amostras.
+        """
+        janelas, por_sensor = {}, {}
+        for regra_id, regra in regras.items():
+            for c in regra.get('condicao', []):
+                if not isinstance(c, dict) or c.get('tipo') != 'agregado':
+                    continue
+                if c.get('funcao') not in FUNCOES or c.get('operador') not in OPERADORES:
+                    log.warning("  [Regra %s] Condição 'agregado' inválida (funcao=%s, operador=%s)",
+                                regra_id, c.get('funcao'), c.get('operador'))
+                    continue
+                try:
+                    chave = chave_da_janela(c)
+                except (TypeError, ValueError) as e:
+                    log.warning("  [Regra %s] Janela inválida em condição 'agregado': %s", regra_id, e)
+                    continue
+                if chave in janelas:
+                    continue
+                janela = self._janelas.get(chave) or JanelaDeslizante(chave[3], self.max_amostras)
+                janelas[chave] = janela
+                filtro = None
+                if c.get('filtro'):
+                    try:
+                        filtro = (OPERADORES[c['filtro']['operador']], float(c['filtro']['valor']))
+                    except (KeyError, TypeError, ValueError) as e:
+                        log.warning("  [Regra %s] Filtro inválido em condição 'agregado' (%s): ignorando o filtro",
+                                    regra_id, e)
+                por_sensor.setdefault((chave[0], chave[1]), []).append((chave[2], filtro, janela))
+        self._janelas = janelas
+        self._por_sensor = por_sensor
+
+    def adicionar(self, id_device, id_sensor, value, agora):
+        """Alimenta as janelas deste sensor com a amostra (uma vez por amostra, antes das regras)."""
+        for medida, filtro, janela in self._por_sensor.get((id_device, id_sensor), ()):
+            try:
+                valor = float(value[medida] if isinstance(value, dict) else value)
+            except (KeyError, TypeError, ValueError):
+                continue
+            if filtro and not filtro[0](valor, filtro[1]):
+                continue
+            janela.adicionar(agora, valor)
+
+    def valor(self, condicao, agora):
+        """Valor atual do agregado da condição (None se a janela não existe ou está vazia)."""
+        janela = self._janelas.get(chave_da_janela(condicao))
+        if janela is None:
+            return None
+        return janela.valor(condicao['funcao'], agora)
@@ -0,0 +1,260 @@
+"""
+Backtest de regras sobre os dados históricos do InfluxDB.
+
+Lê um intervalo de tempo em janelas grandes (query_stream, só os dispositivos
+e campos usados pelas regras), remonta as amostras e passa cada uma, em ordem
+de tempo, pelo mesmo motor de regras do ingestor (main.async_verificar_regras)
+com um relógio virtual: 'tempo' das condições e janelas dos agregados usam o
+instante gravado da amostra, sem esperas reais. As ações não são executadas,
+só registradas, e no fim sai um relatório por regra.
+
+Uso (com as mesmas variáveis de ambiente do ingestor):
+    python backtest.py --start -30d
+    python backtest.py --start -90d --rules nova_regra.json --out relatorio.json
+    python backtest.py --start 2025-01-01T00:00:00Z --stop 2025-02-01T00:00:00Z --rule r1 --events eventos.ndjson
+
+--rules aceita o rules_config.json do ingestor, uma lista de regras ou uma
+regra só. Com COMPRESSION_POLICIES ativo o banco não tem todas as amostras
+que o ingestor viu: regras sobre séries comprimidas podem disparar menos.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from influxdb_client import InfluxDBClient
+
+# O motor de regras é o do ingestor, numa instância só (sem cluster) e sem conexões
+os.environ.setdefault('MQTT_BROKER_PORT', '1883')
+os.environ['INGESTOR_INSTANCES'] = '1'
+os.environ['INGESTOR_INSTANCE_ID'] = '0'
+
+import influx_schema
+import main as ingestor
+from iotlog import setup_logging
+from migrate_schema import _iso
+from timerange import parse_duracao, parse_instante
+
+log = setup_logging('backtest')
+
+
+class RelogioVirtual:
+    """Substitui time.time() no motor de regras: devolve o instante da amostra em reprodução."""
+
+    def __init__(self):
+        self.instante = 0.0
+
+    def __call__(self):
+        return self.instante
+
+
+def carregar_regras(caminho, ids=None):
+    with open(caminho) as f:
+        conteudo = json.load(f)
+    if isinstance(conteudo, dict) and 'id_regra' in conteudo:
+        lista = [conteudo]
+    elif isinstance(conteudo, dict):
+        lista = list(conteudo.values())
+    else:
+        lista = conteudo
+    regras = {r['id_regra']: r for r in lista}
+    if ids:
+        faltando = set(ids) - regras.keys()
+        if faltando:
+            raise SystemExit(f"Regras não encontradas em {caminho}: {', '.join(sorted(faltando))}")
+        regras = {k: v for k, v in regras.items() if k in ids}
+    return regras
+
+
+def filtro_flux(regras):
+    """Filtros Flux: só os dispositivos e campos que aparecem nas condições."""
+    dispositivos, campos = set(), {'value', 'input'}  # atuadores e teclado
+    for regra in regras.values():
+        for c in regra.get('condicao', []):
+            if isinstance(c, dict) and c.get('id_device'):
+                dispositivos.add(c['id_device'])
+                if c.get('medida'):
+                    campos.add(c['medida'])
+    if not dispositivos:
+        return None
+    por_device = ' or '.join(f'r["device_id"] == "{d}"' for d in sorted(dispositivos))
+    por_campo = ' or '.join(f'r["_field"] == "{c}"' for c in sorted(campos))
+    return f'  |> filter(fn: (r) => {por_device})\n  |> filter(fn: (r) => {por_campo})'
+
+
+def _id_sensor(texto):
+    return int(texto) if texto.lstrip('-').isdigit() else texto
+
+
+def ler_amostras(query_api, args, filtros, inicio, fim):
+    """Lê uma janela e devolve as amostras em ordem de tempo: [(ts_ns, device, sensor, tipo, valores)]."""
+    flux = f'''
+from(bucket: "{args.bucket}")
+  |> range(start: {_iso(inicio)}, stop: {_iso(fim)})
+{filtros}
+'''
+    amostras = {}  # (ts_ns, device, sensor) -> [tipo, {campo: valor}]
+    for registro in query_api.query_stream(org=args.org, query=flux):
+        valores = registro.values
+        if args.schema == influx_schema.SCHEMA_TIPO:
+            sensor_id = valores.get('sensor_id')
+        else:
+            sensor_id = influx_schema.id_do_sensor(registro.get_measurement())
+        if sensor_id is None:
+            continue
+        instante = registro.get_time()
+        ts_ns = int(instante.timestamp()) * 1_000_000_000 + instante.microsecond * 1000
+        tipo = str(valores.get('sensor_type_id', '-1'))
+        chave = (ts_ns, valores.get('device_id'), _id_sensor(sensor_id))
+        amostras.setdefault(chave, [int(tipo) if tipo.lstrip('-').isdigit() else -1, {}])[1][registro.get_field()] = \
+            registro.get_value()
+    return [(ts, device, sensor, tipo, campos) for (ts, device, sensor), (tipo, campos) in sorted(amostras.items())]
+
+
+def valor_para_o_motor(tipo, campos):
+    """Mesmo formato que processar_dados passa às regras: escalar nos atuadores, dict nos sensores."""
+    if tipo in ingestor.ATUADOR_TYPES and 'value' in campos:
+        valor = campos['value']
+        return int(valor) if float(valor).is_integer() else valor
+    return campos
+
+
+class Relatorio:
+    def __init__(self, regras, eventos=None):
+        self.por_regra = {
+            regra_id: {'disparos': 0, 'liberacoes': 0, 'segundos_verdadeira': 0.0,
+                       'primeiro_disparo': None, 'ultimo_disparo': None, 'acoes': 0}
+            for regra_id in regras
+        }
+        self._verdadeira_desde = {}
+        self._eventos = eventos
+
+    async def registrar(self, client, regra_id, regra, resposta):
+        """Substitui main.async_executar_acoes: anota a transição em vez de acionar os atuadores."""
+        agora = ingestor.relogio()
+        r = self.por_regra[regra_id]
+        bloco = regra.get('entao' if resposta else 'senao', [])
+        r['acoes'] += len(bloco)
+        if resposta:
+            r['disparos'] += 1
+            r['primeiro_disparo'] = r['primeiro_disparo'] or agora
+            r['ultimo_disparo'] = agora
+            self._verdadeira_desde[regra_id] = agora
+        else:
+            r['liberacoes'] += 1
+            desde = self._verdadeira_desde.pop(regra_id, None)
+            if desde is not None:
+                r['segundos_verdadeira'] += agora - desde
+        if self._eventos:
+            self._eventos.write(json.dumps({'time': _iso(datetime.fromtimestamp(agora, timezone.utc)),
+                                            'rule': regra_id, 'state': resposta, 'actions': bloco}) + '\n')
+
+    def fechar(self, fim):
+        """Regras ainda verdadeiras no fim do intervalo contam o tempo até 'fim'."""
+        for regra_id, desde in self._verdadeira_desde.items():
+            self.por_regra[regra_id]['segundos_verdadeira'] += fim - desde
+        self._verdadeira_desde.clear()
+
+
+def preparar_motor(regras, inicio, relatorio):
+    """Carrega as regras no motor do ingestor com o relógio virtual em 'inicio'.
+
+    As regras vêm do arquivo do ingestor, que guarda o estado em execução
+    (last_state, time_stamp do relógio real, _satisfeita): tudo volta a
+    falso em 'inicio', senão condições já satisfeitas no arquivo contariam
+    sem nenhuma amostra e 'tempo' seria medido a partir de um instante futuro.
+    """
+    relogio = RelogioVirtual()
+    relogio.instante = inicio.timestamp()
+    ingestor.relogio = relogio
+    # Estado inicial: todas as regras falsas (não conta um SENAO na primeira amostra)
+    for regra in regras.values():
+        regra['_last_triggered_state'] = False
+        ingestor.reinicia_estado_das_condicoes(regra)
+    ingestor.regras.clear()
+    ingestor.regras.update(regras)
+    ingestor.reconstruir_indices()
+    ingestor.async_executar_acoes = relatorio.registrar
+    return relogio
+
+
+async def reproduzir(amostras, relogio):
+    for ts_ns, device_id, sensor_id, tipo, campos in amostras:
+        relogio.instante = ts_ns / 1e9
+        await ingestor.async_verificar_regras(None, device_id, sensor_id, valor_para_o_motor(tipo, campos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--start', required=True, help='início: RFC3339, relativo (-30d) ou now')
+    parser.add_argument('--stop', default='now', help='fim: RFC3339, relativo ou now (padrão)')
+    parser.add_argument('--rules', default=ingestor.RULES_CONFIG_FILE, help='arquivo de regras (padrão: rules_config.json)')
+    parser.add_argument('--rule', action='append', help='só esta regra (pode repetir)')
+    parser.add_argument('--window', default='6h', help='tamanho de cada janela lida do banco (padrão: 6h)')
+    parser.add_argument('--bucket', default=ingestor.INFLUXDB_BUCKET)
+    parser.add_argument('--org', default=ingestor.INFLUXDB_ORG)
+    parser.add_argument('--out', help='grava o relatório em JSON')
+    parser.add_argument('--events', help='grava cada transição (com as ações) em NDJSON')
+    args = parser.parse_args()
+    args.schema = ingestor.INFLUX_SCHEMA
+
+    agora = datetime.now(timezone.utc)
+    inicio = parse_instante(args.start, agora)
+    fim = parse_instante(args.stop, agora)
+    janela = parse_duracao(args.window)
+
+    regras = carregar_regras(args.rules, args.rule)
+    filtros = filtro_flux(regras)
+    if filtros is None:
+        raise SystemExit("Nenhuma condição com id_device nas regras selecionadas")
+    eventos = open(args.events, 'w') if args.events else None
+    relatorio = Relatorio(regras, eventos)
+    relogio = preparar_motor(regras, inicio, relatorio)
+    # As transições vão para o relatório; o log por regra só atrapalharia
+    ingestor.log_regras.setLevel('WARNING')
+
+    total = 0
+    t0 = time.time()
+    log.info("⏪ Backtest de %s regra(s) de %s até %s em janelas de %s", len(regras), _iso(inicio), _iso(fim), args.window)
+    try:
+        with InfluxDBClient(url=ingestor.INFLUXDB_URL, token=ingestor.INFLUXDB_TOKEN, org=args.org,
+                            timeout=300_000) as client:
+            query_api = client.query_api()
+            atual = inicio
+            while atual < fim:
+                proximo = min(atual + janela, fim)
+                amostras = ler_amostras(query_api, args, filtros, atual, proximo)
+                asyncio.run(reproduzir(amostras, relogio))
+                total += len(amostras)
+                log.info("✅ Janela %s → %s: %s amostras", _iso(atual), _iso(proximo), len(amostras))
+                atual = proximo
+    finally:
+        if eventos:
+            eventos.close()
+    relatorio.fechar(fim.timestamp())
+    duracao = time.time() - t0
+
+    resultado = {
+        'start': _iso(inicio), 'stop': _iso(fim), 'samples': total,
+        'rules': {
+            regra_id: dict(r, primeiro_disparo=r['primeiro_disparo'] and _iso(datetime.fromtimestamp(r['primeiro_disparo'], timezone.utc)),
+                           ultimo_disparo=r['ultimo_disparo'] and _iso(datetime.fromtimestamp(r['ultimo_disparo'], timezone.utc)))
+            for regra_id, r in relatorio.por_regra.items()
+        },
+    }
+    print(f"{'regra':<24} {'disparos':>9} {'liberações':>11} {'% verdadeira':>13}  último disparo")
+    periodo = max((fim - inicio).total_seconds(), 1e-9)
+    for regra_id, r in resultado['rules'].items():
+        print(f"{regra_id:<24} {r['disparos']:>9} {r['liberacoes']:>11} "
+              f"{100 * r['segundos_verdadeira'] / periodo:>12.2f}%  {r['ultimo_disparo'] or '-'}")
+    log.info("🏁 Backtest concluído em %.1fs: %s amostras (%.0f amostras/s)", duracao, total, total / max(duracao, 1e-9))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(resultado, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Modo cluster do ingestor: N instâncias dividindo o tráfego de sensores.
+
+- Os dados chegam por uma assinatura compartilhada ('$share/<grupo>/+/sensors/+/data'):
+  o broker entrega cada mensagem a UMA instância, que grava no InfluxDB
+  (sem escrita duplicada).
+- Cada regra tem uma instância dona, definida pelo dispositivo da primeira
+  condição (crc32(device_id) % N). Só a dona avalia a regra e guarda o seu
+  estado (last_state, time_stamp, _last_triggered_state).
+- Se a mensagem caiu numa instância que não é dona das regras daquele
+  dispositivo, ela é encaminhada para 'ingestor/cluster/<k>/<tópico original>'
+  das donas, que só avaliam (não gravam de novo).
+- Leituras de atuadores vão para todas as instâncias, para que o cache de
+  estado usado pelo modo 'toggle' fique igual em todas.
+- Regras (rules/+) e respostas de configuração continuam com assinatura
+  normal: todas as instâncias recebem. Só a instância 0 (coordenadora)
+  persiste arquivos, publica o snapshot de regras e faz o prefetch.
+
+Com INGESTOR_INSTANCES=1 (padrão) nada disso se aplica e o ingestor se
+comporta como antes.
+"""
+
+import zlib
+
+PREFIXO_ENCAMINHAMENTO = 'ingestor/cluster'
+
+
+def particao(device_id, instancias):
+    """Instância dona de um dispositivo (determinística entre processos e restarts)."""
+    return zlib.crc32(str(device_id).encode('utf-8')) % instancias
+
+
+class Cluster:
+    def __init__(self, instancias=1, instancia=0, grupo='ingestor'):
+        if instancias < 1 or not 0 <= instancia < instancias:
+            raise ValueError(f"Instância inválida: {instancia} de {instancias} (use 0..{instancias - 1})")
+        self.instancias = instancias
+        self.instancia = instancia
+        self.grupo = grupo
+        self.regras_locais = set()
+        # device_id -> instâncias donas de alguma regra com condição nesse dispositivo
+        self._destinos = {}
+
+    @property
+    def ativo(self):
+        return self.instancias > 1
+
+    @property
+    def coordenador(self):
+        return self.instancia == 0
+
+    def topico_dados(self, topico):
+        """Tópico de dados a assinar (compartilhado no modo cluster)."""
+        return f"$share/{self.grupo}/{topico}" if self.ativo else topico
+
+    @property
+    def topico_encaminhamento(self):
+        """Filtro onde esta instância recebe mensagens encaminhadas pelas outras."""
+        return f"{PREFIXO_ENCAMINHAMENTO}/{self.instancia}/#"
+
+    def topico_encaminhado(self, instancia, topico):
+        return f"{PREFIXO_ENCAMINHAMENTO}/{instancia}/{topico}"
+
+    def dono_da_regra(self, regra):
+        if not self.ativo:
+            return self.instancia
+        try:
+            device_id = regra['condicao'][0]['id_device']
+        except (KeyError, IndexError, TypeError):
+            return 0
+        return particao(device_id, self.instancias)
+
+    def reconstruir(self, regras):
+        """Recalcula as regras locais e o mapa dispositivo -> instâncias (a cada mudança de regras)."""
+        locais, destinos = set(), {}
+        for regra_id, regra in regras.items():
+            dono = self.dono_da_regra(regra)
+            if dono == self.instancia:
+                locais.add(regra_id)
+            for c in regra.get('condicao', []):
+                if isinstance(c, dict) and c.get('id_device'):
+                    destinos.setdefault(c['id_device'], set()).add(dono)
+        self.regras_locais = locais
+        self._destinos = destinos
+
+    def destinos(self, device_id, atuador=False):
+        """Instâncias que precisam ver uma amostra deste dispositivo."""
+        if atuador:
+            return range(self.instancias)
+        return self._destinos.get(device_id, ())
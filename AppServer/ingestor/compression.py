@@ -0,0 +1,183 @@
+"""
+Compressão das séries antes da escrita no InfluxDB (só no estágio de escrita:
+o motor de regras continua vendo todas as amostras).
+
+Políticas por tipo de sensor, na variável COMPRESSION_POLICIES:
+
+    DS18_B20=deadband:0.1,DHT_11=deadband:2%,RELE=deadband:0,HC_SR04=swing:1.5:60
+
+Formato: <TIPO>=<algoritmo>:<desvio>[:<heartbeat em s>]
+- deadband: grava a amostra se algum campo mudou mais que o desvio em relação
+  ao último valor gravado. Desvio com '%' é relativo ao último valor;
+  'deadband:0' grava só quando o valor muda (relés, servos).
+- swing: swinging door trending. Guarda a amostra anterior e só a grava
+  quando uma reta a partir do último ponto gravado não consegue mais passar
+  a menos de 'desvio' de todas as amostras intermediárias (a "porta" fecha).
+  Reconstrói a série por interpolação linear com erro máximo = desvio.
+- heartbeat (padrão COMPRESSION_HEARTBEAT): tempo máximo sem gravar nada
+  de uma série; ao passar, a amostra atual é gravada de qualquer jeito.
+
+Tipos sem política, campos não numéricos (ex.: teclado) e mudanças no
+conjunto de campos são sempre gravados.
+
+O estado por série fica num devicestate.CacheDeDispositivos: no máximo
+'max_series' séries (sai a sem amostras há mais tempo) e sem as paradas há
+mais de 'ocioso_apos' s. Uma série removida recomeça gravando a próxima
+amostra, como no heartbeat; a amostra retida pelo swing de uma série que
+parou de vez é descartada junto (ela só seria gravada com uma amostra nova).
+"""
+
+import math
+
+from devicestate import CacheDeDispositivos
+
+DEADBAND = 'deadband'
+SWING = 'swing'
+ALGORITMOS = (DEADBAND, SWING)
+
+
+class Politica:
+    __slots__ = ('algoritmo', 'desvio', 'relativo', 'heartbeat_ns')
+
+    def __init__(self, algoritmo, desvio, relativo=False, heartbeat=300.0):
+        if algoritmo not in ALGORITMOS:
+            raise ValueError(f"Algoritmo de compressão inválido: {algoritmo!r} (use {' ou '.join(ALGORITMOS)})")
+        if desvio < 0:
+            raise ValueError(f"Desvio negativo: {desvio}")
+        self.algoritmo = algoritmo
+        self.desvio = desvio
+        self.relativo = relativo
+        self.heartbeat_ns = int(heartbeat * 1e9)
+
+    def tolerancia(self, referencia):
+        return self.desvio * abs(referencia) if self.relativo else self.desvio
+
+
+def parse_politicas(texto, heartbeat_padrao=300.0):
+    """'DS18_B20=deadband:0.1,DHT_11=swing:2%:600' -> {'DS18_B20': Politica, ...}"""
+    politicas = {}
+    for item in (texto or '').split(','):
+        if not item.strip():
+            continue
+        tipo, _, spec = item.partition('=')
+        partes = spec.strip().split(':')
+        if len(partes) not in (2, 3):
+            raise ValueError(f"Política de compressão inválida: {item!r} (ex.: DS18_B20=deadband:0.1)")
+        desvio = partes[1].strip()
+        relativo = desvio.endswith('%')
+        valor = float(desvio.rstrip('%'))
+        heartbeat = float(partes[2]) if len(partes) == 3 else heartbeat_padrao
+        politicas[tipo.strip()] = Politica(partes[0].strip(), valor / 100 if relativo else valor, relativo, heartbeat)
+    return politicas
+
+
+def _numerico(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool) and math.isfinite(valor)
+
+
+class _Serie:
+    __slots__ = ('gravado_ts', 'gravado', 'retido_ts', 'retido', 'inclinacao_max', 'inclinacao_min')
+
+    def __init__(self, ts, valores):
+        self.gravado_ts = ts
+        self.gravado = valores
+        self.retido_ts = None
+        self.retido = None
+        self.inclinacao_max = {}  # campo -> menor inclinação superior (a porta de cima)
+        self.inclinacao_min = {}  # campo -> maior inclinação inferior (a porta de baixo)
+
+
+class Compressor:
+    def __init__(self, politicas, max_series=0, ocioso_apos=0.0):
+        self.politicas = politicas
+        self._series = CacheDeDispositivos(max_series, ocioso_apos)  # chave da série -> _Serie
+        self.gravadas = 0
+        self.suprimidas = 0
+
+    def filtrar(self, chave, tipo, ts_ns, valores):
+        """Retorna a lista de (ts_ns, valores) que devem ser gravados para esta amostra.
+
+        'chave' identifica a série (ex.: (device_id, sensor_id)). Pode retornar
+        nenhuma amostra, a atual, ou (swing) a amostra anterior que ficou retida.
+        """
+        politica = self.politicas.get(tipo)
+        if politica is None or not all(_numerico(v) for v in valores.values()):
+            self.gravadas += 1
+            return [(ts_ns, valores)]
+
+        serie = self._series.get(chave)
+        if serie is not None:
+            self._series.tocar(chave)
+        if (serie is None or serie.gravado.keys() != valores.keys()
+                or ts_ns - serie.gravado_ts >= politica.heartbeat_ns or ts_ns <= serie.gravado_ts):
+            # Primeira amostra, campos diferentes, heartbeat ou relógio voltando: grava e recomeça
+            # (com swing, a amostra retida também vai, para não perder o trecho até aqui)
+            saida = [(ts_ns, valores)]
+            if serie is not None and serie.retido is not None and serie.retido_ts < ts_ns:
+                saida.insert(0, (serie.retido_ts, serie.retido))
+            self._series[chave] = _Serie(ts_ns, valores)
+            self.gravadas += len(saida)
+            return saida
+
+        if politica.algoritmo == DEADBAND:
+            significativa = any(
+                abs(v - serie.gravado[campo]) > politica.tolerancia(serie.gravado[campo])
+                for campo, v in valores.items()
+            )
+            if significativa:
+                serie.gravado_ts, serie.gravado = ts_ns, valores
+                self.gravadas += 1
+                return [(ts_ns, valores)]
+            self.suprimidas += 1
+            return []
+
+        return self._swinging_door(chave, serie, politica, ts_ns, valores)
+
+    def __len__(self):
+        return len(self._series)
+
+    @property
+    def expulsas(self):
+        """Séries removidas do estado, por motivo (ver devicestate.MOTIVOS)."""
+        return self._series.expulsos
+
+    def _swinging_door(self, chave, serie, politica, ts_ns, valores):
+        if self._porta_aberta(serie, politica, ts_ns, valores):
+            serie.retido_ts, serie.retido = ts_ns, valores
+            self.suprimidas += 1
+            return []
+        # A porta fechou: grava a amostra retida e recomeça a partir dela
+        if serie.retido is None:
+            novo = _Serie(ts_ns, valores)
+            self.gravadas += 1
+            saida = [(ts_ns, valores)]
+        else:
+            novo = _Serie(serie.retido_ts, serie.retido)
+            self._porta_aberta(novo, politica, ts_ns, valores)
+            novo.retido_ts, novo.retido = ts_ns, valores
+            saida = [(serie.retido_ts, serie.retido)]
+            self.gravadas += 1
+        self._series[chave] = novo
+        return saida
+
+    def _porta_aberta(self, serie, politica, ts_ns, valores):
+        """Atualiza as inclinações da porta com a amostra; False se a porta fechou.
+
+        A amostra que fica retida é a que será gravada: a porta só continua
+        aberta se a reta até ela (e não só alguma reta) passa a menos de
+        'desvio' de todas as anteriores.
+        """
+        dt = (ts_ns - serie.gravado_ts) / 1e9
+        aberta = True
+        for campo, v in valores.items():
+            base = serie.gravado[campo]
+            tolerancia = politica.tolerancia(base)
+            superior = (v + tolerancia - base) / dt
+            inferior = (v - tolerancia - base) / dt
+            maximo = min(serie.inclinacao_max.get(campo, superior), superior)
+            minimo = max(serie.inclinacao_min.get(campo, inferior), inferior)
+            serie.inclinacao_max[campo] = maximo
+            serie.inclinacao_min[campo] = minimo
+            if not minimo <= (v - base) / dt <= maximo:
+                aberta = False
+        return aberta
@@ -0,0 +1,133 @@
+"""
+Faixas de prioridade para as mensagens do ingestor.
+
+- Controle: teclado, atuadores (tipos configuráveis) e tópicos que não são
+  de dados (regras, configurações). Sempre processada primeiro e nunca
+  descartada: são as mensagens que disparam as automações.
+- Telemetria: o resto das amostras de sensores.
+
+Sob sobrecarga só a telemetria sofre:
+- acima de 'coalescer_a_partir_de' mensagens pendentes, uma nova amostra de
+  um sensor que já tem amostra na fila substitui a pendente (fica a mais
+  recente);
+- acima de 'max_telemetria' a amostra nova é descartada;
+- com 'taxa_por_dispositivo' > 0, cada dispositivo tem um token bucket
+  (msgs/s, rajada de 1 s) e o excesso é descartado.
+
+Assim a fila de controle anda independente do volume de telemetria e a
+latência das automações fica limitada ao tempo de uma mensagem em
+processamento.
+
+Os baldes por dispositivo ficam num devicestate.CacheDeDispositivos (no
+máximo 'max_dispositivos'); um balde parado há mais de BALDE_OCIOSO s já
+estaria cheio, então removê-lo não muda nada. Os descartes por dispositivo
+(zerados a cada resumo no log) também param em 'max_dispositivos' ids
+distintos: o excedente é somado em OUTROS.
+"""
+
+import asyncio
+import time
+from collections import Counter, deque
+
+from devicestate import CacheDeDispositivos
+
+CONTROLE = 'control'
+TELEMETRIA = 'telemetry'
+
+# Motivos de descarte (label das métricas)
+COALESCIDA = 'coalesced'
+FILA_CHEIA = 'queue_full'
+TAXA_EXCEDIDA = 'rate_limited'
+
+BALDE_OCIOSO = 60.0  # s (a rajada enche em 1 s)
+OUTROS = '(outros)'
+
+
+class FaixasDePrioridade:
+    def __init__(self, coalescer_a_partir_de=2000, max_telemetria=10000, taxa_por_dispositivo=0.0,
+                 max_dispositivos=10000):
+        self.coalescer_a_partir_de = coalescer_a_partir_de
+        self.max_telemetria = max_telemetria
+        self.taxa_por_dispositivo = taxa_por_dispositivo
+        self.max_dispositivos = max_dispositivos
+        self._controle = deque()
+        self._telemetria = deque()  # entradas [chave, item]
+        self._pendentes = {}  # chave -> entrada mais recente ainda na fila
+        self._baldes = CacheDeDispositivos(max_dispositivos, BALDE_OCIOSO)  # dispositivo -> [tokens, último instante]
+        self._evento = asyncio.Event()
+        self.descartes = Counter()  # motivo -> quantidade
+        self.descartes_por_dispositivo = Counter()
+
+    def tamanho(self, faixa):
+        return len(self._controle) if faixa == CONTROLE else len(self._telemetria)
+
+    def colocar_controle(self, item):
+        self._controle.append(item)
+        self._evento.set()
+
+    def colocar_telemetria(self, chave, dispositivo, item, limitar_taxa=True):
+        """Enfileira uma amostra de telemetria.
+
+        Retorna None se entrou na fila, ou o motivo do descarte (COALESCIDA,
+        FILA_CHEIA, TAXA_EXCEDIDA). Com COALESCIDA a amostra nova ocupa o
+        lugar da pendente, e quem é perdida é a antiga.
+        """
+        if limitar_taxa and self.taxa_por_dispositivo > 0 and not self._consumir_token(dispositivo):
+            return self._descartar(TAXA_EXCEDIDA, dispositivo)
+        pendentes = len(self._telemetria)
+        if pendentes >= self.coalescer_a_partir_de:
+            entrada = self._pendentes.get(chave)
+            if entrada is not None:
+                entrada[1] = item
+                return self._descartar(COALESCIDA, dispositivo)
+            if pendentes >= self.max_telemetria:
+                return self._descartar(FILA_CHEIA, dispositivo)
+        entrada = [chave, item]
+        self._telemetria.append(entrada)
+        self._pendentes[chave] = entrada
+        self._evento.set()
+        return None
+
+    async def proximo(self):
+        """Retorna (faixa, item), sempre esvaziando a faixa de controle antes."""
+        while True:
+            if self._controle:
+                return CONTROLE, self._controle.popleft()
+            if self._telemetria:
+                chave, item = entrada = self._telemetria.popleft()
+                if self._pendentes.get(chave) is entrada:
+                    del self._pendentes[chave]
+                return TELEMETRIA, item
+            self._evento.clear()
+            await self._evento.wait()
+
+    def dispositivos_com_balde(self):
+        return len(self._baldes)
+
+    @property
+    def baldes_expulsos(self):
+        """Baldes removidos, por motivo (ver devicestate.MOTIVOS)."""
+        return self._baldes.expulsos
+
+    def _consumir_token(self, dispositivo):
+        agora = time.monotonic()
+        balde = self._baldes.get(dispositivo)
+        if balde is None:
+            balde = self._baldes[dispositivo] = [self.taxa_por_dispositivo, agora]
+        else:
+            self._baldes.tocar(dispositivo)
+            balde[0] = min(self.taxa_por_dispositivo, balde[0] + (agora - balde[1]) * self.taxa_por_dispositivo)
+            balde[1] = agora
+        if balde[0] < 1.0:
+            return False
+        balde[0] -= 1.0
+        return True
+
+    def _descartar(self, motivo, dispositivo):
+        self.descartes[motivo] += 1
+        por_dispositivo = self.descartes_por_dispositivo
+        if (self.max_dispositivos and dispositivo not in por_dispositivo
+                and len(por_dispositivo) >= self.max_dispositivos):
+            dispositivo = OUTROS
+        por_dispositivo[dispositivo] += 1
+        return motivo
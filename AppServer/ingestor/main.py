@@ -2,12 +2,32 @@ import asyncio
 import aiomqtt
 import aiohttp
 from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
-from influxdb_client import Point
 import os
 import json
+import logging
 import operator
 import time
-import traceback
+
+from collections import deque
+from datetime import datetime
+
+import influx_schema
+import metrics
+from devicestate import CacheDeDispositivos, ConfigSensor, MOTIVOS
+from cluster import Cluster, PREFIXO_ENCAMINHAMENTO
+from router import Roteador
+import lanes
+from compression import Compressor, parse_politicas
+from aggregates import RegistroDeJanelas
+from thresholds import GrupoDeLimiares, indexavel
+from spool import Spool
+from mqtt_session import Backoff, ConexaoMQTT
+from iotlog import setup_logging, lazy_json, lazy_trunc
+
+log = setup_logging('ingestor')
+# Categorias do caminho quente (amostráveis via LOG_SAMPLE / LOG_LEVELS)
+log_dados = logging.getLogger('ingestor.dados')
+log_regras = logging.getLogger('ingestor.regras')
 
 # --- Configurações (lidas das variáveis de ambiente) ---
 INFLUXDB_URL = os.getenv('INFLUXDB_URL')
@@ -17,12 +37,24 @@ INFLUXDB_BUCKET = os.getenv('INFLUXDB_BUCKET')
 MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST')
 MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT'))
 API_SERVER_URL = os.getenv('API_SERVER_URL', 'http://api_server:5000')
+# Layout no InfluxDB: 'sensor' (measurement por sensor, legado) ou 'tipo' (por tipo de sensor)
+INFLUX_SCHEMA = influx_schema.schema_configurado()
 
 # --- Tópicos MQTT ---
 MQTT_SENSOR_DATA_TOPIC = "+/sensors/+/data"
 MQTT_RULES_TOPIC = "rules/+"
 MQTT_RULES_CALLBACK_TOPIC = "callback/rules"
 
+# --- Sessão MQTT (ver mqtt_session.py) ---
+# Se o broker cair o ingestor reconecta sem reiniciar; com sessão persistente o
+# broker guarda as mensagens QoS 1 publicadas enquanto ele estava fora.
+MQTT_CLIENT_ID = os.getenv('MQTT_CLIENT_ID')  # padrão: '<MQTT_SHARE_GROUP>-<INGESTOR_INSTANCE_ID>'
+MQTT_CLEAN_SESSION = os.getenv('MQTT_CLEAN_SESSION', '0') == '1'
+MQTT_KEEPALIVE = int(os.getenv('MQTT_KEEPALIVE', '30'))  # s
+MQTT_RECONNECT_MIN = float(os.getenv('MQTT_RECONNECT_MIN', '0.5'))  # s antes da primeira nova tentativa
+MQTT_RECONNECT_MAX = float(os.getenv('MQTT_RECONNECT_MAX', '30'))  # backoff máximo (s)
+MQTT_STABLE_AFTER = 10.0  # s conectado para o backoff voltar ao mínimo
+
 # Sensor type enum mapping (from ESP32 Trabalho.hpp)
 SENSOR_TYPES = {
     0: "MPU_6050",
@@ -39,24 +71,192 @@ SENSOR_TYPES = {
 
 # Lista de tipos de sensores que DEVEM ser salvos como String (usando o ID numérico)
 STRING_SENSOR_TYPES = [7]  # TECLADO_4X4
+ATUADOR_TYPES = [4, 5]  # SG_90, RELE
+
+# --- Modo cluster (ver cluster.py) ---
+# N instâncias com o mesmo grupo dividem os dados via assinatura compartilhada;
+# cada uma precisa de um INGESTOR_INSTANCE_ID único entre 0 e N-1.
+INGESTOR_INSTANCES = int(os.getenv('INGESTOR_INSTANCES', '1'))
+INGESTOR_INSTANCE_ID = int(os.getenv('INGESTOR_INSTANCE_ID', '0'))
+MQTT_SHARE_GROUP = os.getenv('MQTT_SHARE_GROUP', 'ingestor')
+cluster = Cluster(INGESTOR_INSTANCES, INGESTOR_INSTANCE_ID, MQTT_SHARE_GROUP)
+MQTT_CLIENT_ID = MQTT_CLIENT_ID or f"{MQTT_SHARE_GROUP}-{INGESTOR_INSTANCE_ID}"
+
+# --- Faixas de prioridade (ver lanes.py) ---
+# Amostras destes tipos (e tópicos que não são de dados) vão para a faixa de controle
+PRIORITY_SENSOR_TYPES = {int(t) for t in os.getenv('PRIORITY_SENSOR_TYPES', '4,5,7').split(',') if t.strip()}
+TELEMETRY_COALESCE_AT = int(os.getenv('TELEMETRY_COALESCE_AT', '2000'))  # pendentes para começar a coalescer
+TELEMETRY_QUEUE_MAX = int(os.getenv('TELEMETRY_QUEUE_MAX', '10000'))  # pendentes para começar a descartar
+TELEMETRY_RATE_PER_DEVICE = float(os.getenv('TELEMETRY_RATE_PER_DEVICE', '0'))  # msgs/s por dispositivo (0 = sem limite)
+SHED_REPORT_INTERVAL = float(os.getenv('SHED_REPORT_INTERVAL', '30'))  # s entre resumos de descarte no log
+TELEMETRY_RATE_MAX_DEVICES = int(os.getenv('TELEMETRY_RATE_MAX_DEVICES', '10000'))  # baldes de taxa em memória
+faixas = lanes.FaixasDePrioridade(TELEMETRY_COALESCE_AT, TELEMETRY_QUEUE_MAX, TELEMETRY_RATE_PER_DEVICE,
+                                  TELEMETRY_RATE_MAX_DEVICES)
+mensagens_lidas = 0
+
+# --- Compressão das séries na escrita (ver compression.py) ---
+# Ex.: "DS18_B20=deadband:0.1,DHT_11=swing:0.2,RELE=deadband:0". Vazio = grava todas as amostras.
+COMPRESSION_POLICIES = os.getenv('COMPRESSION_POLICIES', '')
+COMPRESSION_HEARTBEAT = float(os.getenv('COMPRESSION_HEARTBEAT', '300'))  # s máximos sem gravar uma série
+# Estado por série (dispositivo, sensor) em memória: limite e remoção das paradas (0 desativa cada um)
+COMPRESSION_MAX_SERIES = int(os.getenv('COMPRESSION_MAX_SERIES', '50000'))
+COMPRESSION_IDLE_EVICT = float(os.getenv('COMPRESSION_IDLE_EVICT', str(7 * 24 * 3600)))
+compressor = Compressor(parse_politicas(COMPRESSION_POLICIES, COMPRESSION_HEARTBEAT),
+                        COMPRESSION_MAX_SERIES, COMPRESSION_IDLE_EVICT)
+
+# --- Condições com agregado em janela deslizante (ver aggregates.py) ---
+AGGREGATE_MAX_SAMPLES = int(os.getenv('AGGREGATE_MAX_SAMPLES', '10000'))  # amostras máximas por janela
+janelas = RegistroDeJanelas(AGGREGATE_MAX_SAMPLES)
+
+# --- Escrita no InfluxDB (fila em memória + spool em disco) ---
+# Os pontos entram numa fila e uma task escreve em lotes (tudo que estiver na
+# fila, até INFLUX_BATCH_SIZE pontos). Se o banco falhar ou a fila encher, os
+# pontos vão para o spool em disco e são reenviados em lotes grandes quando o
+# banco voltar.
+INFLUX_BATCH_SIZE = int(os.getenv('INFLUX_BATCH_SIZE', '5000'))
+INFLUX_QUEUE_MAX = int(os.getenv('INFLUX_QUEUE_MAX', '50000'))  # pontos em memória antes de ir para o spool
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+if cluster.ativo:
+    SPOOL_DIR = os.path.join(SPOOL_DIR, str(INGESTOR_INSTANCE_ID))  # um spool por instância
+SPOOL_MAX_MB = float(os.getenv('SPOOL_MAX_MB', '512'))
+SPOOL_SEGMENT_MB = float(os.getenv('SPOOL_SEGMENT_MB', '16'))
+SPOOL_REPLAY_BATCH = int(os.getenv('SPOOL_REPLAY_BATCH', '20000'))
+SPOOL_RETRY_MAX = float(os.getenv('SPOOL_RETRY_MAX', '30'))  # backoff máximo (s) entre tentativas com o banco fora
+
+fila_escrita = deque()  # (dados em line protocol, pontos, recebido_em, amostra_em)
+pontos_na_fila = 0
+evento_escrita = asyncio.Event()
+influx_disponivel = True
+spool = None
+
+# --- Métricas (formato Prometheus, servidas em http://<host>:METRICS_PORT/metrics) ---
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))  # 0 desativa o endpoint
+
+m_mensagens = metrics.Counter('ingestor_messages_total', 'Mensagens MQTT recebidas, por tipo', ['kind'])
+m_erros = metrics.Counter('ingestor_message_errors_total', 'Mensagens com erro, por estágio', ['stage'])
+m_estagio = metrics.Histogram('ingestor_stage_seconds', 'Duração de cada estágio do pipeline', ['stage'])
+m_amostra_ate_escrita = metrics.Histogram('ingestor_sample_to_write_seconds',
+                                          'Do timestamp da amostra (se enviado pelo dispositivo) até a escrita no InfluxDB')
+m_recebido_ate_escrita = metrics.Histogram('ingestor_receive_to_write_seconds',
+                                           'Do recebimento da mensagem até a escrita no InfluxDB')
+m_pontos = metrics.Counter('ingestor_points_written_total', 'Pontos escritos no InfluxDB')
+m_erros_influx = metrics.Counter('ingestor_influx_write_errors_total', 'Falhas de escrita no InfluxDB')
+m_acoes = metrics.Counter('ingestor_actuator_requests_total', 'Requisições HTTP de atuador feitas pelas regras', ['result'])
+m_lag = metrics.Gauge('ingestor_event_loop_lag_seconds', 'Último atraso medido do event loop')
+m_lag_hist = metrics.Histogram('ingestor_event_loop_lag_distribution_seconds', 'Distribuição do atraso do event loop')
+metrics.Gauge('ingestor_rules', 'Regras carregadas').set_function(lambda: len(regras))
+metrics.Gauge('ingestor_cached_devices', 'Dispositivos no cache de sensor_configs').set_function(lambda: len(sensor_configs))
+metrics.Gauge('ingestor_asyncio_tasks', 'Tasks ativas no event loop').set_function(lambda: len(asyncio.all_tasks()))
+metrics.Gauge('ingestor_write_queue_points', 'Pontos aguardando escrita em memória').set_function(lambda: pontos_na_fila)
+metrics.Gauge('ingestor_influx_up', '1 se a última escrita no InfluxDB funcionou').set_function(lambda: int(influx_disponivel))
+metrics.Gauge('ingestor_spool_bytes', 'Tamanho do spool em disco').set_function(lambda: spool.tamanho_bytes if spool else 0)
+metrics.Gauge('ingestor_spool_pending_points', 'Pontos no spool aguardando reenvio').set_function(
+    lambda: spool.linhas_pendentes if spool else 0)
+m_spool = metrics.Counter('ingestor_spool_points_total', 'Pontos que passaram pelo spool, por operação', ['op'])
+m_spool.labels('evicted').set_function(lambda: spool.descartadas if spool else 0)
+m_lote = metrics.Histogram('ingestor_write_batch_points', 'Pontos por escrita no InfluxDB',
+                           buckets=(1, 10, 100, 500, 1000, 5000, 10000, 20000, 50000))
+metrics.Gauge('ingestor_cluster_local_rules', 'Regras avaliadas por esta instância').set_function(
+    lambda: len(cluster.regras_locais))
+m_erros_rota = metrics.Counter('ingestor_route_errors_total', 'Exceções nos handlers de tópico, por rota', ['route'])
+m_espera_faixa = metrics.Histogram('ingestor_lane_wait_seconds', 'Espera na faixa de prioridade até o processamento', ['lane'])
+m_descartes = metrics.Counter('ingestor_shed_messages_total', 'Amostras de telemetria descartadas, por motivo', ['reason'])
+m_profundidade_faixa = metrics.Gauge('ingestor_lane_depth', 'Mensagens aguardando em cada faixa', ['lane'])
+for _faixa in (lanes.CONTROLE, lanes.TELEMETRIA):
+    m_profundidade_faixa.labels(_faixa).set_function(lambda f=_faixa: faixas.tamanho(f))
+for _motivo in (lanes.COALESCIDA, lanes.FILA_CHEIA, lanes.TAXA_EXCEDIDA):
+    m_descartes.labels(_motivo).set_function(lambda m=_motivo: faixas.descartes[m])
+m_compressao = metrics.Counter('ingestor_compression_samples_total',
+                               'Amostras no estágio de escrita: gravadas ou suprimidas pela compressão', ['result'])
+m_compressao.labels('stored').set_function(lambda: compressor.gravadas)
+m_compressao.labels('suppressed').set_function(lambda: compressor.suprimidas)
+metrics.Gauge('ingestor_rule_windows',
+              'Janelas deslizantes ativas das condições de agregado').set_function(lambda: len(janelas))
+m_encaminhadas = metrics.Counter('ingestor_cluster_forwarded_total',
+                                 'Amostras encaminhadas para outras instâncias do cluster')
+conexao = ConexaoMQTT()
+metrics.Gauge('ingestor_mqtt_connected', '1 se conectado ao broker MQTT').set_function(lambda: int(conexao.conectado))
+m_reconexoes = metrics.Counter('ingestor_mqtt_reconnects_total', 'Quedas da conexão MQTT seguidas de nova tentativa')
+
+# Séries do caminho quente resolvidas uma vez só
+m_parse = m_estagio.labels('parse')
+m_regras = m_estagio.labels('rules')
+m_http = m_estagio.labels('actuator_http')
+m_escrita = m_estagio.labels('influx_write')
+m_spool_gravados = m_spool.labels('spooled')
+m_spool_reenviados = m_spool.labels('replayed')
+m_sem_rota = m_mensagens.labels('unrouted')
 
 # --- Armazenamento de Regras (em memória) ---
 regras = {}
 RULES_CONFIG_FILE = 'rules_config.json' # <-- ADICIONE AQUI
 
+# Snapshot das regras já serializado, publicado (retido) em MQTT_RULES_CALLBACK_TOPIC
+# a cada mudança. A versão parte do relógio em ms na carga e só cresce, para que
+# um restart do ingestor nunca reutilize uma versão (ETag) já vista pela API.
+regras_versao = 0
+regras_snapshot = b'{"version": 0, "rules": []}'
+# Estado de execução do motor de regras: muda a cada amostra, não faz parte do snapshot
+CAMPOS_ESTADO_CONDICAO = ('last_state', 'time_stamp', '_satisfeita')
+CAMPOS_ESTADO_REGRA = ('_last_triggered_state', '_satisfeitas', '_total_condicoes')
+# Índices do motor de regras (só regras desta instância):
+# (id_device, id_sensor) -> [(regra_id, regra, condição), ...]  avaliadas uma a uma
+# (id_device, id_sensor) -> [GrupoDeLimiares, ...]              'limite' numéricas (ver thresholds.py)
+condicoes_por_sensor = {}
+limiares_por_sensor = {}
+# Relógio do motor de regras ('tempo' e janelas); o backtest troca por um relógio virtual
+relogio = time.time
+
 # --- Armazenamento de Configurações de Sensores (em memória) ---
-# Estrutura: {device_id: {sensor_id: {id, desc, tipo, pinos, atributo1, ...}}}
-sensor_configs = {}
+# Estrutura: {device_id: {sensor_id: ConfigSensor(id, desc, tipo, pinos, atributo1)}}
+# Limitado (ver devicestate.py): no máximo SENSOR_CONFIGS_MAX_DEVICES dispositivos (sai o sem dados
+# há mais tempo) e sem os que não mandam dados há SENSOR_CONFIGS_IDLE_EVICT s (0 desativa cada limite).
+# Dispositivos usados em regras nunca saem: as ações dependem da config em cache.
+SENSOR_CONFIGS_MAX_DEVICES = int(os.getenv('SENSOR_CONFIGS_MAX_DEVICES', '10000'))
+SENSOR_CONFIGS_IDLE_EVICT = float(os.getenv('SENSOR_CONFIGS_IDLE_EVICT', str(7 * 24 * 3600)))
+dispositivos_em_regras = set()
+
+def _sensor_config_expulso(device_id, sensores, motivo):
+    global sensor_configs_alterado
+    sensor_configs_alterado = True
+    log.debug("🧹 sensor_configs: %s removido do cache (%s, %s sensores)", device_id, motivo, len(sensores))
+
+sensor_configs = CacheDeDispositivos(SENSOR_CONFIGS_MAX_DEVICES, SENSOR_CONFIGS_IDLE_EVICT,
+                                     protegido=dispositivos_em_regras.__contains__,
+                                     ao_expulsar=_sensor_config_expulso)
+# Estado por dispositivo/série limitado: sensor_configs, séries da compressão e baldes de taxa
+_estado_por_dispositivo = {
+    'sensor_configs': (lambda: len(sensor_configs), lambda: sensor_configs.expulsos),
+    'compression': (lambda: len(compressor), lambda: compressor.expulsas),
+    'rate_limit': (faixas.dispositivos_com_balde, lambda: faixas.baldes_expulsos),
+}
+m_estado = metrics.Gauge('ingestor_device_state_entries', 'Entradas em memória por cache de estado por dispositivo',
+                         ['cache'])
+m_expulsos = metrics.Counter('ingestor_device_state_evictions_total',
+                             'Entradas removidas dos caches de estado por dispositivo, por motivo', ['cache', 'reason'])
+for _cache, (_tamanho, _expulsos) in _estado_por_dispositivo.items():
+    m_estado.labels(_cache).set_function(_tamanho)
+    for _motivo in MOTIVOS:
+        m_expulsos.labels(_cache, _motivo).set_function(lambda e=_expulsos, m=_motivo: e()[m])
+SENSOR_CONFIGS_FILE = 'sensor_configs.json'
+# Intervalo (s) entre gravações do snapshot em disco, se houver mudanças
+SENSOR_CONFIGS_FLUSH_INTERVAL = float(os.getenv('SENSOR_CONFIGS_FLUSH_INTERVAL', '5'))
+# Máximo de dispositivos consultados por segundo no refresh inicial
+SENSOR_CONFIGS_REFRESH_RATE = float(os.getenv('SENSOR_CONFIGS_REFRESH_RATE', '5'))
+sensor_configs_alterado = False
 
 def salvar_regras_no_arquivo():
     """Salva o dicionário 'regras' atual no arquivo JSON."""
     global regras
+    if not cluster.coordenador:
+        return  # no cluster só a instância 0 grava o arquivo compartilhado
     try:
         with open(RULES_CONFIG_FILE, 'w') as f:
             json.dump(regras, f, indent=4)
-        print(f"✅ Regras salvas com sucesso em {RULES_CONFIG_FILE}")
+        log.info("✅ Regras salvas com sucesso em %s", RULES_CONFIG_FILE)
     except Exception as e:
-        print(f"❌ Erro ao salvar regras no arquivo: {e}")
+        log.error("❌ Erro ao salvar regras no arquivo: %s", e)
 
 def carregar_regras_do_arquivo():
     """Carrega as regras do arquivo JSON para o dicionário 'regras'."""
@@ -67,24 +267,163 @@ def carregar_regras_do_arquivo():
                 # Evita erro se o arquivo estiver vazio
                 content = f.read()
                 if not content:
-                    print(f"ℹ️ Arquivo {RULES_CONFIG_FILE} está vazio. Começando com regras vazias.")
+                    log.info("ℹ️ Arquivo %s está vazio. Começando com regras vazias.", RULES_CONFIG_FILE)
                     regras = {}
                 else:
                     regras = json.loads(content)
-                    print(f"✅ Regras carregadas com sucesso de {RULES_CONFIG_FILE}. Total: {len(regras)}")
+                    log.info("✅ Regras carregadas com sucesso de %s. Total: %s", RULES_CONFIG_FILE, len(regras))
         except Exception as e:
-            print(f"⚠️ Erro ao carregar {RULES_CONFIG_FILE}: {e}. Começando com regras vazias.")
+            log.warning("⚠️ Erro ao carregar %s: %s. Começando com regras vazias.", RULES_CONFIG_FILE, e)
             regras = {}
     else:
-        print(f"ℹ️ Arquivo {RULES_CONFIG_FILE} não encontrado. Criando arquivo vazio...")
+        log.info("ℹ️ Arquivo %s não encontrado. Criando arquivo vazio...", RULES_CONFIG_FILE)
         regras = {}
         # Cria o arquivo vazio para garantir que ele exista
         try:
             with open(RULES_CONFIG_FILE, 'w') as f:
                 json.dump({}, f) # Escreve um JSON vazio
-            print(f"✅ Arquivo {RULES_CONFIG_FILE} criado com sucesso.")
+            log.info("✅ Arquivo %s criado com sucesso.", RULES_CONFIG_FILE)
+        except Exception as e:
+            log.error("❌ Erro ao criar %s: %s", RULES_CONFIG_FILE, e)
+    # Valor-verdade das condições não sobrevive ao restart: todas começam falsas
+    for regra in regras.values():
+        for c in regra.get('condicao', []):
+            if isinstance(c, dict):
+                c.pop('_satisfeita', None)
+    atualiza_snapshot_regras(time.time_ns() // 1_000_000)
+    reconstruir_indices()
+
+def reconstruir_indices():
+    """Recalcula os índices derivados de 'regras' (chamar após qualquer mudança nas regras)."""
+    global condicoes_por_sensor, limiares_por_sensor
+    cluster.reconstruir(regras)
+    janelas.reconstruir(regras)
+    # Atualizado no lugar: o cache de sensor_configs consulta este mesmo set
+    dispositivos_em_regras.clear()
+    dispositivos_em_regras.update(
+        item['id_device'] for regra in regras.values() for bloco in ('condicao', 'entao', 'senao')
+        for item in regra.get(bloco, []) if isinstance(item, dict) and item.get('id_device'))
+    # Recontagem das condições satisfeitas: condições novas (add/update) começam falsas
+    indice, grupos = {}, {}
+    for regra_id in cluster.regras_locais:
+        regra = regras[regra_id]
+        satisfeitas = total = 0
+        for c in regra.get('condicao', []):
+            if not isinstance(c, dict):
+                continue
+            total += 1
+            satisfeitas += bool(c.get('_satisfeita'))
+            sensor = (c.get('id_device'), c.get('id_sensor'))
+            if indexavel(c):
+                grupos.setdefault((sensor, c['medida'], c['operador']), []).append(
+                    (c['valor_limite'], (regra_id, regra, c)))
+            else:
+                indice.setdefault(sensor, []).append((regra_id, regra, c))
+        regra['_satisfeitas'] = satisfeitas
+        # Entradas que não são condições (fora do índice) não entram no veredito
+        regra['_total_condicoes'] = total
+    condicoes_por_sensor = indice
+    limiares_por_sensor = {}
+    for (sensor, medida, operador), entradas in grupos.items():
+        limiares_por_sensor.setdefault(sensor, []).append(GrupoDeLimiares(medida, operador, entradas))
+
+def _definicao_da_regra(regra):
+    """Cópia da regra sem os campos de estado de execução."""
+    definicao = {k: v for k, v in regra.items() if k not in CAMPOS_ESTADO_REGRA}
+    if isinstance(definicao.get('condicao'), list):
+        definicao['condicao'] = [
+            {k: v for k, v in c.items() if k not in CAMPOS_ESTADO_CONDICAO} if isinstance(c, dict) else c
+            for c in definicao['condicao']
+        ]
+    return definicao
+
+def atualiza_snapshot_regras(versao=None):
+    """Incrementa a versão e serializa o snapshot uma única vez por mudança."""
+    global regras_versao, regras_snapshot
+    regras_versao = max(regras_versao + 1, versao or 0)
+    regras_snapshot = json.dumps({
+        "version": regras_versao,
+        "rules": [_definicao_da_regra(r) for r in regras.values()]
+    }, separators=(',', ':')).encode('utf-8')
+
+def salvar_sensor_configs_no_arquivo():
+    """Grava o snapshot de 'sensor_configs' em disco (escrita atômica).
+
+    Os sensores são salvos como lista por dispositivo para preservar o tipo
+    do 'id' (o JSON converteria chaves inteiras em string).
+    """
+    global sensor_configs_alterado
+    if not cluster.coordenador:
+        return  # no cluster só a instância 0 grava o arquivo compartilhado
+    snapshot = {device_id: [cfg.to_dict() for cfg in sensores.values()] for device_id, sensores in sensor_configs.items()}
+    tmp_file = f"{SENSOR_CONFIGS_FILE}.tmp"
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_file, SENSOR_CONFIGS_FILE)
+        sensor_configs_alterado = False
+    except Exception as e:
+        log.error("❌ Erro ao salvar %s: %s", SENSOR_CONFIGS_FILE, e)
+
+def carregar_sensor_configs_do_arquivo():
+    """Carrega o snapshot de 'sensor_configs' salvo na última execução."""
+    if not os.path.exists(SENSOR_CONFIGS_FILE):
+        log.info("ℹ️ Arquivo %s não encontrado. Cache de sensores começa vazio.", SENSOR_CONFIGS_FILE)
+        return
+    try:
+        with open(SENSOR_CONFIGS_FILE, 'r') as f:
+            content = f.read()
+        snapshot = json.loads(content) if content else {}
+        sensor_configs.clear()
+        for device_id, sensores in snapshot.items():
+            sensor_configs[device_id] = {
+                cfg['id']: ConfigSensor.de_dict(cfg) for cfg in sensores if cfg.get('id') is not None
+            }
+        total = sum(len(s) for s in sensor_configs.values())
+        log.info("✅ Cache de sensores carregado de %s: %s dispositivos, %s sensores", SENSOR_CONFIGS_FILE, len(sensor_configs), total)
+    except Exception as e:
+        log.warning("⚠️ Erro ao carregar %s: %s. Cache de sensores começa vazio.", SENSOR_CONFIGS_FILE, e)
+        sensor_configs.clear()
+
+def atualiza_sensor_config(device_id, sensor_id, config):
+    """Atualiza o cache de um sensor, marcando o snapshot como alterado só se algo mudou."""
+    global sensor_configs_alterado
+    sensores = sensor_configs.setdefault(device_id, {})
+    if sensores.get(sensor_id) != config:
+        sensores[sensor_id] = config
+        sensor_configs_alterado = True
+
+def dispositivos_conhecidos():
+    """Retorna os dispositivos presentes no cache ou referenciados por alguma regra."""
+    return set(sensor_configs.keys()) | dispositivos_em_regras
+
+async def async_persistir_sensor_configs():
+    """Task de fundo: grava o snapshot periodicamente quando o cache muda."""
+    while True:
+        await asyncio.sleep(SENSOR_CONFIGS_FLUSH_INTERVAL)
+        # Sem dispositivos novos não há inserção para disparar a expiração por inatividade
+        sensor_configs.expirar()
+        if sensor_configs_alterado:
+            salvar_sensor_configs_no_arquivo()
+
+async def async_prefetch_sensor_configs(client):
+    """Solicita a configuração completa de todos os dispositivos conhecidos.
+
+    As respostas chegam em '+/settings/sensors/get/response' e preenchem o cache
+    pelo roteador normal. As requisições são espaçadas para não gerar rajadas
+    no broker nem nos ESP32 logo após um restart.
+    """
+    dispositivos = sorted(dispositivos_conhecidos())
+    if not dispositivos:
+        return
+    intervalo = 1.0 / SENSOR_CONFIGS_REFRESH_RATE if SENSOR_CONFIGS_REFRESH_RATE > 0 else 0
+    log.info("🔄 Atualizando configuração de %s dispositivos (%s/s)", len(dispositivos), SENSOR_CONFIGS_REFRESH_RATE)
+    for device_id in dispositivos:
+        try:
+            await client.publish(f"{device_id}/settings/sensors/get", "", qos=1)
         except Exception as e:
-            print(f"❌ Erro ao criar {RULES_CONFIG_FILE}: {e}")
+            log.warning("⚠️ Falha ao solicitar configuração de %s: %s", device_id, e)
+        await asyncio.sleep(intervalo)
 
 # --- Operadores para Regras ---
 operadores = {
@@ -99,78 +438,291 @@ operadores = {
 # --- Funções de Gerenciamento de Regras (Síncronas) ---
 # (Estas funções manipulam o dict 'regras' e são chamadas pelo loop principal)
 
+def reinicia_estado_das_condicoes(regra):
+    """Condições voltam a falsas: 'last_state' e o valor-verdade contado em '_satisfeitas' juntos.
+
+    Usa o relógio do motor (no backtest, o virtual) para o instante da mudança.
+    """
+    agora = relogio()
+    for c in regra['condicao']:
+        if isinstance(c, dict):
+            c['last_state'] = False
+            c['time_stamp'] = agora
+            c.pop('_satisfeita', None)
+
 def cria_regra(regra):
     try:
         id = regra['id_regra']
-        for c in regra['condicao']:
-            if c['tipo'] == 'limite':
-                c['last_state'] = False
-                c['time_stamp'] = time.time()
-            elif c['tipo'] == 'senha':
-                # Password conditions don't need time tracking, but initialize if needed
-                c['last_state'] = False
-                c['time_stamp'] = time.time()
+        reinicia_estado_das_condicoes(regra)
         regras[id] = regra
-        print(f"✅ Regra {id} criada com sucesso.")
+        log.info("✅ Regra %s criada com sucesso.", id)
         salvar_regras_no_arquivo()
+        atualiza_snapshot_regras()
     except Exception as e:
-        print(f"❌ Erro ao adicionar regra: {e}")
+        log.error("❌ Erro ao adicionar regra: %s", e)
 
 def atualiza_regra(regra):
     try:
         id = regra.get('id_regra')
         if not id:
-            print(f"❌ Erro ao atualizar regra: 'id_regra' não fornecido")
+            log.error("❌ Erro ao atualizar regra: 'id_regra' não fornecido")
             return
         
         if id in regras:
             regras[id].update(regra)
-            # Reinicializa o estado das condições
-            for c in regras[id]['condicao']:
-                if c['tipo'] == 'limite':
-                    c['last_state'] = False
-                    c['time_stamp'] = time.time()
-                elif c['tipo'] == 'senha':
-                    c['last_state'] = False
-                    c['time_stamp'] = time.time()
-            print(f"✅ Regra {id} atualizada com sucesso.")
+            # Reinicializa o estado das condições (inclusive as mantidas, se 'condicao' não veio)
+            reinicia_estado_das_condicoes(regras[id])
+            log.info("✅ Regra %s atualizada com sucesso.", id)
             salvar_regras_no_arquivo()
+            atualiza_snapshot_regras()
         else:
-            print(f"⚠️ Regra {id} não encontrada. Criando como nova...")
+            log.warning("⚠️ Regra %s não encontrada. Criando como nova...", id)
             cria_regra(regra)
     except Exception as e:
-        print(f"❌ Erro ao atualizar regra: {e}")
+        log.error("❌ Erro ao atualizar regra: %s", e)
 
 def deleta_regra(regra):
     try:
         id = regra.get('id_regra')
         if not id:
-            print(f"❌ Erro ao deletar regra: 'id_regra' não fornecido")
+            log.error("❌ Erro ao deletar regra: 'id_regra' não fornecido")
             return
         
         if id in regras:
             del regras[id]
-            print(f"✅ Regra {id} deletada com sucesso.")
+            log.info("✅ Regra %s deletada com sucesso.", id)
             salvar_regras_no_arquivo()
+            atualiza_snapshot_regras()
         else:
-            print(f"⚠️ Regra {id} não encontrada para deletar.")
+            log.warning("⚠️ Regra %s não encontrada para deletar.", id)
     except Exception as e:
-        print(f"❌ Erro ao deletar regra: {e}") 
+        log.error("❌ Erro ao deletar regra: %s", e)
+
+OPERACOES_LOTE = ('add', 'update', 'delete')
+
+def _valida_regra(regra):
+    """Retorna a mensagem de erro da regra, ou None se ela for válida."""
+    if not isinstance(regra, dict):
+        return "a regra deve ser um objeto JSON"
+    if not regra.get('id_regra'):
+        return "'id_regra' não fornecido"
+    for campo in ('condicao', 'entao', 'senao'):
+        if not isinstance(regra.get(campo), list):
+            return f"'{campo}' deve ser uma lista"
+    for c in regra['condicao']:
+        if not isinstance(c, dict) or 'tipo' not in c:
+            return "toda condição deve ser um objeto com 'tipo'"
+    return None
+
+def aplica_lote_de_regras(operacoes):
+    """Aplica um lote de add/update/delete como uma transação só.
+
+    Ou todas as operações são válidas e aplicadas, ou nenhuma é (as válidas
+    ficam com status 'skipped'). O arquivo é salvo e o snapshot atualizado
+    uma vez por lote. Retorna (aplicado, resultados por operação).
+    """
+    novas = dict(regras)
+    resultados = []
+    agora = time.time()
+    for i, operacao in enumerate(operacoes):
+        op = operacao.get('op') if isinstance(operacao, dict) else None
+        regra = operacao.get('regra') if isinstance(operacao, dict) else None
+        id = regra.get('id_regra') if isinstance(regra, dict) else None
+        resultado = {'index': i, 'op': op, 'id_regra': id}
+        erro = None
+        if op not in OPERACOES_LOTE:
+            erro = f"operação inválida: {op!r} (use {', '.join(OPERACOES_LOTE)})"
+        elif op == 'delete':
+            if not id:
+                erro = "'id_regra' não fornecido"
+            elif id not in novas:
+                erro = "regra não encontrada"
+            else:
+                del novas[id]
+                resultado['status'] = 'deleted'
+        else:
+            existe = id in novas
+            if op == 'update' and existe:
+                # Mesma semântica de atualiza_regra: os campos enviados sobrescrevem os atuais
+                regra = {**novas[id], **regra}
+            erro = _valida_regra(regra)
+            if not erro:
+                # Cópia com o estado das condições reinicializado (não altera a regra em uso)
+                regra = dict(regra, condicao=[
+                    dict({k: v for k, v in c.items() if k not in CAMPOS_ESTADO_CONDICAO},
+                         last_state=False, time_stamp=agora)
+                    for c in regra['condicao']
+                ])
+                novas[id] = regra
+                resultado['status'] = ('updated' if op == 'update' else 'replaced') if existe else 'created'
+        if erro:
+            resultado.update(status='error', error=erro)
+        resultados.append(resultado)
+
+    if any(r['status'] == 'error' for r in resultados):
+        for r in resultados:
+            if r['status'] != 'error':
+                r['status'] = 'skipped'
+        log.warning("⚠️ Lote de regras rejeitado: %s de %s operações inválidas",
+                    sum(r['status'] == 'error' for r in resultados), len(resultados))
+        return False, resultados
+    if resultados:
+        regras.clear()
+        regras.update(novas)
+        salvar_regras_no_arquivo()
+        atualiza_snapshot_regras()
+    log.info("✅ Lote de regras aplicado: %s operações (%s regras)", len(resultados), len(regras))
+    return True, resultados
+
+def _timestamp_da_amostra(data):
+    """Extrai o instante (epoch, s) em que a amostra foi gerada, se o payload trouxer 'timestamp'."""
+    ts = data.get('timestamp')
+    if ts is None:
+        return None
+    try:
+        if isinstance(ts, (int, float)):
+            return ts / 1000.0 if ts > 1e11 else float(ts)
+        return datetime.fromisoformat(ts.replace('Z', '+00:00')).timestamp()
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def enfileirar_pontos(record, recebido_em, amostra_em=None):
+    """Coloca ponto(s) na fila de escrita (ou no spool, se a fila estiver cheia).
+
+    Retorna True se algum ponto foi aceito. A escrita acontece em lote na
+    task async_escritor_influx.
+    """
+    global pontos_na_fila
+    pontos = record if isinstance(record, list) else [record]
+    linhas = [p.to_line_protocol() for p in pontos]
+    linhas = [l for l in linhas if l]
+    if not linhas:
+        return False
+    dados = ('\n'.join(linhas) + '\n').encode('utf-8')
+    if pontos_na_fila + len(linhas) > INFLUX_QUEUE_MAX:
+        # Escrita não está dando conta: vai direto para o disco
+        spool.anexar(dados, len(linhas))
+        m_spool_gravados.inc(len(linhas))
+        return True
+    fila_escrita.append((dados, len(linhas), recebido_em, amostra_em))
+    pontos_na_fila += len(linhas)
+    evento_escrita.set()
+    return True
+
+async def async_escrever_lote(write_api, dados, pontos):
+    """Escreve um lote em line protocol no InfluxDB. Retorna True se escreveu."""
+    global influx_disponivel
+    inicio = time.perf_counter()
+    try:
+        await write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=dados)
+    except Exception as e:
+        m_erros_influx.inc()
+        if influx_disponivel:
+            log.error("❌ [Influx] Erro ao escrever %s pontos: %s. Desviando para o spool em disco.", pontos, e)
+        influx_disponivel = False
+        return False
+    m_escrita.observe(time.perf_counter() - inicio)
+    m_lote.observe(pontos)
+    m_pontos.inc(pontos)
+    if not influx_disponivel:
+        log.info("✅ [Influx] Escrita normalizada.")
+    influx_disponivel = True
+    return True
+
+async def async_escritor_influx(write_api):
+    """Task de fundo: esvazia a fila em lotes; em falha (ou com o banco fora) manda para o spool."""
+    global pontos_na_fila
+    while True:
+        await evento_escrita.wait()
+        evento_escrita.clear()
+        while fila_escrita:
+            lote, total = [], 0
+            while fila_escrita and total < INFLUX_BATCH_SIZE:
+                item = fila_escrita.popleft()
+                lote.append(item)
+                total += item[1]
+            pontos_na_fila -= total
+            dados = b''.join(item[0] for item in lote)
+            try:
+                escreveu = influx_disponivel and await async_escrever_lote(write_api, dados, total)
+            except asyncio.CancelledError:
+                # Encerrando no meio de uma escrita: o lote vai para o disco
+                spool.anexar(dados, total)
+                raise
+            if escreveu:
+                agora = time.time()
+                for _, _, recebido_em, amostra_em in lote:
+                    m_recebido_ate_escrita.observe(agora - recebido_em)
+                    if amostra_em is not None:
+                        m_amostra_ate_escrita.observe(max(0.0, agora - amostra_em))
+            else:
+                spool.anexar(dados, total)
+                m_spool_gravados.inc(total)
+
+async def async_reenviar_spool(write_api):
+    """Task de fundo: reenvia o spool em lotes grandes; com o banco fora, tenta com backoff."""
+    espera = 1.0
+    while True:
+        await asyncio.sleep(espera)
+        try:
+            while not spool.vazio:
+                dados, pontos, posicao = spool.ler_lote(SPOOL_REPLAY_BATCH)
+                if not pontos or not await async_escrever_lote(write_api, dados, pontos):
+                    break
+                spool.confirmar(posicao, pontos)
+                m_spool_reenviados.inc(pontos)
+                log.info("📤 Spool: %s pontos reenviados (%s pendentes)", pontos, spool.linhas_pendentes)
+                await asyncio.sleep(0)  # não monopoliza o loop durante um replay longo
+        except Exception as e:
+            # Sem isso a task morre calada e o spool só volta a ser drenado num restart
+            log.exception("❌ Erro no reenvio do spool: %s", e)
+        if spool.vazio:
+            espera = 1.0
+        else:
+            espera = min(espera * 2, SPOOL_RETRY_MAX)
+
+def descarregar_fila_no_spool():
+    """No encerramento: o que ainda estava na fila vai para o disco em vez de se perder."""
+    global pontos_na_fila
+    while fila_escrita:
+        dados, pontos, _, _ = fila_escrita.popleft()
+        spool.anexar(dados, pontos)
+        m_spool_gravados.inc(pontos)
+    pontos_na_fila = 0
+
+async def async_post_atuador(url, payload):
+    """POST para a API de configuração de sensores. Retorna (status, texto de erro ou None)."""
+    inicio = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json=payload, headers={'Content-Type': 'application/json'}) as response:
+                if response.status == 200:
+                    m_acoes.labels('ok').inc()
+                    return response.status, None
+                m_acoes.labels('http_error').inc()
+                return response.status, await response.text()
+    except Exception:
+        m_acoes.labels('exception').inc()
+        raise
+    finally:
+        m_http.observe(time.perf_counter() - inicio)
 
 async def async_get_regra(client):
+    """Publica o snapshot atual das regras (retido) em MQTT_RULES_CALLBACK_TOPIC.
+
+    O payload já está serializado: nada é reconstruído por requisição. Como a
+    mensagem é retida, a API recebe o snapshot assim que (re)assina o tópico.
+    No cluster só a instância 0 publica.
+    """
+    if not cluster.coordenador:
+        return
     try:
-        # Convert regras dict to array format expected by API
-        rules_array = list(regras.values())
-        response_payload = {"rules": rules_array}
-        
-        print(f"📤 GET RULES: Enviando {len(rules_array)} regras para {MQTT_RULES_CALLBACK_TOPIC}")
-        print(f"   Regras: {json.dumps(response_payload, indent=2)}")
-        
-        await client.publish(MQTT_RULES_CALLBACK_TOPIC, json.dumps(response_payload))
-        print(f"✅ Regras publicadas com sucesso no {MQTT_RULES_CALLBACK_TOPIC}.")
+        await client.publish(MQTT_RULES_CALLBACK_TOPIC, regras_snapshot, qos=1, retain=True)
+        log.info("📤 Snapshot de regras v%s publicado em %s (%s regras, %s bytes)",
+                 regras_versao, MQTT_RULES_CALLBACK_TOPIC, len(regras), len(regras_snapshot))
+        log.debug("   Regras: %s", lazy_trunc(regras_snapshot, 500))
     except Exception as e:
-        print(f"❌ Erro ao retornar regras: {e}")
-        traceback.print_exc()
+        log.exception("❌ Erro ao publicar snapshot de regras: %s", e)
 
 # --- Funções de Execução de Regras (Assíncronas) ---
 
@@ -189,23 +741,17 @@ async def async_executar_comando(client, id_device, id_atuador, valor, modo='set
             
             # Handle toggle mode
             if modo == 'toggle':
-                current_value = cached.get("atributo1", 0)
+                current_value = cached.atributo1
                 # Toggle: 0 -> 1, any non-zero -> 0
                 valor = 0 if current_value else 1
-                print(f"🔄 Toggle mode: {current_value} -> {valor}")
+                log.info("🔄 Toggle mode: %s -> %s", current_value, valor)
             
-            sensor_config = {
-                "id": cached.get("id", id_atuador),
-                "desc": cached.get("desc", ""),
-                "tipo": cached.get("tipo"),
-                "atributo1": valor,
-                "pinos": cached.get("pinos", [])
-            }
+            sensor_config = cached.to_dict(atributo1=valor)
         else:
             # Minimal config if not cached
-            print(f"  ⚠️ Configuração do sensor {id_atuador} não encontrada no cache. Usando config mínima.")
+            log.warning("  ⚠️ Configuração do sensor %s não encontrada no cache. Usando config mínima.", id_atuador)
             if modo == 'toggle':
-                print(f"  ⚠️ Toggle mode requires cached state - defaulting to valor=1")
+                log.warning("  ⚠️ Toggle mode requires cached state - defaulting to valor=1")
                 valor = 1
             sensor_config = {
                 "id": id_atuador,
@@ -216,19 +762,16 @@ async def async_executar_comando(client, id_device, id_atuador, valor, modo='set
         url = f"{API_SERVER_URL}/{id_device}/settings/sensors/set"
         payload = {"sensors": [sensor_config]}
         
-        print(f"📤 Regra (Comando): Enviando HTTP POST para {url}")
-        print(f"   Payload: {json.dumps(payload)}")
+        log.info("📤 Regra (Comando): Enviando HTTP POST para %s", url)
+        log.debug("   Payload: %s", lazy_json(payload))
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers={'Content-Type': 'application/json'}) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"❌ API Error: {response.status} - {error_text}")
-                else:
-                    print(f"✅ Regra (Comando): Atuador {id_atuador} atualizado para {valor}")
+        status, error_text = await async_post_atuador(url, payload)
+        if status != 200:
+            log.error("❌ API Error: %s - %s", status, error_text)
+        else:
+            log.info("✅ Regra (Comando): Atuador %s atualizado para %s", id_atuador, valor)
     except Exception as e:
-        print(f"❌ Erro em 'async_executar_comando': {e}")
-        traceback.print_exc()
+        log.exception("❌ Erro em 'async_executar_comando': %s", e)
 
 async def async_executar_temporizado(client, id_device, id_atuador, tempo, valor):
     """(Função ASSÍNCRONA) Executa um comando via HTTP e o reverte após 'tempo'."""
@@ -237,12 +780,8 @@ async def async_executar_temporizado(client, id_device, id_atuador, tempo, valor
         base_config = {}
         if id_device in sensor_configs and id_atuador in sensor_configs[id_device]:
             cached = sensor_configs[id_device][id_atuador]
-            base_config = {
-                "id": cached.get("id", id_atuador),
-                "desc": cached.get("desc", ""),
-                "tipo": cached.get("tipo"),
-                "pinos": cached.get("pinos", [])
-            }
+            base_config = cached.to_dict()
+            del base_config['atributo1']
         else:
             base_config = {"id": id_atuador}
         
@@ -251,16 +790,14 @@ async def async_executar_temporizado(client, id_device, id_atuador, tempo, valor
         sensor_config_on = {**base_config, "atributo1": valor}
         payload_on = {"sensors": [sensor_config_on]}
         
-        print(f"📤 Regra (ON): Enviando HTTP POST para {url}")
-        print(f"   Payload: {json.dumps(payload_on)}")
+        log.info("📤 Regra (ON): Enviando HTTP POST para %s", url)
+        log.debug("   Payload: %s", lazy_json(payload_on))
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload_on, headers={'Content-Type': 'application/json'}) as response:
-                if response.status == 200:
-                    print(f"✅ Regra (ON): Atuador {id_atuador} ativado com valor {valor}")
-                else:
-                    error_text = await response.text()
-                    print(f"❌ API Error (ON): {response.status} - {error_text}")
+        status, error_text = await async_post_atuador(url, payload_on)
+        if status == 200:
+            log.info("✅ Regra (ON): Atuador %s ativado com valor %s", id_atuador, valor)
+        else:
+            log.error("❌ API Error (ON): %s - %s", status, error_text)
 
         # Aguarda o tempo definido
         await asyncio.sleep(tempo) 
@@ -269,385 +806,580 @@ async def async_executar_temporizado(client, id_device, id_atuador, tempo, valor
         sensor_config_off = {**base_config, "atributo1": 0}
         payload_off = {"sensors": [sensor_config_off]}
         
-        print(f"📤 Regra (OFF): Enviando HTTP POST para {url}")
-        print(f"   Payload: {json.dumps(payload_off)}")
+        log.info("📤 Regra (OFF): Enviando HTTP POST para %s", url)
+        log.debug("   Payload: %s", lazy_json(payload_off))
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload_off, headers={'Content-Type': 'application/json'}) as response:
-                if response.status == 200:
-                    print(f"✅ Regra (OFF): Atuador {id_atuador} desativado")
-                else:
-                    error_text = await response.text()
-                    print(f"❌ API Error (OFF): {response.status} - {error_text}")
+        status, error_text = await async_post_atuador(url, payload_off)
+        if status == 200:
+            log.info("✅ Regra (OFF): Atuador %s desativado", id_atuador)
+        else:
+            log.error("❌ API Error (OFF): %s - %s", status, error_text)
 
     except Exception as e:
-        print(f"❌ Erro na task 'async_executar_temporizado': {e}")
-        traceback.print_exc() 
+        log.exception("❌ Erro na task 'async_executar_temporizado': %s", e)
+
+def avaliar_condicao(regra_id, c, value, agora):
+    """Valor-verdade de uma condição para a amostra do seu sensor (sem considerar 'tempo')."""
+    if c.get('tipo') == 'senha':
+        # Password condition - compare entire input string
+        try:
+            if isinstance(value, dict):
+                # For keypad, the string is in value['input']
+                valor_sensor = str(value.get('input', ''))
+            else:
+                valor_sensor = str(value)
+            
+            senha_esperada = c.get('senha', '')
+            state = (valor_sensor == senha_esperada)
+            
+            log_regras.debug("  [Regra %s] Password check: '%s' == '%s' → %s", regra_id, valor_sensor, senha_esperada, state)
+            return state
+        except (KeyError, ValueError, TypeError) as e:
+            log_regras.warning("  [Regra %s] Erro ao verificar senha em %s (%s): %s", regra_id, value, type(value).__name__, e)
+            return False
+    
+    if c.get('tipo') == 'agregado':
+        # Agregado da janela deslizante: janela vazia nunca satisfaz a condição
+        valor_agregado = janelas.valor(c, agora)
+        try:
+            state = valor_agregado is not None and operadores[c['operador']](valor_agregado, float(c['valor_limite']))
+        except (KeyError, ValueError, TypeError) as e:
+            log_regras.warning("  [Regra %s] Condição 'agregado' inválida: %s", regra_id, e)
+            return False
+        log_regras.debug("  [Regra %s] %s(%s, %ss) = %s", regra_id, c.get('funcao'), c.get('medida'), c.get('janela'), valor_agregado)
+        return state
+    
+    # tipo == 'limite' or default
+    # Limit condition - compare specific field value
+    try:
+        medida = c['medida']
+        if isinstance(value, dict):
+            # Dict access for named fields (e.g., {"x": 1951, "y": 1981, "bt": 0})
+            valor_sensor = value[medida]
+        else:
+            # Single value (for actuators)
+            valor_sensor = value
+        
+        # Determine if we need to compare as strings or numbers
+        valor_limite = c['valor_limite']
+        
+        # If valor_limite is a string, compare as strings
+        if isinstance(valor_limite, str):
+            valor_sensor = str(valor_sensor)
+        else:
+            # Otherwise, compare as numbers
+            valor_sensor = float(valor_sensor)
+            valor_limite = float(valor_limite)
+        
+        # Compara o valor (works for both strings and numbers)
+        return operadores[c['operador']](valor_sensor, valor_limite)
+    except (KeyError, ValueError, TypeError) as e:
+        log_regras.warning("  [Regra %s] Medida '%s' não encontrada ou valor inválido em %s (%s): %s", regra_id, c.get('medida'), value, type(value).__name__, e)
+        return False
+
+def atualiza_condicao(regra, c, state, agora):
+    """Aplica o novo valor-verdade da condição e ajusta o contador da regra.
+
+    Retorna se a condição está satisfeita, ou None se está verdadeira mas
+    ainda não completou o 'tempo'.
+    """
+    # Track state changes (o instante da mudança conta para o 'tempo')
+    if state != c.get('last_state'):
+        c['last_state'] = state
+        c['time_stamp'] = agora
+    
+    # Password conditions are instant; limit conditions may require the state to hold for 'tempo' seconds
+    tempo = 0 if c.get('tipo') == 'senha' else c.get('tempo', 0)
+    satisfeita = state and (tempo == 0 or agora - c['time_stamp'] >= tempo)
+    if satisfeita != c.get('_satisfeita', False):
+        c['_satisfeita'] = satisfeita
+        regra['_satisfeitas'] += 1 if satisfeita else -1
+    return None if state and not satisfeita else satisfeita
 
 async def async_verificar_regras(client, id_device, id_sensor, value):
-    """Verifica todas as regras com base em um novo dado de sensor.
+    """Verifica as regras afetadas por um novo dado de sensor.
+    
+    Só as condições deste sensor são reavaliadas (índice 'condicoes_por_sensor').
+    Condições 'limite' numéricas ficam em grupos de limiares ordenados
+    ('limiares_por_sensor'): uma busca binária por grupo acha as que mudaram
+    de valor e só essas são atualizadas.
+    Cada condição guarda se está satisfeita e cada regra quantas das suas estão:
+    a regra é verdadeira quando todas estão, independente de qual sensor chegou
+    por último.
     
     Executa ações apenas em TRANSIÇÕES de estado (false→true ou true→false)
     para evitar execuções repetidas enquanto a condição permanece verdadeira.
     """
+    # As janelas dos agregados recebem a amostra uma vez, antes das regras
+    agora = relogio()
+    janelas.adicionar(id_device, id_sensor, value, agora)
     
-    for regra_id in list(regras.keys()):
+    # 1. Atualiza as condições deste sensor e os contadores das regras
+    afetadas = {}
+    for regra_id, regra, c in condicoes_por_sensor.get((id_device, id_sensor), ()):
         try:
-            if regra_id not in regras:
-                continue 
-                
-            regra = regras[regra_id]
-            # Inicia assumindo que a condição é Falsa até que seja provada Verdadeira
-            resposta_final_condicao = True
-            
-            # 1. Avalia as Condições
-            condicao_atendida = False
-            for c in regra["condicao"]:
-                # Verifica se a condição é para este sensor/device
-                if c.get('id_device') == id_device and c.get('id_sensor') == id_sensor:
-                    condicao_atendida = True # Marcamos que este sensor é relevante para esta regra
-                    
-                    # Handle different condition types
-                    if c.get('tipo') == 'senha':
-                        # Password condition - compare entire input string
-                        try:
-                            if isinstance(value, dict):
-                                # For keypad, the string is in value['input']
-                                valor_sensor = str(value.get('input', ''))
-                            else:
-                                valor_sensor = str(value)
-                            
-                            senha_esperada = c.get('senha', '')
-                            state = (valor_sensor == senha_esperada)
-                            
-                            print(f"  [Regra {regra_id}] Password check: '{valor_sensor}' == '{senha_esperada}' → {state}")
-                            
-                        except (KeyError, ValueError, TypeError) as e:
-                            print(f"  [Regra {regra_id}] Erro ao verificar senha em {value} ({type(value).__name__}): {e}")
-                            resposta_final_condicao = False
-                            break
-                    
-                    else:  # tipo == 'limite' or default
-                        # Limit condition - compare specific field value
-                        try:
-                            medida = c['medida']
-                            if isinstance(value, dict):
-                                # Dict access for named fields (e.g., {"x": 1951, "y": 1981, "bt": 0})
-                                valor_sensor = value[medida]
-                            else:
-                                # Single value (for actuators)
-                                valor_sensor = value
-                            
-                            # Determine if we need to compare as strings or numbers
-                            valor_limite = c['valor_limite']
-                            
-                            # If valor_limite is a string, compare as strings
-                            if isinstance(valor_limite, str):
-                                valor_sensor = str(valor_sensor)
-                            else:
-                                # Otherwise, compare as numbers
-                                valor_sensor = float(valor_sensor)
-                                valor_limite = float(valor_limite)
-                                
-                        except (KeyError, ValueError, TypeError) as e:
-                            print(f"  [Regra {regra_id}] Medida '{c.get('medida')}' não encontrada ou valor inválido em {value} ({type(value).__name__}): {e}")
-                            resposta_final_condicao = False
-                            break # Se uma condição falha, a resposta_final é Falsa
-                        
-                        # Compara o valor (works for both strings and numbers)
-                        state = operadores[c['operador']](valor_sensor, valor_limite)
-                    
-                    # Track state changes for transitions
-                    if state != c.get('last_state', not state):
-                        c['last_state'] = state
-                        c['time_stamp'] = time.time()
-                    else:
-                        if state==False:
-                            condicao_atendida = False
-                            break
-                    
-                    # Time tracking - only for limit conditions with tempo field
-                    if c.get('tipo') == 'senha':
-                        # Password conditions are instant - no time delay
-                        if not state:
-                            resposta_final_condicao = False
-                            break
-                    else:
-                        # Limit conditions may have time requirements
-                        tempo = c.get('tempo', 0)
-                        if tempo == 0:
-                            # Regra sem tempo, só checa o estado
-                            if not state:
-                                resposta_final_condicao = False
-                                break
-                        else:
-                            # Regra com tempo
-                            duracao_estado_atual = time.time() - c['time_stamp']
-                            if not (state and duracao_estado_atual >= tempo):
-                                # Se estado for Falso, ou se for Verdadeiro mas tempo não atingido
-                                resposta_final_condicao = False
-                                break
-
-            # Se o sensor não era relevante para nenhuma condição da regra, não faz nada
-            if not condicao_atendida:
-                continue
+            state = avaliar_condicao(regra_id, c, value, agora)
+        except Exception as e:
+            log.exception("❌ Erro ao avaliar condição da regra %s: %s", regra_id, e)
+            state = False
+        atualiza_condicao(regra, c, state, agora)
+        afetadas[regra_id] = regra
+    
+    for grupo in limiares_por_sensor.get((id_device, id_sensor), ()):
+        try:
+            valor_sensor = float(value[grupo.medida] if isinstance(value, dict) else value)
+        except (KeyError, ValueError, TypeError) as e:
+            log_regras.warning("  Medida '%s' não encontrada ou valor inválido em %s (%s): %s", grupo.medida, value, type(value).__name__, e)
+            valor_sensor = None
+        for posicao, (regra_id, regra, c), state in grupo.atualizar(valor_sensor):
+            # Verdadeira mas ainda esperando 'tempo': reavaliada nas próximas amostras
+            if atualiza_condicao(regra, c, state, agora) is None:
+                grupo.pendentes.add(posicao)
+            else:
+                grupo.pendentes.discard(posicao)
+            afetadas[regra_id] = regra
+    
+    # 2. Veredito das regras afetadas em O(1) pelo contador
+    for regra_id, regra in afetadas.items():
+        resposta = regra['_satisfeitas'] == regra['_total_condicoes']
+        
+        # Só executa ações se houve mudança de estado (debouncing)
+        if regra.get('_last_triggered_state', None) == resposta:
+            continue
+        
+        # Atualiza o estado anterior da regra
+        regra['_last_triggered_state'] = resposta
+        try:
+            await async_executar_acoes(client, regra_id, regra, resposta)
+        except Exception as e:
+            log.exception("❌ Erro ao executar ações da regra %s: %s", regra_id, e)
 
-            # Verifica se houve mudança de estado da regra (transição)
-            last_rule_state = regra.get('_last_triggered_state', None)
-            state_changed = (last_rule_state != resposta_final_condicao)
-            
-            # Só executa ações se houve mudança de estado (debouncing)
-            if not state_changed:
-                # Estado não mudou - não executa ações novamente
-                continue
-            
-            # Atualiza o estado anterior da regra
-            regra['_last_triggered_state'] = resposta_final_condicao
-            
-            # 2. Executa Ações (ENTAO / SENAO) - APENAS EM TRANSIÇÕES
-            if resposta_final_condicao:
-                print(f"  🔔 [Regra {regra_id}] Transição FALSE → TRUE: Executando bloco THEN")
-                # Executa o bloco "ENTAO"
-                for e in regra.get("entao", []):
-                    modo = e.get("modo", "set")  # Default to 'set' for backward compatibility
-                    if e["tempo"] != 0:
-                        # Dispara em background como uma nova Task
-                        asyncio.create_task(async_executar_temporizado(
-                            client, e["id_device"], e["id_atuador"], e["tempo"], e["valor"]
-                        ))
-                    else:
-                        # Executa comando simples
-                        await async_executar_comando(
-                            client, e["id_device"], e["id_atuador"], e["valor"], modo
-                        )
+async def async_executar_acoes(client, regra_id, regra, resposta):
+    """Executa o bloco ENTAO (resposta verdadeira) ou SENAO da regra."""
+    if resposta:
+        log_regras.info("  🔔 [Regra %s] Transição FALSE → TRUE: Executando bloco THEN", regra_id)
+        # Executa o bloco "ENTAO"
+        for e in regra.get("entao", []):
+            modo = e.get("modo", "set")  # Default to 'set' for backward compatibility
+            if e["tempo"] != 0:
+                # Dispara em background como uma nova Task
+                asyncio.create_task(async_executar_temporizado(
+                    client, e["id_device"], e["id_atuador"], e["tempo"], e["valor"]
+                ))
             else:
-                print(f"  🔔 [Regra {regra_id}] Transição TRUE → FALSE: Executando bloco ELSE")
-                # Executa o bloco "SENAO"
-                for e in regra.get("senao", []):
-                    modo = e.get("modo", "set")  # Default to 'set' for backward compatibility
-                    if e["tempo"] != 0:
-                        asyncio.create_task(async_executar_temporizado(
-                            client, e["id_device"], e["id_atuador"], e["tempo"], e["valor"]
-                        ))
-                    else:
-                        await async_executar_comando(
-                            client, e["id_device"], e["id_atuador"], e["valor"], modo
-                        )
-                        
+                # Executa comando simples
+                await async_executar_comando(
+                    client, e["id_device"], e["id_atuador"], e["valor"], modo
+                )
+    else:
+        log_regras.info("  🔔 [Regra %s] Transição TRUE → FALSE: Executando bloco ELSE", regra_id)
+        # Executa o bloco "SENAO"
+        for e in regra.get("senao", []):
+            modo = e.get("modo", "set")  # Default to 'set' for backward compatibility
+            if e["tempo"] != 0:
+                asyncio.create_task(async_executar_temporizado(
+                    client, e["id_device"], e["id_atuador"], e["tempo"], e["valor"]
+                ))
+            else:
+                await async_executar_comando(
+                    client, e["id_device"], e["id_atuador"], e["valor"], modo
+                )
+
+# --- Roteador de Tópicos (ver router.py) ---
+# Cada rota conta suas mensagens em ingestor_messages_total{kind=<rota>}
+roteador = Roteador(m_mensagens, m_erros_rota)
+
+@roteador.rota(MQTT_RULES_TOPIC, 'rules')
+async def tratar_regras(client, message, data, parts, recebido_em):
+    """Tópicos de Regras (rules/+)."""
+    log.info("🔀 ROTEADOR DE REGRAS: Ação = %s", parts[1])
+    versao_anterior = regras_versao
+    resposta_lote = None
+    if parts[1] == 'add':
+        log.info("  ➕ ADD RULE: %s", data.get('id_regra', 'SEM_ID'))
+        cria_regra(data)
+    elif parts[1] == 'update':
+        log.info("  ✏️ UPDATE RULE: %s", data.get('id_regra', 'SEM_ID'))
+        atualiza_regra(data)
+    elif parts[1] == 'delete':
+        log.info("  🗑️ DELETE RULE: %s", data.get('id_regra', 'SEM_ID'))
+        deleta_regra(data)
+    elif parts[1] == 'bulk':
+        operacoes = data.get('operacoes', [])
+        log.info("  📦 BULK: lote %s com %s operações", data.get('id_lote'), len(operacoes))
+        aplicado, resultados = aplica_lote_de_regras(operacoes)
+        resposta_lote = {"id_lote": data.get('id_lote'), "aplicado": aplicado, "resultados": resultados}
+    elif parts[1] == 'get':
+        log.info("  📋 GET RULES: Retornando todas as regras")
+        await async_get_regra(client)
+    # Regras mudaram: publica a nova versão do snapshot
+    if regras_versao != versao_anterior:
+        reconstruir_indices()
+        await async_get_regra(client)
+    # Resultado do lote (depois do snapshot, para a API já ter a versão nova ao responder)
+    if resposta_lote is not None and resposta_lote['id_lote'] and cluster.coordenador:
+        resposta_lote['versao'] = regras_versao
+        await client.publish(f"{MQTT_RULES_CALLBACK_TOPIC}/bulk/{resposta_lote['id_lote']}",
+                             json.dumps(resposta_lote), qos=1)
+
+@roteador.rota('+/settings/sensors/get/response', 'settings')
+async def tratar_configuracao(client, message, data, parts, recebido_em):
+    """Tópicos de Configuração de Sensores (+/settings/sensors/get/response)."""
+    global sensor_configs_alterado
+    device_id = parts[0]
+    # O firmware (e o dummy-esp32) respondem com a lista pura; aceita também {"sensors": [...]}
+    sensors_list = data if isinstance(data, list) else data.get('sensors', [])
+    
+    log.info("📥 Configuração de sensores recebida para %s: %s sensores", device_id, len(sensors_list))
+    
+    # A resposta é a lista completa do dispositivo: substitui o cache
+    # para que sensores removidos não fiquem no snapshot
+    novos = {}
+    for sensor in sensors_list:
+        sensor_id = sensor.get('id')
+        if sensor_id is not None:
+            novos[sensor_id] = ConfigSensor.de_dict(sensor)
+            log.debug("  ✅ Cached config for sensor %s: %s", sensor_id, sensor.get('desc', 'N/A'))
+    if sensor_configs.get(device_id) != novos:
+        sensor_configs[device_id] = novos
+        sensor_configs_alterado = True
+    else:
+        sensor_configs.tocar(device_id)
+
+@roteador.rota(MQTT_SENSOR_DATA_TOPIC, 'data')
+async def tratar_dados(client, message, data, parts, recebido_em):
+    """Tópicos de Dados de Sensores (+/sensors/+/data)."""
+    await processar_dados(client, message, data, parts, recebido_em, encaminhada=False)
+
+@roteador.rota(f"{PREFIXO_ENCAMINHAMENTO}/+/{MQTT_SENSOR_DATA_TOPIC}", 'forwarded')
+async def tratar_encaminhada(client, message, data, parts, recebido_em):
+    """Amostra encaminhada por outra instância do cluster: já foi gravada lá, só avalia regras."""
+    await processar_dados(client, message, data, parts[3:], recebido_em, encaminhada=True)
+
+async def processar_dados(client, message, data, parts, recebido_em, encaminhada):
+    """Avalia regras com a amostra e grava no InfluxDB (exceto se encaminhada)."""
+    amostra_em = _timestamp_da_amostra(data)
+    device_id = data.get('device_id') or parts[0]
+    sensor_id = data.get('sensor_id') or data.get('id') or parts[2]
+    sensor_type_id = data.get('type') if data.get('type') is not None else data.get('tipo', -1)
+    sensor_type_name = SENSOR_TYPES.get(sensor_type_id, 'unknown')
+    sensor_configs.tocar(device_id)  # dispositivo ativo: adia a expulsão do cache
+    
+    # Cluster: encaminha a amostra para as instâncias donas das regras deste dispositivo
+    avaliar = True
+    if cluster.ativo and not encaminhada:
+        destinos = cluster.destinos(device_id, atuador=sensor_type_id in ATUADOR_TYPES)
+        for instancia in destinos:
+            if instancia != cluster.instancia:
+                await client.publish(cluster.topico_encaminhado(instancia, message.topic.value), message.payload)
+                m_encaminhadas.inc()
+        avaliar = cluster.instancia in destinos
+    
+    # Actuators (RELE, SG_90) handle both formats:
+    # - Old format: atributo1 (backwards compatibility)
+    # - New format: values.state (RELE) or values.angle (SG_90)
+    # Types 4 (SG_90) and 5 (RELE)
+    if sensor_type_id in ATUADOR_TYPES:  # SG_90 or RELE
+        # Try old format first (backwards compatibility)
+        value = data.get('atributo1')
+        
+        # Fall back to new format if old not present
+        if value is None:
+            values_dict = data.get('values')
+            if isinstance(values_dict, dict):
+                # Type 5 (RELE) uses 'state', Type 4 (SG_90) uses 'angle'
+                if sensor_type_id == 5:
+                    value = values_dict.get('state')
+                elif sensor_type_id == 4:
+                    value = values_dict.get('angle')
+            
+            if value is None:
+                field_name = 'state' if sensor_type_id == 5 else 'angle'
+                log_dados.warning("  ⚠️ Actuator message missing both 'atributo1' and 'values.%s': %s", field_name, data)
+                return
+        
+        field_name = 'state' if sensor_type_id == 5 else 'angle'
+        log_dados.debug("  🎛️ Actuator %s: %s=%s", sensor_type_name, field_name, value)
+        
+        # Cache sensor configuration for later use in rules
+        # (preserva desc/pinos vindos do snapshot ou do GET completo)
+        cached = sensor_configs.get(device_id, {}).get(sensor_id)
+        atualiza_sensor_config(device_id, sensor_id, ConfigSensor(
+            sensor_id,
+            data.get('desc', cached.desc if cached else ''),
+            sensor_type_id,
+            data.get('pinos', cached.pinos if cached else ()),
+            value
+        ))
+        
+        # 2a. Verifica regras (não bloqueante) - actuators use single value
+        if avaliar:
+            inicio = time.perf_counter()
+            await async_verificar_regras(client, device_id, sensor_id, value)
+            m_regras.observe(time.perf_counter() - inicio)
+        if encaminhada:
+            return
+        
+        # 2b. Salva no InfluxDB (não bloqueante) - actuators save single value
+        # (só mudanças significativas, conforme COMPRESSION_POLICIES)
+        amostras = compressor.filtrar((device_id, sensor_id), sensor_type_name, time.time_ns(), {"value": value})
+        points = [
+            influx_schema.ponto_do_atuador(
+                INFLUX_SCHEMA, device_id, sensor_id, sensor_type_id, sensor_type_name, valores["value"], ts_ns
+            )
+            for ts_ns, valores in amostras
+        ]
+        
+        if points and enfileirar_pontos(points, recebido_em, amostra_em):
+            log_dados.debug("  ✅ Enfileirado para o InfluxDB: sensor %s (%s) = %s (Atuador)", sensor_id, sensor_type_name, value)
+        
+        return  # Skip the sensor dict processing below
+    
+    # Sensors now always send 'values' as a dictionary (e.g., {"x": 1951, "y": 1981, "bt": 0})
+    value = data.get('values')
+    if value is None:
+        log_dados.warning("  ⚠️ Mensagem sem campo 'values': %s", data)
+        return
+    if not isinstance(value, dict):
+        log_dados.warning("  ⚠️ Campo 'values' deve ser um dicionário, recebido: %s", type(value).__name__)
+        return
+    
+    # 2a. Verifica regras (não bloqueante)
+    if avaliar:
+        inicio = time.perf_counter()
+        await async_verificar_regras(client, device_id, sensor_id, value)
+        m_regras.observe(time.perf_counter() - inicio)
+    if encaminhada:
+        return
+    
+    # 2b. Salva no InfluxDB (não bloqueante)
+    # Dictionary values with named fields (e.g., {"x": 1951, "y": 1981, "bt": 0}).
+    # Layout conforme INFLUX_SCHEMA: um ponto por campo em 'sensor_<id>' (legado)
+    # ou um ponto multi-campo no measurement do tipo. Teclado é salvo como string.
+    # A compressão decide quais amostras vão para o banco (as regras já viram todas).
+    points = []
+    for ts_ns, valores in compressor.filtrar((device_id, sensor_id), sensor_type_name, time.time_ns(), value):
+        pontos_amostra, ignorados = influx_schema.pontos_da_amostra(
+            INFLUX_SCHEMA, device_id, sensor_id, sensor_type_id, sensor_type_name, valores, ts_ns,
+            como_string=sensor_type_id in STRING_SENSOR_TYPES
+        )
+        points.extend(pontos_amostra)
+        for field_name, field_value, e in ignorados:
+            log_dados.warning("  [Influx] Ignorando valor inválido: %s=%s (%s)", field_name, field_value, e)
+    
+    if points and enfileirar_pontos(points, recebido_em, amostra_em):
+        log_dados.debug("  ✅ Enfileirado para o InfluxDB: sensor %s (%s) dict com %s campos (%s)", sensor_id, sensor_type_name, len(value), device_id)
+
+def classificar_mensagem(message, recebido_em):
+    """Decodifica o JSON e coloca a mensagem na faixa de prioridade dela.
+
+    Retorna o motivo se a amostra foi descartada (ver lanes.py), senão None.
+    """
+    payload_str = message.payload.decode('utf-8')
+    topic = message.topic.value
+    log_dados.debug("📨 Mensagem recebida: Tópico[%s] Payload[%s]", topic, lazy_trunc(payload_str))
+    
+    inicio = time.perf_counter()
+    data = json.loads(payload_str)
+    m_parse.observe(time.perf_counter() - inicio)
+    parts = topic.split('/')
+    item = (message, topic, parts, data, recebido_em)
+
+    # Só amostras de sensores de tipos não prioritários são telemetria
+    if parts[-1] != 'data' or not isinstance(data, dict):
+        faixas.colocar_controle(item)
+        return None
+    tipo = data.get('type') if data.get('type') is not None else data.get('tipo', -1)
+    if tipo in PRIORITY_SENSOR_TYPES:
+        faixas.colocar_controle(item)
+        return None
+    encaminhada = topic.startswith(PREFIXO_ENCAMINHAMENTO + '/')
+    dispositivo = data.get('device_id') or (parts[3] if encaminhada else parts[0])
+    # Encaminhadas já passaram pelo limite de taxa na instância que recebeu
+    return faixas.colocar_telemetria(topic, dispositivo, item, limitar_taxa=not encaminhada)
+
+async def async_receber_mensagens(client):
+    """Lê as mensagens do broker o mais rápido possível e as distribui nas faixas."""
+    global mensagens_lidas
+    async for message in client.messages:
+        mensagens_lidas += 1
+        try:
+            classificar_mensagem(message, time.time())
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            m_erros.labels('parse').inc()
+            log_dados.error("❌ Erro ao decodificar JSON: %s", e)
         except Exception as e:
-            print(f"❌ Erro ao verificar regra {regra_id}: {e}")
-            traceback.print_exc()
+            m_erros.labels('process').inc()
+            log.exception("❌ Erro ao classificar mensagem: %s", e)
+
+async def async_processar_faixas(client):
+    """Task de fundo: processa as mensagens, sempre a faixa de controle primeiro.
+
+    'client' é a ConexaoMQTT: as publicações dos handlers esperam a reconexão.
+    """
+    while True:
+        faixa, (message, topic, parts, data, recebido_em) = await faixas.proximo()
+        m_espera_faixa.labels(faixa).observe(time.time() - recebido_em)
+        try:
+            if await roteador.despachar(topic, parts, client, message, data, parts, recebido_em) is None:
+                m_sem_rota.inc()
+        except Exception as e:
+            m_erros.labels('process').inc()
+            log.exception("❌ Erro ao processar mensagem: %s", e)
+        await async_ceder_ao_leitor()
+
+async def async_ceder_ao_leitor(max_voltas=100):
+    """Cede o loop até o leitor parar de receber mensagens (no máximo 'max_voltas' vezes).
+
+    O cliente MQTT lê um pacote do socket por volta do event loop; sem isso a
+    leitura andaria no ritmo do processamento e a fila ficaria no socket, onde
+    o controle espera atrás da telemetria e nada pode ser descartado.
+    """
+    paradas = 0
+    for _ in range(max_voltas):
+        lidas = mensagens_lidas
+        await asyncio.sleep(0)
+        paradas = paradas + 1 if mensagens_lidas == lidas else 0
+        if paradas >= 2:
+            return
+
+async def async_relatar_descartes():
+    """Task de fundo: resume no log os descartes de telemetria e os dispositivos que mais perderam."""
+    while True:
+        await asyncio.sleep(SHED_REPORT_INTERVAL)
+        if not faixas.descartes_por_dispositivo:
+            continue
+        piores = faixas.descartes_por_dispositivo.most_common(5)
+        total = sum(faixas.descartes_por_dispositivo.values())
+        faixas.descartes_por_dispositivo.clear()
+        log.warning("⚠️ Sobrecarga: %s amostras de telemetria descartadas/coalescidas nos últimos %.0fs (%s). "
+                    "Telemetria pendente: %s", total, SHED_REPORT_INTERVAL,
+                    ", ".join(f"{d}={n}" for d, n in piores), faixas.tamanho(lanes.TELEMETRIA))
+
+async def async_sessao_mqtt():
+    """Uma conexão com o broker: assina os tópicos e lê mensagens até a conexão cair (MqttError)."""
+    log.info("Conectando ao Broker MQTT em %s (cliente '%s', sessão %s)...", MQTT_BROKER_HOST, MQTT_CLIENT_ID,
+             "limpa" if MQTT_CLEAN_SESSION else "persistente")
+    async with aiomqtt.Client(hostname=MQTT_BROKER_HOST, port=MQTT_BROKER_PORT, identifier=MQTT_CLIENT_ID,
+                              clean_session=MQTT_CLEAN_SESSION, keepalive=MQTT_KEEPALIVE) as client:
+        log.info("✅ Conectado ao Broker MQTT!")
+        
+        # Inscreve-se nos tópicos (QoS 1: o broker guarda o que chegar durante uma queda).
+        # Com sessão persistente as assinaturas já existem; refazer é inofensivo.
+        topico_dados = cluster.topico_dados(MQTT_SENSOR_DATA_TOPIC)
+        topicos = [topico_dados, MQTT_RULES_TOPIC, "+/settings/sensors/get/response"]
+        if cluster.ativo:
+            topicos.append(cluster.topico_encaminhamento)
+        for topico in topicos:
+            await client.subscribe(topico, qos=1)
+            log.info("  Inscrito em: %s", topico)
+        if cluster.ativo and not conexao.conexoes:
+            log.info("🧩 Cluster: instância %s de %s (grupo '%s'), %s de %s regras locais",
+                     cluster.instancia, cluster.instancias, cluster.grupo, len(cluster.regras_locais), len(regras))
+        if conexao.conexoes:
+            log.info("🔌 Reconectado ao broker (conexão %s)", conexao.conexoes + 1)
+
+        conexao.conectou(client)
+        try:
+            # Publica o snapshot atual (retido) para a API já começar coerente
+            await async_get_regra(client)
+            # Loop principal: esta task lê e classifica, async_processar_faixas processa por prioridade
+            await async_receber_mensagens(client)
+        finally:
+            conexao.desconectou()
 
 # --- Função Principal (Main) ---
 
 async def main():
-    print("Iniciando Ingestor Assíncrono...")
+    global spool, influx_disponivel
+    log.info("Iniciando Ingestor Assíncrono...")
+    
+    # Spool em disco para quando o InfluxDB estiver fora ou lento
+    spool = Spool(SPOOL_DIR, max_bytes=int(SPOOL_MAX_MB * 1024 * 1024),
+                  segmento_bytes=int(SPOOL_SEGMENT_MB * 1024 * 1024))
     
-    # Conecta ao InfluxDB (Async)
     # Conecta ao InfluxDB (Async)
     try:
         influx_client = InfluxDBClientAsync(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
         write_api = influx_client.write_api()
         
-        # Tenta pingar o banco de dados para verificar a conexão
-        if await influx_client.ping(): # <--- LINHA CORRIGIDA
-            print("✅ Conectado ao InfluxDB com sucesso!")
-        else:
-            raise Exception("Erro ao pingar o InfluxDB. Verifique a URL ou token.")
-            
     except Exception as e:
-        print(f"❌ Erro fatal ao conectar ao InfluxDB: {e}")
+        log.error("❌ Erro fatal ao conectar ao InfluxDB: %s", e)
         return
 
-    # Conecta ao MQTT (Async)
+    # Tenta pingar o banco de dados para verificar a conexão.
+    # Se ele estiver fora, segue mesmo assim: os dados vão para o spool até o banco responder.
     try:
-        print(f"Conectando ao Broker MQTT em {MQTT_BROKER_HOST}...")
-        async with aiomqtt.Client(hostname=MQTT_BROKER_HOST, port=MQTT_BROKER_PORT) as client:
-            print("✅ Conectado ao Broker MQTT!")
-            
-            # Inscreve-se nos tópicos
-            await client.subscribe(MQTT_SENSOR_DATA_TOPIC)
-            await client.subscribe(MQTT_RULES_TOPIC)
-            await client.subscribe("+/settings/sensors/get/response")
-            print(f"  Inscrito em: {MQTT_SENSOR_DATA_TOPIC}")
-            print(f"  Inscrito em: {MQTT_RULES_TOPIC}")
-            print(f"  Inscrito em: +/settings/sensors/get/response")
-
-            # Loop principal de mensagens
-            async for message in client.messages:
-                try:
-                    payload_str = message.payload.decode('utf-8')
-                    topic = message.topic.value
-                    print(f"📨 Mensagem recebida: Tópico[{topic}] Payload[{payload_str[:100]}...]")
-                    
-                    data = json.loads(payload_str)
-                    parts = topic.split('/')
-
-                    # --- Roteador de Tópicos ---
-
-                    # 1. Tópicos de Regras (rules/+)
-                    if parts[0] == 'rules':
-                        print(f"🔀 ROTEADOR DE REGRAS: Ação = {parts[1]}")
-                        if parts[1] == 'add':
-                            print(f"  ➕ ADD RULE: {data.get('id_regra', 'SEM_ID')}")
-                            cria_regra(data)
-                        elif parts[1] == 'update':
-                            print(f"  ✏️ UPDATE RULE: {data.get('id_regra', 'SEM_ID')}")
-                            atualiza_regra(data)
-                        elif parts[1] == 'delete':
-                            print(f"  🗑️ DELETE RULE: {data.get('id_regra', 'SEM_ID')}")
-                            deleta_regra(data)
-                        elif parts[1] == 'get':
-                            print(f"  📋 GET RULES: Retornando todas as regras")
-                            await async_get_regra(client)
-                    
-                    # 2. Tópicos de Configuração de Sensores (+/settings/sensors/get/response)
-                    elif len(parts) >= 5 and parts[1] == 'settings' and parts[2] == 'sensors' and parts[3] == 'get' and parts[4] == 'response':
-                        device_id = parts[0]
-                        sensors_list = data.get('sensors', [])
-                        
-                        print(f"📥 Configuração de sensores recebida para {device_id}: {len(sensors_list)} sensores")
-                        
-                        # Cache all sensor configurations
-                        if device_id not in sensor_configs:
-                            sensor_configs[device_id] = {}
-                        
-                        for sensor in sensors_list:
-                            sensor_id = sensor.get('id')
-                            if sensor_id is not None:
-                                sensor_configs[device_id][sensor_id] = {
-                                    "id": sensor_id,
-                                    "desc": sensor.get('desc', ''),
-                                    "tipo": sensor.get('tipo', -1),
-                                    "pinos": sensor.get('pinos', []),
-                                    "atributo1": sensor.get('atributo1', 0)
-                                }
-                                print(f"  ✅ Cached config for sensor {sensor_id}: {sensor.get('desc', 'N/A')}")
-                    
-                    # 3. Tópicos de Dados de Sensores (+/sensors/+/data)
-                    elif len(parts) >= 4 and parts[1] == 'sensors' and parts[3] == 'data':
-                        device_id = data.get('device_id') or parts[0]
-                        sensor_id = data.get('sensor_id') or data.get('id') or parts[2]
-                        sensor_type_id = data.get('type') if data.get('type') is not None else data.get('tipo', -1)
-                        sensor_type_name = SENSOR_TYPES.get(sensor_type_id, 'unknown')
-                        
-                        # Actuators (RELE, SG_90) handle both formats:
-                        # - Old format: atributo1 (backwards compatibility)
-                        # - New format: values.state (RELE) or values.angle (SG_90)
-                        # Types 4 (SG_90) and 5 (RELE)
-                        if sensor_type_id in [4, 5]:  # SG_90 or RELE
-                            # Try old format first (backwards compatibility)
-                            value = data.get('atributo1')
-                            
-                            # Fall back to new format if old not present
-                            if value is None:
-                                values_dict = data.get('values')
-                                if isinstance(values_dict, dict):
-                                    # Type 5 (RELE) uses 'state', Type 4 (SG_90) uses 'angle'
-                                    if sensor_type_id == 5:
-                                        value = values_dict.get('state')
-                                    elif sensor_type_id == 4:
-                                        value = values_dict.get('angle')
-                                
-                                if value is None:
-                                    field_name = 'state' if sensor_type_id == 5 else 'angle'
-                                    print(f"  ⚠️ Actuator message missing both 'atributo1' and 'values.{field_name}': {data}")
-                                    continue
-                            
-                            field_name = 'state' if sensor_type_id == 5 else 'angle'
-                            print(f"  🎛️ Actuator {sensor_type_name}: {field_name}={value}")
-                            
-                            # Cache sensor configuration for later use in rules
-                            if device_id not in sensor_configs:
-                                sensor_configs[device_id] = {}
-                            sensor_configs[device_id][sensor_id] = {
-                                "id": sensor_id,
-                                "desc": data.get('desc', ''),
-                                "tipo": sensor_type_id,
-                                "pinos": data.get('pinos', []),
-                                "atributo1": value
-                            }
-                            
-                            # 2a. Verifica regras (não bloqueante) - actuators use single value
-                            await async_verificar_regras(client, device_id, sensor_id, value)
-                            
-                            # 2b. Salva no InfluxDB (não bloqueante) - actuators save single value
-                            measurement_name = f"sensor_{sensor_id}"
-                            point = Point(measurement_name) \
-                                .tag("device_id", device_id) \
-                                .tag("sensor_type", sensor_type_name) \
-                                .tag("sensor_type_id", str(sensor_type_id)) \
-                                .field("value", float(value)) \
-                                .time(time.time_ns(), write_precision='ns')
-                            
-                            try:
-                                await write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=point)
-                                print(f"  ✅ Salvo no InfluxDB: {measurement_name} ({sensor_type_name}) = {value} (Atuador)")
-                            except Exception as e:
-                                print(f"  [Influx] Erro ao salvar ponto: {e}")
-                            
-                            continue  # Skip the sensor dict processing below
-                        
-                        # Sensors now always send 'values' as a dictionary (e.g., {"x": 1951, "y": 1981, "bt": 0})
-                        value = data.get('values')
-                        if value is None:
-                            print(f"  ⚠️ Mensagem sem campo 'values': {data}")
-                            continue
-                        if not isinstance(value, dict):
-                            print(f"  ⚠️ Campo 'values' deve ser um dicionário, recebido: {type(value).__name__}")
-                            continue
-                        
-                        # 2a. Verifica regras (não bloqueante)
-                        await async_verificar_regras(client, device_id, sensor_id, value)
-                        
-                        # 2b. Salva no InfluxDB (não bloqueante)
-                        # Use sensor_id as measurement name (each sensor gets its own "table")
-                        measurement_name = f"sensor_{sensor_id}"
-                        
-                        # Dictionary values with named fields (e.g., {"x": 1951, "y": 1981, "bt": 0})
-                        points = []
-                        for field_name, field_value in value.items():
-                            try:
-                                point = Point(measurement_name) \
-                                    .tag("device_id", device_id) \
-                                    .tag("sensor_type", sensor_type_name) \
-                                    .tag("sensor_type_id", str(sensor_type_id)) \
-                                    .tag("field", field_name)
-                                
-                                # Save as string for keyboard types, float for others
-                                if sensor_type_id in STRING_SENSOR_TYPES:
-                                    point.field(field_name, str(field_value))
-                                else:
-                                    point.field(field_name, float(field_value))
-                                
-                                point.time(time.time_ns(), write_precision='ns')
-                                points.append(point)
-                            except (ValueError, TypeError) as e:
-                                print(f"  [Influx] Ignorando valor inválido: {field_name}={field_value} ({e})")
-                        
-                        if points:
-                            await write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=points)
-                            print(f"  ✅ Salvo no InfluxDB: {measurement_name} ({sensor_type_name}) dict com {len(points)} campos ({device_id})")
-                                
-                except json.JSONDecodeError as e:
-                    print(f"❌ Erro ao decodificar JSON: {e}")
-                except Exception as e:
-                    print(f"❌ Erro ao processar mensagem: {e}")
-                    traceback.print_exc()
-
-    except aiomqtt.MqttError as e:
-        print(f"❌ Erro de conexão MQTT: {e}. O ingestor será encerrado.")
+        influx_disponivel = await influx_client.ping()
+    except Exception as e:
+        log.debug("Ping do InfluxDB falhou: %s", e)
+        influx_disponivel = False
+    if influx_disponivel:
+        log.info("✅ Conectado ao InfluxDB com sucesso!")
+    else:
+        log.warning("⚠️ InfluxDB não respondeu ao ping. Dados serão guardados no spool (%s) até ele voltar.", SPOOL_DIR)
+
+    # Endpoint de métricas no mesmo event loop
+    metrics_runner = None
+    if METRICS_PORT:
+        try:
+            metrics_runner = await metrics.iniciar_servidor(METRICS_HOST, METRICS_PORT)
+            log.info("📈 Métricas em http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            log.error("❌ Não foi possível abrir o endpoint de métricas: %s", e)
+
+    # Tasks de fundo: vivem o processo inteiro e sobrevivem às reconexões ao broker
+    # (as que publicam recebem a ConexaoMQTT, que aponta sempre para o cliente atual)
+    tarefas_fundo = [
+        asyncio.create_task(async_persistir_sensor_configs()),
+        asyncio.create_task(metrics.monitorar_lag_do_loop(m_lag, m_lag_hist)),
+        # Escrita em lote no InfluxDB e reenvio do spool
+        asyncio.create_task(async_escritor_influx(write_api)),
+        asyncio.create_task(async_reenviar_spool(write_api)),
+        # Processamento por prioridade do que o leitor colocou nas faixas
+        asyncio.create_task(async_processar_faixas(conexao)),
+        asyncio.create_task(async_relatar_descartes()),
+    ]
+    # No cluster as respostas chegam a todas as instâncias: basta a 0 pedir
+    if cluster.coordenador:
+        tarefas_fundo.append(asyncio.create_task(async_prefetch_sensor_configs(conexao)))
+
+    # Conecta ao MQTT (Async), reconectando com backoff se a conexão cair
+    backoff = Backoff(MQTT_RECONNECT_MIN, MQTT_RECONNECT_MAX)
+    try:
+        while True:
+            try:
+                await async_sessao_mqtt()
+            except aiomqtt.MqttError as e:
+                if conexao.duracao_ultima_conexao() >= MQTT_STABLE_AFTER:
+                    backoff.zerar()
+                espera = backoff.proximo()
+                m_reconexoes.inc()
+                log.error("❌ Erro de conexão MQTT: %s. Nova tentativa em %.1fs (estado em memória mantido).", e, espera)
+                await asyncio.sleep(espera)
     except (asyncio.CancelledError, KeyboardInterrupt):
-        print("\n🛑 Ingestor interrompido. Desconectando...")
+        log.info("🛑 Ingestor interrompido. Desconectando...")
     finally:
+        for tarefa in tarefas_fundo:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas_fundo, return_exceptions=True)
+        descarregar_fila_no_spool()
+        spool.fechar()
+        if spool.linhas_pendentes:
+            log.info("💾 %s pontos ficaram no spool para o próximo início.", spool.linhas_pendentes)
+        if sensor_configs_alterado:
+            salvar_sensor_configs_no_arquivo()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
         if 'influx_client' in locals() and influx_client:
             await influx_client.close()
-            print("✅ Conexão com InfluxDB fechada.")
-        print("✅ Ingestor encerrado.")
+            log.info("✅ Conexão com InfluxDB fechada.")
+        log.info("✅ Ingestor encerrado.")
 
 if __name__ == "__main__":
     carregar_regras_do_arquivo()
+    carregar_sensor_configs_do_arquivo()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("🛑 Processo principal interrompido.")
\ No newline at end of file
+        log.info("🛑 Processo principal interrompido.")
\ No newline at end of file
@@ -0,0 +1,200 @@
+"""
+Métricas do ingestor no formato de exposição do Prometheus.
+
+Implementação mínima (contadores, gauges e histogramas com labels) para não
+adicionar dependências. O endpoint HTTP roda no próprio event loop do
+ingestor via aiohttp.web, então não existe thread extra nem lock: todas as
+atualizações acontecem no loop.
+"""
+
+import asyncio
+import bisect
+import time
+
+from aiohttp import web
+
+# Buckets padrão (segundos), de 100 µs a 10 s
+LATENCIA_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _formata_labels(nomes, valores, extra=''):
+    pares = [f'{n}="{_escapa(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _escapa(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formata_valor(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nome, ajuda, labels=(), registro=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labelnames = tuple(labels)
+        self._filhos = {}
+        if not self.labelnames:
+            self._filhos[()] = self._novo_filho()
+        (registro or REGISTRO).registrar(self)
+
+    def labels(self, *valores):
+        """Retorna (criando se preciso) a série para a combinação de labels."""
+        filho = self._filhos.get(valores)
+        if filho is None:
+            if len(valores) != len(self.labelnames):
+                raise ValueError(f"{self.nome}: esperado {self.labelnames}, recebido {valores}")
+            filho = self._filhos[valores] = self._novo_filho()
+        return filho
+
+    def _padrao(self):
+        return self._filhos[()]
+
+    def expor(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} {self.tipo}']
+        for valores, filho in self._filhos.items():
+            linhas.extend(self._expor_filho(valores, filho))
+        return linhas
+
+
+class _ValorSimples:
+    __slots__ = ('valor', 'funcao')
+
+    def __init__(self):
+        self.valor = 0
+        self.funcao = None
+
+    def inc(self, n=1):
+        self.valor += n
+
+    def dec(self, n=1):
+        self.valor -= n
+
+    def set(self, valor):
+        self.valor = valor
+
+    def set_function(self, funcao):
+        """Faz o valor ser lido de 'funcao()' no momento da coleta."""
+        self.funcao = funcao
+
+    def atual(self):
+        return self.funcao() if self.funcao is not None else self.valor
+
+
+class Counter(_Metrica):
+    tipo = 'counter'
+
+    def _novo_filho(self):
+        return _ValorSimples()
+
+    def inc(self, n=1):
+        self._padrao().inc(n)
+
+    def _expor_filho(self, valores, filho):
+        return [f'{self.nome}{_formata_labels(self.labelnames, valores)} {_formata_valor(filho.atual())}']
+
+
+class Gauge(Counter):
+    tipo = 'gauge'
+
+    def set(self, valor):
+        self._padrao().set(valor)
+
+    def dec(self, n=1):
+        self._padrao().dec(n)
+
+    def set_function(self, funcao):
+        self._padrao().set_function(funcao)
+
+
+class _Distribuicao:
+    __slots__ = ('limites', 'contagens', 'soma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observe(self, valor):
+        self.contagens[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class Histogram(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, labels=(), buckets=LATENCIA_BUCKETS, registro=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(nome, ajuda, labels, registro)
+
+    def _novo_filho(self):
+        return _Distribuicao(self.buckets)
+
+    def observe(self, valor):
+        self._padrao().observe(valor)
+
+    def _expor_filho(self, valores, filho):
+        linhas = []
+        acumulado = 0
+        for limite, contagem in zip(self.buckets + (float('inf'),), filho.contagens):
+            acumulado += contagem
+            le = f'le="{_formata_valor(limite)}"'
+            linhas.append(f'{self.nome}_bucket{_formata_labels(self.labelnames, valores, le)} {acumulado}')
+        sufixo = _formata_labels(self.labelnames, valores)
+        linhas.append(f'{self.nome}_sum{sufixo} {_formata_valor(filho.soma)}')
+        linhas.append(f'{self.nome}_count{sufixo} {filho.total}')
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+
+    def expor(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.expor())
+        return '\n'.join(linhas) + '\n'
+
+
+REGISTRO = Registro()
+
+
+async def monitorar_lag_do_loop(gauge, histograma, intervalo=0.5):
+    """Mede o atraso do event loop: quanto um sleep(intervalo) demora além do pedido."""
+    while True:
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        lag = max(0.0, time.perf_counter() - inicio - intervalo)
+        gauge.set(lag)
+        histograma.observe(lag)
+
+
+async def iniciar_servidor(host, porta, registro=None):
+    """Sobe o endpoint GET /metrics no event loop atual e retorna o runner (para cleanup)."""
+    registro = registro or REGISTRO
+
+    async def handler(request):
+        return web.Response(body=registro.expor().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, porta).start()
+    return runner
@@ -0,0 +1,171 @@
+"""
+Migração offline dos dados de sensores do layout legado ('sensor_<id>', um
+ponto por campo) para o layout por tipo de sensor (INFLUX_SCHEMA=tipo).
+
+Lê o bucket em janelas de tempo com query_stream (sem carregar tudo em
+memória), junta os campos de uma mesma amostra em um ponto multi-campo e
+escreve em lotes. Pode ser interrompida e retomada com --start a partir da
+última janela concluída (impressa no log).
+
+Uso (com as mesmas variáveis de ambiente do ingestor):
+    python migrate_schema.py --start 2025-01-01T00:00:00Z --window 6h
+    python migrate_schema.py --start -30d --dry-run
+    python migrate_schema.py --start -30d --delete-source   # apaga cada janela migrada
+
+Depois de migrar, configure INFLUX_SCHEMA=tipo no ingestor e na API.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+from influxdb_client import InfluxDBClient, Point
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+import influx_schema
+from iotlog import setup_logging
+from timerange import parse_duracao, parse_instante
+
+log = setup_logging('migrate_schema')
+
+INFLUXDB_URL = os.getenv('INFLUXDB_URL')
+INFLUXDB_TOKEN = os.getenv('INFLUXDB_TOKEN')
+INFLUXDB_ORG = os.getenv('INFLUXDB_ORG')
+INFLUXDB_BUCKET = os.getenv('INFLUXDB_BUCKET', 'sensores')
+
+# Nomes dos tipos (mesmos de main.SENSOR_TYPES) para dados antigos sem a tag sensor_type
+SENSOR_TYPES = {
+    0: "MPU_6050", 1: "DS18_B20", 2: "HC_SR04", 3: "APDS_9960", 4: "SG_90",
+    5: "RELE", 6: "JOYSTICK", 7: "TECLADO_4X4", 8: "ENCODER", 9: "DHT_11"
+}
+
+
+def _iso(instante):
+    return instante.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def ponto_do_grupo(chave, campos):
+    device_id, sensor_id, sensor_type_id, sensor_type, ts_ns = chave
+    ponto = Point(sensor_type) \
+        .tag("device_id", device_id) \
+        .tag("sensor_id", sensor_id) \
+        .tag("sensor_type_id", sensor_type_id)
+    for nome, valor in campos.items():
+        ponto.field(nome, valor)
+    return ponto.time(ts_ns, write_precision='ns')
+
+
+def migrar_janela(query_api, write_api, delete_api, inicio, fim, args):
+    """Migra uma janela: agrupa por (dispositivo, sensor, instante) e escreve em lotes.
+
+    Retorna (registros lidos, pontos escritos).
+    """
+    flux = f'''
+from(bucket: "{args.bucket}")
+  |> range(start: {_iso(inicio)}, stop: {_iso(fim)})
+  |> filter(fn: (r) => r["_measurement"] =~ /^{influx_schema.PREFIXO_MEASUREMENT_LEGADO}/)
+'''
+    grupos = {}  # chave -> {campo: valor}
+    lote = []
+    measurements = set()
+    lidos = escritos = 0
+
+    def escrever():
+        nonlocal escritos
+        if lote:
+            if not args.dry_run:
+                write_api.write(bucket=args.bucket, org=args.org, record=lote)
+            escritos += len(lote)
+            lote.clear()
+
+    def fechar_grupos(quantos):
+        for chave in list(grupos)[:quantos]:
+            lote.append(ponto_do_grupo(chave, grupos.pop(chave)))
+            if len(lote) >= args.batch:
+                escrever()
+
+    for registro in query_api.query_stream(org=args.org, query=flux):
+        lidos += 1
+        valores = registro.values
+        device_id = valores.get('device_id')
+        if device_id is None:
+            continue
+        measurement = registro.get_measurement()
+        measurements.add(measurement)
+        sensor_id = influx_schema.id_do_sensor(measurement)
+        sensor_type_id = str(valores.get('sensor_type_id', '-1'))
+        sensor_type = valores.get('sensor_type')
+        if not sensor_type or sensor_type == 'unknown':
+            tipo = int(sensor_type_id) if sensor_type_id.lstrip('-').isdigit() else -1
+            sensor_type = SENSOR_TYPES.get(tipo, 'unknown')
+        instante = registro.get_time()
+        ts_ns = int(instante.timestamp()) * 1_000_000_000 + instante.microsecond * 1000
+        if args.merge_ns:
+            ts_ns -= ts_ns % args.merge_ns
+        chave = (device_id, sensor_id, sensor_type_id, sensor_type, ts_ns)
+        grupos.setdefault(chave, {})[registro.get_field()] = registro.get_value()
+
+        # Limita a memória: os registros chegam série a série (um campo por vez),
+        # então fecha a metade mais antiga dos grupos quando passa do tamanho do lote.
+        # Um campo que chegue depois vira um ponto separado no mesmo instante, e o
+        # InfluxDB junta os dois (mesma série e timestamp).
+        if len(grupos) >= args.batch * 4:
+            fechar_grupos(len(grupos) // 2)
+
+    fechar_grupos(len(grupos))
+    escrever()
+
+    if args.delete_source and not args.dry_run:
+        # O predicate de delete do InfluxDB não aceita regex: apaga measurement por measurement
+        for measurement in sorted(measurements):
+            delete_api.delete(start=_iso(inicio), stop=_iso(fim), predicate=f'_measurement="{measurement}"',
+                              bucket=args.bucket, org=args.org)
+
+    return lidos, escritos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--start', required=True, help='início: RFC3339, relativo (-30d) ou now')
+    parser.add_argument('--stop', default='now', help='fim: RFC3339, relativo ou now (padrão)')
+    parser.add_argument('--window', default='6h', help='tamanho de cada janela lida (padrão: 6h)')
+    parser.add_argument('--batch', type=int, default=5000, help='pontos por escrita (padrão: 5000)')
+    parser.add_argument('--merge-ms', type=float, default=1.0,
+                        help='campos da mesma amostra gravados com até N ms de diferença viram um ponto (padrão: 1)')
+    parser.add_argument('--bucket', default=INFLUXDB_BUCKET)
+    parser.add_argument('--org', default=INFLUXDB_ORG)
+    parser.add_argument('--dry-run', action='store_true', help='só lê e conta, não escreve')
+    parser.add_argument('--delete-source', action='store_true',
+                        help='apaga os dados legados de cada janela depois de migrada')
+    args = parser.parse_args()
+    args.merge_ns = int(args.merge_ms * 1_000_000)
+
+    agora = datetime.now(timezone.utc)
+    inicio = parse_instante(args.start, agora)
+    fim = parse_instante(args.stop, agora)
+    janela = parse_duracao(args.window)
+
+    with InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=args.org, timeout=300_000) as client:
+        query_api = client.query_api()
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+        delete_api = client.delete_api()
+        totais = {'lidos': 0, 'escritos': 0}
+        t0 = time.time()
+        log.info("🚚 Migrando %s de %s até %s em janelas de %s%s", args.bucket, _iso(inicio), _iso(fim),
+                 args.window, " (dry-run)" if args.dry_run else "")
+        atual = inicio
+        while atual < fim:
+            proximo = min(atual + janela, fim)
+            lidos, escritos = migrar_janela(query_api, write_api, delete_api, atual, proximo, args)
+            totais['lidos'] += lidos
+            totais['escritos'] += escritos
+            log.info("✅ Janela %s → %s: %s registros lidos, %s pontos escritos", _iso(atual), _iso(proximo), lidos, escritos)
+            atual = proximo
+        duracao = time.time() - t0
+        log.info("🏁 Migração concluída em %.1fs: %s registros → %s pontos (%.0f registros/s)",
+                 duracao, totais['lidos'], totais['escritos'], totais['lidos'] / max(duracao, 1e-9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Conexão MQTT do ingestor com reconexão dentro do próprio processo.
+
+Quando o broker cai, o ingestor não encerra: tenta de novo com backoff
+exponencial e mantém tudo que está em memória (regras, estado das condições,
+janelas, cache de sensor_configs, fila do InfluxDB).
+
+- Identificador fixo (MQTT_CLIENT_ID) e clean_session=False: o broker
+  mantém a sessão e as assinaturas QoS 1 e guarda as mensagens que chegarem
+  enquanto o ingestor estiver fora, entregando-as na reconexão.
+- As tasks de fundo recebem uma ConexaoMQTT em vez do cliente aiomqtt: ela
+  aponta sempre para a conexão atual e publish() espera a reconexão em vez
+  de falhar.
+"""
+
+import asyncio
+import random
+import time
+
+import aiomqtt
+
+
+class Backoff:
+    """Espera exponencial entre tentativas (minimo, 2*minimo, ... até maximo), com jitter."""
+
+    def __init__(self, minimo=0.5, maximo=30.0):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.tentativas = 0
+
+    def proximo(self):
+        espera = min(self.maximo, self.minimo * 2 ** self.tentativas)
+        self.tentativas += 1
+        # metade fixa + metade aleatória: várias instâncias não reconectam todas juntas
+        return espera / 2 + random.uniform(0, espera / 2)
+
+    def zerar(self):
+        self.tentativas = 0
+
+
+class ConexaoMQTT:
+    """Referência estável para o cliente MQTT atual (troca a cada reconexão)."""
+
+    def __init__(self):
+        self.cliente = None
+        self.conexoes = 0
+        self._conectado = asyncio.Event()
+        self._conectado_em = None
+        self._desconectado_em = None
+
+    @property
+    def conectado(self):
+        return self.cliente is not None
+
+    def conectou(self, cliente):
+        self.cliente = cliente
+        self.conexoes += 1
+        self._conectado_em = time.monotonic()
+        self._desconectado_em = None
+        self._conectado.set()
+
+    def desconectou(self):
+        if self.cliente is not None:
+            self._desconectado_em = time.monotonic()
+        self.cliente = None
+        self._conectado.clear()
+
+    def duracao_ultima_conexao(self):
+        """Segundos que a última conexão ficou de pé (0 se nunca conectou)."""
+        if self._conectado_em is None:
+            return 0.0
+        return (self._desconectado_em or time.monotonic()) - self._conectado_em
+
+    async def aguardar(self):
+        await self._conectado.wait()
+        return self.cliente
+
+    async def publish(self, *args, **kwargs):
+        """Publica na conexão atual; sem conexão, espera a reconexão e tenta de novo (uma vez)."""
+        for tentativa in range(2):
+            cliente = await self.aguardar()
+            try:
+                return await cliente.publish(*args, **kwargs)
+            except aiomqtt.MqttError:
+                if tentativa:
+                    raise
+                if self.cliente is cliente:
+                    self.desconectou()  # o leitor ainda não percebeu a queda
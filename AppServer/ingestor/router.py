@@ -0,0 +1,122 @@
+"""
+Roteador de tópicos MQTT do ingestor.
+
+Os padrões (no formato de assinatura MQTT, com '+' e '#') são compilados uma
+vez numa árvore (trie) por nível do tópico. O despacho percorre a árvore
+pelos níveis do tópico, então o custo depende da profundidade do tópico e
+não da quantidade de rotas registradas.
+
+Prioridade quando mais de um padrão casa: nível literal, depois '+', depois
+'#'. Cada rota tem seus contadores (mensagens e erros) e uma exceção num
+handler é registrada e contada sem afetar as outras rotas nem o loop MQTT.
+
+Uso:
+    roteador = Roteador(m_mensagens, m_erros_rota)
+
+    @roteador.rota('+/sensors/+/data', 'data')
+    async def tratar_dados(client, message, data, parts, recebido_em): ...
+
+    await roteador.despachar(topic, parts, client, message, data, parts, recebido_em)
+"""
+
+import logging
+
+log = logging.getLogger('ingestor.router')
+
+
+class Rota:
+    __slots__ = ('padrao', 'nome', 'handler', 'm_mensagens', 'm_erros')
+
+    def __init__(self, padrao, nome, handler, m_mensagens=None, m_erros=None):
+        self.padrao = padrao
+        self.nome = nome
+        self.handler = handler
+        self.m_mensagens = m_mensagens
+        self.m_erros = m_erros
+
+
+class _No:
+    __slots__ = ('filhos', 'rota')
+
+    def __init__(self):
+        self.filhos = {}
+        self.rota = None
+
+
+class Roteador:
+    def __init__(self, contador_mensagens=None, contador_erros=None):
+        """Os contadores (opcionais) são métricas com um label: o nome da rota."""
+        self._raiz = _No()
+        self._contador_mensagens = contador_mensagens
+        self._contador_erros = contador_erros
+        self.rotas = []
+
+    def registrar(self, padrao, handler, nome=None):
+        niveis = padrao.split('/')
+        if '#' in niveis[:-1]:
+            raise ValueError(f"'#' só pode ser o último nível: {padrao!r}")
+        no = self._raiz
+        for nivel in niveis:
+            no = no.filhos.setdefault(nivel, _No())
+        if no.rota is not None:
+            raise ValueError(f"Padrão já registrado: {padrao!r} (rota '{no.rota.nome}')")
+        nome = nome or padrao
+        # Séries das métricas resolvidas no registro, não a cada mensagem
+        rota = Rota(
+            padrao, nome, handler,
+            self._contador_mensagens.labels(nome) if self._contador_mensagens else None,
+            self._contador_erros.labels(nome) if self._contador_erros else None,
+        )
+        no.rota = rota
+        self.rotas.append(rota)
+        return rota
+
+    def rota(self, padrao, nome=None):
+        """Decorator: registra a função como handler de 'padrao'."""
+        def decorar(handler):
+            self.registrar(padrao, handler, nome)
+            return handler
+        return decorar
+
+    def resolver(self, niveis):
+        """Retorna a Rota que casa com o tópico (já dividido em níveis) ou None."""
+        return self._buscar(self._raiz, niveis, 0)
+
+    def _buscar(self, no, niveis, i):
+        if i == len(niveis):
+            if no.rota is not None:
+                return no.rota
+            # 'a/#' também casa com 'a'
+            curinga = no.filhos.get('#')
+            return curinga.rota if curinga is not None else None
+        filho = no.filhos.get(niveis[i])
+        if filho is not None:
+            rota = self._buscar(filho, niveis, i + 1)
+            if rota is not None:
+                return rota
+        filho = no.filhos.get('+')
+        if filho is not None:
+            rota = self._buscar(filho, niveis, i + 1)
+            if rota is not None:
+                return rota
+        curinga = no.filhos.get('#')
+        return curinga.rota if curinga is not None else None
+
+    async def despachar(self, topico, niveis, *args):
+        """Chama o handler da rota com *args. Retorna a Rota, ou None se nenhuma casou.
+
+        Exceções do handler são registradas e contadas aqui (não propagam).
+        """
+        rota = self._buscar(self._raiz, niveis, 0)
+        if rota is None:
+            log.debug("Nenhuma rota para o tópico %s", topico)
+            return None
+        if rota.m_mensagens is not None:
+            rota.m_mensagens.inc()
+        try:
+            await rota.handler(*args)
+        except Exception as e:
+            if rota.m_erros is not None:
+                rota.m_erros.inc()
+            log.exception("❌ Erro na rota '%s' (tópico %s): %s", rota.nome, topico, e)
+        return rota
@@ -0,0 +1,219 @@
+"""
+Spool em disco (write-ahead) para pontos que não puderam ir para o InfluxDB.
+
+Arquivos de segmento append-only com line protocol (uma linha por ponto),
+escritos com I/O sequencial. O leitor consome do segmento mais antigo e
+guarda a posição em um arquivo 'cursor' (escrita atômica), então um restart
+continua de onde parou. Segmentos lidos por completo são apagados.
+
+O tamanho total é limitado (max_bytes): ao passar do limite os segmentos mais
+antigos são descartados primeiro — uma queda longa do banco custa disco
+limitado, perdendo só a telemetria mais velha.
+
+Não é thread-safe: todo acesso acontece no event loop do ingestor.
+"""
+
+import json
+import logging
+import os
+
+log = logging.getLogger('ingestor.spool')
+
+SUFIXO = '.spool'
+
+
+class Spool:
+    def __init__(self, diretorio, max_bytes=512 * 1024 * 1024, segmento_bytes=16 * 1024 * 1024):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.segmento_bytes = min(segmento_bytes, max(max_bytes // 4, 1))
+        self._arquivo_cursor = os.path.join(diretorio, 'cursor')
+
+        # seq -> [tamanho em bytes, linhas]
+        self._segmentos = {}
+        self._escrita = None  # arquivo aberto do segmento mais novo
+        self._seq_escrita = 0
+        # posição de leitura: (seq, offset em bytes, linhas já lidas do segmento)
+        self._leitura = (None, 0, 0)
+        # Lote lido e ainda não confirmado: seq -> linhas dele em cada segmento. Se um desses
+        # segmentos for despejado enquanto o lote é escrito, as linhas já entram em 'descartadas'
+        self._em_voo = {}
+
+        self.linhas_pendentes = 0
+        self.descartadas = 0  # linhas perdidas por despejo (limite de tamanho)
+        self._abrir()
+
+    # --- Estado em disco ---
+
+    def _caminho(self, seq):
+        return os.path.join(self.diretorio, f"{seq:020d}{SUFIXO}")
+
+    def _abrir(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith(SUFIXO):
+                seq = int(nome[:-len(SUFIXO)])
+                caminho = self._caminho(seq)
+                with open(caminho, 'rb') as f:
+                    dados = f.read()
+                # Uma linha incompleta no fim (queda no meio de uma escrita) é descartada
+                fim = dados.rfind(b'\n') + 1
+                if fim != len(dados):
+                    with open(caminho, 'r+b') as f:
+                        f.truncate(fim)
+                self._segmentos[seq] = [fim, dados.count(b'\n', 0, fim)]
+
+        seq_cursor, offset = None, 0
+        try:
+            with open(self._arquivo_cursor) as f:
+                cursor = json.load(f)
+            seq_cursor, offset = cursor['seq'], cursor['offset']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if self._segmentos:
+            primeiro = min(self._segmentos)
+            if seq_cursor in self._segmentos and offset <= self._segmentos[seq_cursor][0]:
+                for seq in [s for s in self._segmentos if s < seq_cursor]:
+                    self._remover_segmento(seq)
+                with open(self._caminho(seq_cursor), 'rb') as f:
+                    lidas = f.read(offset).count(b'\n')
+                self._leitura = (seq_cursor, offset, lidas)
+            else:
+                self._leitura = (primeiro, 0, 0)
+            self._seq_escrita = max(self._segmentos)
+        self.linhas_pendentes = sum(linhas for _, linhas in self._segmentos.values()) - self._leitura[2]
+        if self.linhas_pendentes:
+            log.warning("💾 Spool com %s pontos pendentes (%.1f MB) em %s", self.linhas_pendentes,
+                        self.tamanho_bytes / 1e6, self.diretorio)
+
+    def _salvar_cursor(self):
+        seq, offset, _ = self._leitura
+        tmp = f"{self._arquivo_cursor}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'seq': seq, 'offset': offset}, f)
+        os.replace(tmp, self._arquivo_cursor)
+
+    def _remover_segmento(self, seq):
+        if seq == self._seq_escrita and self._escrita is not None:
+            self._escrita.close()
+            self._escrita = None
+        self._segmentos.pop(seq, None)
+        try:
+            os.remove(self._caminho(seq))
+        except FileNotFoundError:
+            pass
+
+    # --- API ---
+
+    @property
+    def tamanho_bytes(self):
+        return sum(tamanho for tamanho, _ in self._segmentos.values())
+
+    @property
+    def vazio(self):
+        return self.linhas_pendentes == 0
+
+    def anexar(self, dados, linhas):
+        """Acrescenta 'linhas' pontos em line protocol ('dados' termina com '\\n')."""
+        if self._escrita is None or self._segmentos[self._seq_escrita][0] >= self.segmento_bytes:
+            self._novo_segmento()
+        self._escrita.write(dados)
+        self._escrita.flush()
+        segmento = self._segmentos[self._seq_escrita]
+        segmento[0] += len(dados)
+        segmento[1] += linhas
+        self.linhas_pendentes += linhas
+        self._despejar_excesso()
+
+    def _novo_segmento(self):
+        if self._escrita is not None:
+            os.fsync(self._escrita.fileno())
+            self._escrita.close()
+        self._seq_escrita += 1
+        self._escrita = open(self._caminho(self._seq_escrita), 'ab')
+        self._segmentos[self._seq_escrita] = [0, 0]
+        if self._leitura[0] is None:
+            self._leitura = (self._seq_escrita, 0, 0)
+
+    def _despejar_excesso(self):
+        """Descarta segmentos mais antigos enquanto o spool passar de max_bytes."""
+        while self.tamanho_bytes > self.max_bytes and len(self._segmentos) > 1:
+            seq = min(self._segmentos)
+            linhas = self._segmentos[seq][1]
+            seq_leitura, _, lidas = self._leitura
+            perdidas = linhas - lidas if seq == seq_leitura else linhas
+            self._remover_segmento(seq)
+            self.descartadas += perdidas
+            self.linhas_pendentes -= perdidas
+            self._leitura = (min(self._segmentos), 0, 0)
+            self._salvar_cursor()
+            log.warning("🗑️ Spool acima de %.0f MB: segmento %s descartado (%s pontos perdidos)",
+                        self.max_bytes / 1e6, seq, perdidas)
+
+    def ler_lote(self, max_linhas):
+        """Lê até max_linhas pontos a partir do cursor, sem consumi-los.
+
+        Retorna (dados, linhas, proxima_posicao); passe proxima_posicao para
+        confirmar() depois que o lote for escrito no banco.
+        """
+        seq, offset, lidas = self._leitura
+        self._em_voo = {}
+        if seq is None or self.vazio:
+            return b'', 0, None
+        if self._escrita is not None:
+            self._escrita.flush()
+        partes, total = [], 0
+        while seq is not None and total < max_linhas:
+            antes = total
+            with open(self._caminho(seq), 'rb') as f:
+                f.seek(offset)
+                for linha in f:
+                    partes.append(linha)
+                    offset += len(linha)
+                    lidas += 1
+                    total += 1
+                    if total >= max_linhas:
+                        break
+            self._em_voo[seq] = total - antes
+            if total < max_linhas:
+                # segmento esgotado: segue para o próximo, se houver
+                seguintes = [s for s in self._segmentos if s > seq]
+                if not seguintes:
+                    break
+                seq, offset, lidas = min(seguintes), 0, 0
+        return b''.join(partes), total, (seq, offset, lidas)
+
+    def confirmar(self, posicao, linhas):
+        """Avança o cursor após o lote ter sido escrito; apaga segmentos já consumidos.
+
+        Segmentos do lote despejados durante a escrita já foram descontados
+        (em 'descartadas'): as linhas deles não são descontadas de novo e, se o
+        fim do lote estava num deles, o cursor fica onde o despejo o deixou.
+        """
+        if posicao is None:
+            return
+        despejadas = sum(n for s, n in self._em_voo.items() if s not in self._segmentos)
+        self._em_voo = {}
+        linhas -= despejadas
+        seq = posicao[0]
+        if seq not in self._segmentos:
+            return
+        for antigo in [s for s in self._segmentos if s < seq]:
+            self._remover_segmento(antigo)
+        self._leitura = posicao
+        self.linhas_pendentes = max(0, self.linhas_pendentes - linhas)
+        # Segmento atual lido por completo e não é o de escrita: pode ir embora
+        if seq in self._segmentos and seq != self._seq_escrita and posicao[1] >= self._segmentos[seq][0]:
+            self._remover_segmento(seq)
+            self._leitura = (min(self._segmentos), 0, 0) if self._segmentos else (None, 0, 0)
+        if self.vazio and self._escrita is None and not self._segmentos:
+            self._leitura = (None, 0, 0)
+        self._salvar_cursor()
+
+    def fechar(self):
+        if self._escrita is not None:
+            self._escrita.flush()
+            os.fsync(self._escrita.fileno())
+            self._escrita.close()
+            self._escrita = None
@@ -0,0 +1,82 @@
+"""
+Índice de limiares ordenados para condições 'limite' numéricas.
+
+Condições com o mesmo (dispositivo, sensor, medida, operador) formam um
+grupo com os limiares em ordem crescente. Para um valor v, as condições
+verdadeiras são sempre um intervalo contíguo desse array:
+
+    '>'  : limiar <  v  -> [0, bisect_left(v))
+    '>=' : limiar <= v  -> [0, bisect_right(v))
+    '<'  : limiar >  v  -> [bisect_right(v), n)
+    '<=' : limiar >= v  -> [bisect_left(v), n)
+
+Com o intervalo da amostra anterior guardado, uma busca binária por amostra
+diz exatamente quais condições mudaram de valor (a diferença entre os dois
+intervalos): o custo cresce com o número de limiares cruzados, não com o
+número de regras. '==' e '!=' e limiares não numéricos ficam fora do índice.
+"""
+
+from bisect import bisect_left, bisect_right
+
+OPERADORES_ORDENADOS = ('>', '>=', '<', '<=')
+
+
+def indexavel(c):
+    """True se a condição pode entrar num grupo de limiares."""
+    if c.get('tipo', 'limite') != 'limite' or c.get('operador') not in OPERADORES_ORDENADOS:
+        return False
+    limite = c.get('valor_limite')
+    if isinstance(limite, bool) or not isinstance(limite, (int, float)):
+        return False
+    return 'medida' in c
+
+
+class GrupoDeLimiares:
+    __slots__ = ('medida', 'operador', 'limiares', 'entradas', 'intervalo', 'pendentes')
+
+    def __init__(self, medida, operador, entradas):
+        """'entradas' é uma lista de (limiar, item); 'item' é devolvido por atualizar()."""
+        entradas = sorted(entradas, key=lambda e: e[0])
+        self.medida = medida
+        self.operador = operador
+        self.limiares = [float(limiar) for limiar, _ in entradas]
+        self.entradas = [item for _, item in entradas]
+        self.intervalo = None  # condições verdadeiras na amostra anterior (None = ainda sem amostra)
+        self.pendentes = set()  # posições a reavaliar em toda amostra (ex.: esperando 'tempo')
+
+    def __len__(self):
+        return len(self.limiares)
+
+    def _intervalo_verdadeiro(self, valor):
+        n = len(self.limiares)
+        if valor is None:
+            return (0, 0)
+        if self.operador == '>':
+            return (0, bisect_left(self.limiares, valor))
+        if self.operador == '>=':
+            return (0, bisect_right(self.limiares, valor))
+        if self.operador == '<':
+            return (bisect_right(self.limiares, valor), n)
+        return (bisect_left(self.limiares, valor), n)
+
+    def atualizar(self, valor):
+        """Aplica a amostra (None = valor ausente ou inválido: tudo falso).
+
+        Retorna [(posição, item, verdadeira)] das condições que mudaram de
+        valor mais as pendentes. Na primeira amostra retorna todas.
+        """
+        anterior = self.intervalo
+        a1, b1 = atual = self._intervalo_verdadeiro(valor)
+        self.intervalo = atual
+        if anterior is None:
+            posicoes = range(len(self.limiares))
+        else:
+            a0, b0 = anterior
+            if b0 <= a1 or b1 <= a0:
+                # intervalos disjuntos (ou vazios): todos mudaram
+                posicoes = [*range(a0, b0), *range(a1, b1)]
+            else:
+                posicoes = [*range(min(a0, a1), max(a0, a1)), *range(min(b0, b1), max(b0, b1))]
+        if self.pendentes:
+            posicoes = set(posicoes) | self.pendentes
+        return [(i, self.entradas[i], a1 <= i < b1) for i in posicoes]
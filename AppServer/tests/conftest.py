@@ -0,0 +1,7 @@
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Mesmo PYTHONPATH dos containers: common/ mais a pasta de cada serviço
+for pasta in ('common', 'api_server', 'ingestor'):
+    sys.path.insert(0, os.path.join(RAIZ, pasta))
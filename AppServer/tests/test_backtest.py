@@ -0,0 +1,59 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault('MQTT_BROKER_PORT', '1883')
+import backtest  # noqa: E402
+import main as ingestor  # noqa: E402
+
+INICIO = datetime(2025, 1, 1, tzinfo=timezone.utc)
+T0 = int(INICIO.timestamp()) * 1_000_000_000
+
+
+def _regra_salva():
+    """Regra de 2 condições como o ingestor a grava: as duas satisfeitas, com o relógio real."""
+    agora = time.time()
+    estado = {'last_state': True, 'time_stamp': agora, '_satisfeita': True}
+    return {"id_regra": "r1", "entao": [{"id_device": "esp", "id_atuador": 5, "valor": 1, "tempo": 0}],
+            "senao": [], "_last_triggered_state": True,
+            "condicao": [
+                dict(estado, tipo="limite", id_device="esp", id_sensor=1, medida="temperature",
+                     operador=">", valor_limite=30, tempo=60),
+                dict(estado, tipo="limite", id_device="esp", id_sensor=2, medida="humidity",
+                     operador=">", valor_limite=50, tempo=0),
+            ]}
+
+
+def _backtest(monkeypatch, amostras):
+    for nome in ('relogio', 'async_executar_acoes'):
+        monkeypatch.setattr(ingestor, nome, getattr(ingestor, nome))
+    regras = {'r1': _regra_salva()}
+    relatorio = backtest.Relatorio(regras)
+    relogio = backtest.preparar_motor(regras, INICIO, relatorio)
+    asyncio.run(backtest.reproduzir(amostras, relogio))
+    ingestor.regras.clear()
+    return relatorio.por_regra['r1'], regras['r1']
+
+
+def _temperatura(segundos, valor):
+    return (T0 + segundos * 1_000_000_000, 'esp', 1, 1, {'temperature': valor})
+
+
+def test_estado_salvo_nao_conta_no_backtest(monkeypatch):
+    # Só o sensor 1 aparece no histórico: a regra nunca pode ficar verdadeira
+    r, regra = _backtest(monkeypatch, [_temperatura(s, 40) for s in range(0, 200, 10)])
+    assert r['disparos'] == 0
+    # A condição sem amostras ficou com o estado reiniciado no instante virtual de início
+    umidade = regra['condicao'][1]
+    assert umidade['last_state'] is False and '_satisfeita' not in umidade
+    assert umidade['time_stamp'] == INICIO.timestamp()
+
+
+def test_tempo_medido_pelo_relogio_virtual(monkeypatch):
+    amostras = [(T0, 'esp', 2, 1, {'humidity': 80})]
+    amostras += [_temperatura(s, 40) for s in range(10, 200, 10)]
+    r, _ = _backtest(monkeypatch, amostras)
+    # Temperatura acima de 30 desde t=10 s; com tempo=60 a regra dispara na amostra de t=70 s
+    assert r['disparos'] == 1
+    assert r['primeiro_disparo'] == INICIO.timestamp() + 70
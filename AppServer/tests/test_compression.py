@@ -0,0 +1,59 @@
+import random
+from bisect import bisect_left
+
+import pytest
+
+from compression import Compressor, parse_politicas
+
+S = 1_000_000_000
+DESVIO = 0.5
+
+
+def _serie(n=2000, semente=1):
+    """Passeio aleatório com patamares e degraus, uma amostra por segundo."""
+    aleatorio = random.Random(semente)
+    valor, pontos = 20.0, []
+    for i in range(n):
+        if i % 300 < 100:
+            valor += aleatorio.uniform(-0.05, 0.05)  # quase parado
+        elif i % 300 == 200:
+            valor += 5  # degrau
+        else:
+            valor += aleatorio.uniform(-0.4, 0.4)
+        pontos.append((i * S, {'temperature': valor}))
+    return pontos
+
+
+def _comprimir(algoritmo):
+    compressor = Compressor(parse_politicas(f'DS18_B20={algoritmo}:{DESVIO}:100000'))
+    gravados = []
+    entrada = _serie()
+    for ts, valores in entrada:
+        gravados += compressor.filtrar(('esp', 1), 'DS18_B20', ts, valores)
+    assert [ts for ts, _ in gravados] == sorted({ts for ts, _ in gravados})
+    assert len(gravados) < len(entrada) / 3
+    return entrada, gravados
+
+
+def test_deadband_reconstroi_dentro_do_desvio():
+    entrada, gravados = _comprimir('deadband')
+    assert gravados[0] == entrada[0]
+    j = 0
+    for ts, valores in entrada:
+        while j + 1 < len(gravados) and gravados[j + 1][0] <= ts:
+            j += 1
+        # Sem amostra gravada, o valor é o último gravado
+        assert abs(valores['temperature'] - gravados[j][1]['temperature']) <= DESVIO
+
+
+def test_swing_reconstroi_por_interpolacao_dentro_do_desvio():
+    entrada, gravados = _comprimir('swing')
+    assert gravados[0] == entrada[0]
+    instantes = [ts for ts, _ in gravados]
+    for ts, valores in entrada:
+        if ts > instantes[-1]:
+            break  # depois do último gravado só há a amostra retida
+        j = max(1, bisect_left(instantes, ts))
+        (t0, a), (t1, b) = gravados[j - 1], gravados[j]
+        reta = a['temperature'] + (b['temperature'] - a['temperature']) * (ts - t0) / (t1 - t0)
+        assert valores['temperature'] == pytest.approx(reta, abs=DESVIO + 1e-9), ts // S
@@ -0,0 +1,51 @@
+from compression import Compressor, parse_politicas
+from devicestate import CacheDeDispositivos
+from lanes import OUTROS, TAXA_EXCEDIDA, FaixasDePrioridade
+
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def test_cache_limita_por_lru_e_protege():
+    cache = CacheDeDispositivos(max_dispositivos=10, protegido={'regra'}.__contains__)
+    cache['regra'] = {}
+    for i in range(1000):
+        cache[f'esp{i}'] = {}
+    assert len(cache) == 10
+    assert 'regra' in cache and 'esp999' in cache
+    assert cache.expulsos['lru'] == 991
+
+
+def test_cache_expira_inativos():
+    relogio = _Relogio()
+    cache = CacheDeDispositivos(ocioso_apos=60, relogio=relogio)
+    cache['a'] = cache['b'] = 1
+    relogio.agora = 30
+    cache.tocar('a')
+    relogio.agora = 70
+    assert cache.expirar() == 1
+    assert cache.keys() == ['a']
+
+
+def test_compressor_nao_cresce_com_ids_novos():
+    compressor = Compressor(parse_politicas('DHT_11=deadband:1'), max_series=50)
+    for i in range(2000):
+        compressor.filtrar((f'esp{i}', '1'), 'DHT_11', i * 1_000_000_000, {'temperature': 20.0})
+    assert len(compressor) == 50
+    assert compressor.expulsas['lru'] == 1950
+
+
+def test_faixas_limitam_baldes_e_descartes_por_dispositivo():
+    faixas = FaixasDePrioridade(taxa_por_dispositivo=1.0, max_dispositivos=20)
+    for i in range(500):
+        for _ in range(2):  # a segunda amostra estoura a rajada
+            faixas.colocar_telemetria((f'esp{i}', '1'), f'esp{i}', None)
+    assert faixas.dispositivos_com_balde() == 20
+    assert faixas.descartes[TAXA_EXCEDIDA] == 500
+    assert len(faixas.descartes_por_dispositivo) == 21
+    assert faixas.descartes_por_dispositivo[OUTROS] == 480
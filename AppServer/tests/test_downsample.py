@@ -0,0 +1,53 @@
+import math
+import random
+
+import pytest
+
+import downsample
+
+
+def _pontos(n=5000, semente=1):
+    """Série de dois campos com ruído e um pico isolado em cada campo."""
+    aleatorio = random.Random(semente)
+    pontos = []
+    for i in range(n):
+        valor = {'x': math.sin(i / 200) * 10 + aleatorio.uniform(-1, 1), 'y': 500 + aleatorio.uniform(-20, 20)}
+        pontos.append({'time': f't{i}', 'measurement': 'sensor_1', 'value': valor})
+    pontos[n // 4]['value']['x'] = 80.0
+    pontos[3 * n // 4]['value']['y'] = -500.0
+    return pontos
+
+
+def _extremos(pontos, campo):
+    valores = [p['value'][campo] for p in pontos]
+    return min(valores), max(valores)
+
+
+@pytest.mark.parametrize('metodo', downsample.METODOS)
+def test_reducao_mantem_pontas_e_cabe_no_limite(metodo):
+    pontos = _pontos()
+    reduzidos = downsample.reduzir(pontos, 500, metodo)
+    assert len(reduzidos) <= 500
+    assert reduzidos[0] is pontos[0] and reduzidos[-1] is pontos[-1]
+    tempos = [int(p['time'][1:]) for p in reduzidos]
+    assert tempos == sorted(set(tempos))
+
+
+def test_minmax_mantem_extremos_globais():
+    pontos = _pontos()
+    reduzidos = downsample.reduzir(pontos, 500, downsample.MINMAX)
+    for campo in ('x', 'y'):
+        assert _extremos(reduzidos, campo) == _extremos(pontos, campo)
+
+
+def test_lttb_mantem_picos_isolados():
+    pontos = _pontos()
+    reduzidos = downsample.reduzir(pontos, 500, downsample.LTTB)
+    assert pontos[1250] in reduzidos and pontos[3750] in reduzidos
+
+
+def test_serie_que_cabe_ou_sem_campo_numerico_volta_inteira():
+    pontos = _pontos(100)
+    assert downsample.reduzir(pontos, 500) is pontos
+    teclado = [{'time': f't{i}', 'measurement': 'sensor_9', 'value': {'input': '1234'}} for i in range(1000)]
+    assert downsample.reduzir(teclado, 10) is teclado
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from influxdb_client.client.flux_table import FluxRecord
+
+import export
+
+pytest.importorskip('pyarrow')
+pa = export._pyarrow()
+INICIO = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class _QueryApi:
+    def __init__(self, registros):
+        self.registros = registros
+
+    def query_stream(self, org, query):
+        return iter(self.registros)
+
+
+def _registro(segundos, campo, valor):
+    return FluxRecord(None, {
+        '_time': INICIO + timedelta(seconds=segundos), '_measurement': 'sensor_1', '_field': campo,
+        '_value': valor, 'device_id': 'esp', 'sensor_type': 'DHT_11',
+    })
+
+
+@pytest.mark.parametrize('formato', ['arrow', 'parquet'])
+def test_lotes_com_campos_diferentes(tmp_path, formato):
+    # Cada lote tem um conjunto de campos diferente (o dicionário de cada um seria outro)
+    registros = [_registro(i, 'temperature', 20.0 + i) for i in range(3)]
+    registros += [_registro(10 + i, campo, i) for i in range(3) for campo in ('humidity', 'status')]
+    manifesto = {'request': {'device': 'esp', 'sensors': None, 'fields': None},
+                 'format': formato, 'compression': 'zstd'}
+    caminho = str(tmp_path / f'part-00000{export.EXTENSOES[formato]}')
+
+    linhas = export.exportar_faixa(pa, _QueryApi(registros), 'org', 'bucket', 'sensor', manifesto,
+                                   INICIO, INICIO + timedelta(hours=1), caminho, lote_linhas=3)
+
+    assert linhas == len(registros)
+    if formato == 'arrow':
+        tabela = pa.ipc.open_file(caminho).read_all()
+    else:
+        tabela = pa.parquet.read_table(caminho)
+    assert tabela.num_rows == len(registros)
+    assert tabela.column('field').to_pylist() == [r.get_field() for r in registros]
+    assert set(tabela.column('sensor_id').to_pylist()) == {'1'}
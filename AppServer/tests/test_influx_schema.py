@@ -0,0 +1,11 @@
+import influx_schema
+
+
+def test_predicado_delete_do_sensor_por_tipo():
+    assert influx_schema.predicado_delete_do_sensor(influx_schema.SCHEMA_TIPO, 'esp', 'sensor_12') == \
+        'sensor_id="12" AND device_id="esp"'
+
+
+def test_predicado_delete_do_sensor_legado():
+    assert influx_schema.predicado_delete_do_sensor(influx_schema.SCHEMA_SENSOR, 'esp', '12') == \
+        '_measurement="sensor_12" AND device_id="esp"'
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+os.environ.setdefault('MQTT_BROKER_PORT', '1883')
+import main as ingestor  # noqa: E402
+
+
+def _regra():
+    return {"id_regra": "r1", "entao": [], "senao": [],
+            "condicao": [{"tipo": "limite", "id_device": "esp", "id_sensor": "1", "medida": "temperature",
+                          "operador": ">", "valor_limite": 30, "tempo": 0}]}
+
+
+def test_update_sem_condicao_zera_satisfeitas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # salvar_regras_no_arquivo grava no diretório atual
+    ingestor.regras.clear()
+    ingestor.cria_regra(_regra())
+    ingestor.reconstruir_indices()
+    regra = ingestor.regras['r1']
+    ingestor.atualiza_condicao(regra, regra['condicao'][0], True, 0.0)
+    assert regra['_satisfeitas'] == 1
+
+    ingestor.atualiza_regra({"id_regra": "r1", "entao": []})
+    ingestor.reconstruir_indices()
+
+    assert regra['condicao'][0]['last_state'] is False
+    assert '_satisfeita' not in regra['condicao'][0]
+    assert regra['_satisfeitas'] == 0
+    ingestor.regras.clear()
+
+
+def test_entrada_que_nao_e_condicao_nao_impede_o_disparo(monkeypatch):
+    disparos = []
+
+    async def registrar(client, regra_id, regra, resposta):
+        disparos.append((regra_id, resposta))
+
+    monkeypatch.setattr(ingestor, 'async_executar_acoes', registrar)
+    regra = _regra()
+    regra['condicao'].append("comentário")  # não é dict: fica fora do índice e da contagem
+    ingestor.regras.clear()
+    ingestor.regras['r1'] = regra
+    ingestor.reconstruir_indices()
+
+    asyncio.run(ingestor.async_verificar_regras(None, 'esp', '1', {'temperature': 35}))
+
+    assert regra['_total_condicoes'] == 1
+    assert disparos == [('r1', True)]
+    ingestor.regras.clear()
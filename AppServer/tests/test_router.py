@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from router import Roteador
+
+
+class _Contador:
+    def __init__(self):
+        self.por_rota = {}
+
+    def labels(self, nome):
+        contador = self
+
+        class _Serie:
+            def inc(self):
+                contador.por_rota[nome] = contador.por_rota.get(nome, 0) + 1
+        return _Serie()
+
+
+def _roteador():
+    roteador = Roteador()
+    for padrao in ('+/sensors/+/data', '+/sensors/config', 'esp1/sensors/+/data', 'esp1/#', '+/status', 'a/+/#'):
+        roteador.registrar(padrao, None)
+    return roteador
+
+
+@pytest.mark.parametrize('topico, padrao', [
+    ('esp1/sensors/3/data', 'esp1/sensors/+/data'),  # literal antes de '+'
+    ('esp2/sensors/3/data', '+/sensors/+/data'),
+    ('esp2/sensors/config', '+/sensors/config'),
+    ('esp1/sensors/config', 'esp1/#'),  # a prioridade é decidida nível a nível
+    ('esp1/outro/nivel', 'esp1/#'),
+    ('esp1', 'esp1/#'),  # 'a/#' também casa com 'a'
+    ('esp2/status', '+/status'),
+    ('a/b/c/d', 'a/+/#'),
+    ('esp2/sensors/3/raw', None),
+    ('esp2', None),
+])
+def test_resolver_por_prioridade(topico, padrao):
+    rota = _roteador().resolver(topico.split('/'))
+    assert (rota and rota.padrao) == padrao
+
+
+def test_registro_invalido_ou_repetido():
+    roteador = _roteador()
+    with pytest.raises(ValueError):
+        roteador.registrar('+/status', None)
+    with pytest.raises(ValueError):
+        roteador.registrar('a/#/b', None)
+
+
+def test_erro_no_handler_e_contado_sem_propagar():
+    mensagens, erros = _Contador(), _Contador()
+    roteador = Roteador(mensagens, erros)
+    recebidos = []
+
+    @roteador.rota('+/data', 'dados')
+    async def tratar(valor):
+        if valor is None:
+            raise ValueError('payload vazio')
+        recebidos.append(valor)
+
+    async def cenario():
+        await roteador.despachar('esp/data', ['esp', 'data'], 1)
+        await roteador.despachar('esp/data', ['esp', 'data'], None)
+        return await roteador.despachar('esp/outro', ['esp', 'outro'], 2)
+
+    assert asyncio.run(cenario()) is None
+    assert recebidos == [1]
+    assert mensagens.por_rota == {'dados': 2} and erros.por_rota == {'dados': 1}
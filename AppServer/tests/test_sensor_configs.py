@@ -0,0 +1,34 @@
+import asyncio
+import json
+import os
+
+os.environ.setdefault('MQTT_BROKER_PORT', '1883')
+import main as ingestor  # noqa: E402
+
+# Resposta do firmware (Initializers.cpp): a lista pura de sensores
+RESPOSTA_FIRMWARE = json.dumps([
+    {"id": 5, "tipo": 5, "desc": "Rele", "atributo1": 1, "atributo2": 0, "atributo3": 0, "atributo4": 0,
+     "pinos": [{"pino": 4, "tipo": 1}]},
+    {"id": 7, "tipo": 1, "desc": "DHT", "atributo1": 0, "atributo2": 0, "atributo3": 0, "atributo4": 0,
+     "pinos": [{"pino": 15, "tipo": 0}]},
+])
+
+
+def _despachar(topico, payload):
+    partes = topico.split('/')
+    return asyncio.run(ingestor.roteador.despachar(topico, partes, None, None, json.loads(payload), partes, 0.0))
+
+
+def test_resposta_em_lista_do_firmware():
+    ingestor.sensor_configs.clear()
+    _despachar('esp/settings/sensors/get/response', RESPOSTA_FIRMWARE)
+    sensores = ingestor.sensor_configs['esp']
+    assert sorted(sensores) == [5, 7]
+    assert sensores[5].to_dict() == {"id": 5, "desc": "Rele", "tipo": 5, "pinos": [{"pino": 4, "tipo": 1}],
+                                     "atributo1": 1}
+
+
+def test_resposta_em_objeto():
+    ingestor.sensor_configs.clear()
+    _despachar('esp/settings/sensors/get/response', json.dumps({"sensors": json.loads(RESPOSTA_FIRMWARE)}))
+    assert sorted(ingestor.sensor_configs['esp']) == [5, 7]
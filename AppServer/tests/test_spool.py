@@ -0,0 +1,72 @@
+from spool import Spool
+
+
+def _linhas(inicio, n):
+    return b''.join(f'm v={i}i {i}\n'.encode() for i in range(inicio, inicio + n))
+
+
+def _drenar(spool):
+    lidas = []
+    while not spool.vazio:
+        dados, linhas, posicao = spool.ler_lote(5)
+        if not linhas:
+            break
+        lidas.extend(dados.splitlines())
+        spool.confirmar(posicao, linhas)
+    return lidas
+
+
+def test_anexar_ler_confirmar(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=10_000, segmento_bytes=100)
+    for i in range(20):
+        spool.anexar(_linhas(i, 1), 1)
+    assert len(_drenar(spool)) == 20
+    assert spool.vazio
+
+
+def test_cursor_sobrevive_ao_restart(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=10_000, segmento_bytes=100)
+    for i in range(12):
+        spool.anexar(_linhas(i, 1), 1)
+    dados, linhas, posicao = spool.ler_lote(5)
+    spool.confirmar(posicao, linhas)
+    spool.fechar()
+    reaberto = Spool(str(tmp_path), max_bytes=10_000, segmento_bytes=100)
+    assert reaberto.linhas_pendentes == 7
+    assert _drenar(reaberto)[0] == _linhas(5, 1).strip()
+
+
+def test_despejo_durante_o_reenvio(tmp_path):
+    # O segmento do lote em voo é despejado enquanto o lote é escrito no banco
+    spool = Spool(str(tmp_path), max_bytes=400, segmento_bytes=100)
+    for i in range(6):
+        spool.anexar(_linhas(i, 1), 1)
+    dados, linhas, posicao = spool.ler_lote(3)
+    for i in range(6, 60):
+        spool.anexar(_linhas(i, 1), 1)
+    assert spool.descartadas > 0
+    spool.confirmar(posicao, linhas)
+
+    restantes = _drenar(spool)
+    assert spool.vazio and spool.linhas_pendentes == 0
+    # O lote em voo já entrou em 'descartadas' com o segmento; o resto do disco é reenviado
+    assert len(restantes) + spool.descartadas == 60
+    assert restantes[-1] == _linhas(59, 1).strip()
+
+
+def test_despejo_de_parte_do_lote(tmp_path):
+    # O lote cobre dois segmentos e só o primeiro é despejado: as linhas do segundo são descontadas uma vez
+    spool = Spool(str(tmp_path), max_bytes=400, segmento_bytes=100)
+    total = 12
+    for i in range(total):
+        spool.anexar(_linhas(i, 1), 1)
+    dados, linhas, posicao = spool.ler_lote(12)
+    while spool.descartadas == 0:
+        spool.anexar(_linhas(total, 1), 1)
+        total += 1
+    spool.confirmar(posicao, linhas)
+    pendentes = spool.linhas_pendentes
+
+    restantes = _drenar(spool)
+    assert len(restantes) == pendentes
+    assert restantes[-1] == _linhas(total - 1, 1).strip()
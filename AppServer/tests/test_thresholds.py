@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+os.environ.setdefault('MQTT_BROKER_PORT', '1883')
+import main as ingestor  # noqa: E402
+from thresholds import OPERADORES_ORDENADOS, GrupoDeLimiares  # noqa: E402
+
+LIMIARES = [30, 10, 20, 20, 25.5, -5]
+# Em cima, logo abaixo e logo acima de cada limiar, indo e voltando; None = medida ausente
+VALORES = [0, 10, 9.999, 10.001, 20, 19.999, 20.001, 25.5, 31, 30, 29.999, -5, -5.001, None, 25.5, 100, -100, 20]
+
+
+@pytest.mark.parametrize('operador', OPERADORES_ORDENADOS)
+def test_grupo_concorda_com_avaliacao_sem_indice(operador):
+    condicoes = [{"tipo": "limite", "medida": "temperature", "operador": operador, "valor_limite": limiar}
+                 for limiar in LIMIARES]
+    grupo = GrupoDeLimiares('temperature', operador, [(c['valor_limite'], c) for c in condicoes])
+    estado = {}  # id(condição) -> valor-verdade, só pelas mudanças que o grupo informa
+    for valor in VALORES:
+        for _, c, verdadeira in grupo.atualizar(valor):
+            estado[id(c)] = verdadeira
+        amostra = {} if valor is None else {"temperature": valor}
+        for c in condicoes:
+            esperado = ingestor.avaliar_condicao('r', c, amostra, 0.0)
+            assert estado[id(c)] == esperado, (operador, c['valor_limite'], valor)
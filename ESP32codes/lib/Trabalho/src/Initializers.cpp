@@ -636,8 +636,11 @@ bool reconnectMQTT(MQTTConfig config, int maxAttempts = 5) {
         }
         Serial.println(")");
 
-        if (MQTT.connect(config.id.c_str())) {
+        // LWT: se a conexao cair, o broker publica "offline" (retido) no topico de status
+        String statusTopic = "device/" + config.id + "/status";
+        if (MQTT.connect(config.id.c_str(), statusTopic.c_str(), 1, true, "offline")) {
             Serial.println("> Conectado com sucesso ao broker MQTT!");
+            MQTT.publish(statusTopic.c_str(), "online", true);
             subscribeMQTTTopics();
             return true;
         } 